@@ -0,0 +1,141 @@
+# coding=utf-8
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import PIL.Image
+import arcade
+import pyglet
+
+'''
+    Background asset loading. Every image and sound the game needs before
+    its first frame is listed in an AssetManifest, and AssetLoader decodes
+    them on a pool of worker threads (PIL and file reads release the GIL,
+    so they run side by side on a multi-core machine) while the window keeps
+    drawing a loading screen. Results are handed over on the main thread a
+    batch at a time by poll(): decoded images go into arcade.load_texture's
+    cache, so the arcade.load_texture() calls the game already makes find
+    them there instead of reading the file.
+'''
+
+# Kinds of asset
+IMAGE = "image"
+# Short sounds, decoded into memory whole
+SOUND = "sound"
+# Music, streamed from the file as it plays
+MUSIC = "music"
+
+LOADER_WORKERS = min(8, os.cpu_count() or 1)
+# Finished assets handed over per poll(), so a frame of the loading screen stays short
+UPLOAD_BATCH = 16
+
+
+def decode(kind, file_name):
+    """ Read and decode one file, run on a worker thread. """
+    if kind == IMAGE:
+        image = PIL.Image.open(file_name)
+        image.load()
+        # What the atlas and arcade's sprite lists convert to anyway
+        return image if image.mode == "RGBA" else image.convert("RGBA")
+    return pyglet.media.load(file_name, streaming=(kind == MUSIC))
+
+
+class AssetManifest:
+    """ The files to load, by kind, each listed once """
+
+    def __init__(self):
+        self.entries = []
+        self._seen = set()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def add(self, kind, file_name):
+        if (kind, file_name) not in self._seen:
+            self._seen.add((kind, file_name))
+            self.entries.append((kind, file_name))
+
+    def add_images(self, file_names):
+        for file_name in file_names:
+            self.add(IMAGE, file_name)
+
+
+class AssetLoader:
+    """ Decodes a manifest on worker threads, and installs what is ready on the main thread through poll() """
+
+    def __init__(self, manifest, workers=LOADER_WORKERS):
+        self.manifest = manifest
+        self.workers = workers
+        self._executor = None
+        self._started = False
+        # (kind, file name, future decoding it) in manifest order, the future is None without workers
+        self._pending = deque()
+
+        # File name -> decoded pyglet source, for sounds and music
+        self.sounds = {}
+        # Files that couldn't be loaded
+        self.failed = []
+        self.loaded = 0
+
+    def start(self):
+        self._started = True
+        if self.workers > 1:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        for kind, file_name in self.manifest:
+            # With a single core a worker thread only adds overhead, poll() decodes each batch itself
+            future = self._executor.submit(decode, kind, file_name) if self._executor is not None else None
+            self._pending.append((kind, file_name, future))
+
+    @property
+    def done(self):
+        return self._started and not self._pending
+
+    @property
+    def progress(self):
+        """ Fraction of the manifest installed so far, 0 to 1. """
+        return (self.loaded + len(self.failed)) / len(self.manifest) if len(self.manifest) else 1.0
+
+    def poll(self, batch=UPLOAD_BATCH):
+        """ Install up to batch of the assets that finished decoding, in manifest order. Returns True once all are. """
+        handed_over = 0
+        while self._pending and handed_over < batch:
+            future = self._pending[0][2]
+            if future is not None and not future.done():
+                break
+            kind, file_name, future = self._pending.popleft()
+            handed_over += 1
+            try:
+                result = future.result() if future is not None else decode(kind, file_name)
+            except Exception as e:
+                print(f"Warning, unable to load '{file_name}'.", e)
+                self.failed.append(file_name)
+                continue
+            if kind == IMAGE:
+                arcade.load_texture.texture_cache[file_name] = arcade.Texture(file_name, result)
+            else:
+                self.sounds[file_name] = result
+            self.loaded += 1
+
+        if self.done:
+            self.close()
+        return self.done
+
+    def wait(self):
+        """ Block until everything is installed, for when there is no loading screen to draw. """
+        while not self.poll(len(self.manifest)):
+            # poll() stops at the first asset still decoding
+            future = self._pending[0][2]
+            if future is not None:
+                wait([future])
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def sound(self, file_name):
+        """ The decoded source for a SOUND or MUSIC file, None if it failed to load. """
+        return self.sounds.get(file_name)
@@ -0,0 +1,207 @@
+# coding=utf-8
+import math
+
+import numpy as np
+import PIL.Image
+import arcade
+from arcade import shader
+
+'''
+    Texture atlas. Tile and character images are packed into a few large
+    pages at load time, and AtlasSpriteList draws straight from a page instead
+    of stitching its own strip texture out of every image it holds, so lists
+    that share a page share one GPU texture.
+'''
+
+ATLAS_PAGE_SIZE = 2048
+# Border around each packed image, filled with copies of its edge pixels so
+# linear filtering doesn't bleed a neighbour into the edge of a tile
+ATLAS_PADDING = 2
+
+
+class AtlasRegion:
+    """ Where one texture's image was packed """
+
+    def __init__(self, page, x, y, width, height):
+        self.page = page
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.tex_coords = None
+
+
+class TextureAtlas:
+    """ Packs the images of arcade Textures into ATLAS_PAGE_SIZE pages, shelf by shelf """
+
+    def __init__(self, page_size=ATLAS_PAGE_SIZE, padding=ATLAS_PADDING):
+        self.page_size = page_size
+        self.padding = padding
+        # Texture name -> texture, in the order they were added
+        self.textures = {}
+        # Texture name -> AtlasRegion, filled in by build()
+        self.regions = {}
+        self.pages = []
+        self._page_textures = {}
+
+    def add(self, texture):
+        self.textures[texture.name] = texture
+
+    def add_textures(self, textures):
+        for texture in textures:
+            self.add(texture)
+
+    def build(self):
+        """ Pack every texture added so far. Images bigger than a page are left out and drawn the usual way. """
+        padding = self.padding
+        page_size = self.page_size
+        self.regions = {}
+        self.pages = []
+        self._page_textures = {}
+
+        # Tallest first keeps the shelves tight
+        textures = sorted(self.textures.values(), key=lambda texture: texture.image.height, reverse=True)
+
+        page = None
+        shelf_x = shelf_y = shelf_height = 0
+        for texture in textures:
+            image = texture.image
+            width = image.width + padding * 2
+            height = image.height + padding * 2
+            if width > page_size or height > page_size:
+                print(f"Warning, '{texture.name}' is too big for a {page_size} atlas page.")
+                continue
+
+            if page is not None and shelf_x + width > page_size:
+                shelf_x = 0
+                shelf_y += shelf_height
+                shelf_height = 0
+            if page is None or shelf_y + height > page_size:
+                page = PIL.Image.new("RGBA", (page_size, page_size))
+                self.pages.append(page)
+                shelf_x = shelf_y = shelf_height = 0
+
+            x = shelf_x + padding
+            y = shelf_y + padding
+            self._paste(page, image if image.mode == "RGBA" else image.convert("RGBA"), x, y)
+            self.regions[texture.name] = AtlasRegion(len(self.pages) - 1, x, y, image.width, image.height)
+
+            shelf_x += width
+            shelf_height = max(shelf_height, height)
+
+        # Pages are mostly empty on small levels, so shrink the last one to what it uses
+        if self.pages:
+            used_height = 2 ** math.ceil(math.log2(max(shelf_y + shelf_height, 1)))
+            if used_height < page_size:
+                self.pages[-1] = self.pages[-1].crop((0, 0, page_size, used_height))
+
+        for region in self.regions.values():
+            page = self.pages[region.page]
+            # Same layout as the sub_tex_coords arcade's SpriteList builds
+            region.tex_coords = [region.x / page.width,
+                                 1 - (region.y + region.height) / page.height,
+                                 region.width / page.width,
+                                 region.height / page.height]
+
+    def _paste(self, page, image, x, y):
+        padding = self.padding
+        width, height = image.size
+        # Repeat the outer rows and columns of pixels into the padding
+        for step in range(1, padding + 1):
+            page.paste(image.crop((0, 0, 1, height)), (x - step, y))
+            page.paste(image.crop((width - 1, 0, width, height)), (x + width - 1 + step, y))
+            page.paste(image.crop((0, 0, width, 1)), (x, y - step))
+            page.paste(image.crop((0, height - 1, width, height)), (x, y + height - 1 + step))
+        page.paste(image, (x, y))
+
+    def upload(self):
+        """ Create the GPU textures of every page now, eg. behind a loading screen, rather than on first draw. """
+        for page in range(len(self.pages)):
+            self.page_texture(page)
+
+    def page_texture(self, page):
+        """ GPU texture for a page, created the first time it is drawn and shared from then on. """
+        texture = self._page_textures.get(page)
+        if texture is None:
+            image = self.pages[page]
+            texture = shader.texture((image.width, image.height), 4, np.asarray(image))
+            self._page_textures[page] = texture
+        return texture
+
+
+class AtlasSpriteList(arcade.SpriteList):
+    """
+    A SpriteList that draws from a TextureAtlas page. Falls back to arcade's own
+    per-list texture if it holds a sprite whose texture isn't on the same page.
+    """
+
+    def __init__(self, atlas, use_spatial_hash=False, spatial_hash_cell_size=128, is_static=False):
+        super().__init__(use_spatial_hash, spatial_hash_cell_size, is_static)
+        self.atlas = atlas
+
+    def _calculate_sprite_buffer(self):
+        if len(self.sprite_list) == 0:
+            return
+
+        regions = self.atlas.regions
+        page = None
+        for sprite in self.sprite_list:
+            if sprite._texture is None:
+                raise Exception("Error: Attempt to draw a sprite without a texture set.")
+            region = regions.get(sprite._texture.name)
+            if region is None or (page is not None and region.page != page):
+                super()._calculate_sprite_buffer()
+                return
+            page = region.page
+
+        self._texture = self.atlas.page_texture(page)
+        if self.texture_id is None:
+            self.texture_id = arcade.SpriteList.next_texture_id
+        # Forces arcade's own path to rebuild its strip if a foreign texture shows up later
+        self.array_of_images = None
+
+        buffer_type = np.dtype([('position', '2f4'), ('angle', 'f4'), ('size', '2f4'),
+                                ('sub_tex_coords', '4f4'), ('color', '4B')])
+        self.sprite_data = np.zeros(len(self.sprite_list), dtype=buffer_type)
+        self.sprite_data['position'] = [[sprite.center_x, sprite.center_y] for sprite in self.sprite_list]
+        self.sprite_data['angle'] = [math.radians(sprite.angle) for sprite in self.sprite_list]
+        self.sprite_data['size'] = [[sprite.width / 2, sprite.height / 2] for sprite in self.sprite_list]
+        self.sprite_data['sub_tex_coords'] = [regions[sprite._texture.name].tex_coords
+                                              for sprite in self.sprite_list]
+        self.sprite_data['color'] = [sprite.color + (sprite.alpha, ) for sprite in self.sprite_list]
+
+        usage = 'static' if self.is_static else 'stream'
+        self.sprite_data_buf = shader.buffer(self.sprite_data.tobytes(), usage=usage)
+
+        vertices = np.array([
+            #  x,    y,   u,   v
+            -1.0, -1.0, 0.0, 0.0,
+            -1.0, 1.0, 0.0, 1.0,
+            1.0, -1.0, 1.0, 0.0,
+            1.0, 1.0, 1.0, 1.0,
+        ], dtype=np.float32)
+        self.vbo_buf = shader.buffer(vertices.tobytes())
+        vbo_buf_desc = shader.BufferDescription(self.vbo_buf, '2f 2f', ('in_vert', 'in_texture'))
+        pos_angle_scale_buf_desc = shader.BufferDescription(
+            self.sprite_data_buf,
+            '2f 1f 2f 4f 4B',
+            ('in_pos', 'in_angle', 'in_scale', 'in_sub_tex_coords', 'in_color'),
+            normalized=['in_color'], instanced=True)
+
+        self.vao = shader.vertex_array(self.program, [vbo_buf_desc, pos_angle_scale_buf_desc])
+
+    def update_texture(self, sprite):
+        """ Only the changed sprite's texture coordinates need rewriting when it is on the atlas page. """
+        if self.vao is None:
+            return
+        region = self.atlas.regions.get(sprite._texture.name)
+        if self.is_static:
+            # Static buffers are only uploaded when they are rebuilt
+            self._calculate_sprite_buffer()
+            return
+        if region is None or self._texture is not self.atlas.page_texture(region.page):
+            self._calculate_sprite_buffer()
+            return
+        i = self.sprite_idx[sprite]
+        self.sprite_data[i]['sub_tex_coords'] = region.tex_coords
+        self.sprite_data[i]['size'] = [sprite.width / 2, sprite.height / 2]
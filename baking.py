@@ -0,0 +1,294 @@
+# coding=utf-8
+import math
+from ctypes import byref
+from collections import OrderedDict
+
+import numpy as np
+import arcade
+import pyglet.gl as gl
+from arcade import shader
+from arcade.sprite_list import FRAGMENT_SHADER, VERTEX_SHADER
+
+from atlas import AtlasRegion, AtlasSpriteList
+
+'''
+    Render-to-texture for the static layers. The background, walls and
+    platforms never move, so instead of drawing each of their sprites every
+    frame StaticLayerBaker renders the level's tiles into BAKE_TILE_SIZE
+    square textures through an offscreen framebuffer, and a frame draws just
+    the two to six baked tiles under the viewport, one quad each.
+
+    A baked tile is redrawn from the level the next time it is needed after
+    a hot reload changes a tile of a static layer under it, or after
+    invalidate().
+    Baked pixels are kept with their colour premultiplied by their alpha,
+    so the tiles blend exactly as the sprites did over the background colour.
+'''
+
+# World pixels along each side of a baked tile, and texels in its texture
+BAKE_TILE_SIZE = 1024
+# At 4 bytes a texel a 1024 tile is 4MB of texture memory, the tiles
+# used longest ago are released beyond this many
+MAX_BAKED_TILES = 24
+STATIC_LAYERS = ("Background", "Walls", "Platforms")
+
+
+class BakedTile:
+    """ The framebuffer texture a square of the level was rendered into, and the list that draws it """
+
+    def __init__(self, key, texture, framebuffer, sprite_list):
+        self.key = key
+        self.texture = texture
+        self.framebuffer = framebuffer
+        self.sprite_list = sprite_list
+
+    def release(self):
+        gl.glDeleteFramebuffers(1, byref(self.framebuffer))
+        self.texture = None
+
+
+class BlendedSpriteList(AtlasSpriteList):
+    """ An AtlasSpriteList drawn with its own blend functions for colour and alpha, rather than SpriteList's """
+
+    # glBlendFuncSeparate() arguments: source and destination factors for colour, then for alpha
+    blend = (gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA, gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+
+    def draw(self):
+        if self.program is None:
+            self.program = shader.program(vertex_shader=VERTEX_SHADER, fragment_shader=FRAGMENT_SHADER)
+        if len(self.sprite_list) == 0:
+            return
+        if self.vao is None:
+            self._calculate_sprite_buffer()
+
+        self._texture.use(0)
+        gl.glEnable(gl.GL_BLEND)
+        gl.glBlendFuncSeparate(*self.blend)
+        with self.vao:
+            self.program['Texture'] = self.texture_id
+            self.program['Projection'] = arcade.get_projection().flatten()
+            self.vao.render(gl.GL_TRIANGLE_STRIP, instances=len(self.sprite_list))
+        # What the rest of arcade's drawing expects to find
+        gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+
+
+class BakingSpriteList(BlendedSpriteList):
+    """ Draws tile sprites into an empty framebuffer: colour blends as usual, alpha adds up instead of being scaled by itself, leaving premultiplied pixels """
+
+    blend = (gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA, gl.GL_ONE, gl.GL_ONE_MINUS_SRC_ALPHA)
+
+
+class BakedTileList(BlendedSpriteList):
+    """ The quad of one baked tile, its pixels already premultiplied """
+
+    blend = (gl.GL_ONE, gl.GL_ONE_MINUS_SRC_ALPHA, gl.GL_ONE, gl.GL_ONE_MINUS_SRC_ALPHA)
+
+
+class StaticLayerBaker:
+    """
+    Bakes the static layers of a CompiledLevel into framebuffer tiles and draws
+    the ones covering the viewport. Stands in for drawing their sprite lists,
+    the layers needn't be streamed into one at all.
+    """
+
+    def __init__(self, level, scaling, textures, atlas, layer_names=STATIC_LAYERS,
+                 tile_size=BAKE_TILE_SIZE, max_tiles=MAX_BAKED_TILES):
+        self.level = level
+        self.scaling = scaling
+        self.textures = textures
+        self.atlas = atlas
+        self.layer_names = layer_names
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.columns = math.ceil(level.width * level.tilewidth * scaling / tile_size)
+        self.rows = math.ceil(level.height * level.tileheight * scaling / tile_size)
+
+        # (column, row) -> BakedTile, the most recently drawn last
+        self.baked = OrderedDict()
+        # (column, row) -> indexes of the level's tiles reaching into it, in drawing order
+        self.tile_indexes = {}
+        # Baked tile quad texture name -> AtlasRegion, so a BakedTileList looks its tile up like an atlas page
+        self.regions = {}
+        self._pages = {}
+        self.bakes = 0
+        self._index_tiles()
+
+    def _index_tiles(self):
+        level = self.level
+        tile_size = self.tile_size
+        self.tile_indexes = {}
+        # Half the size of a tile sprite, by texture, to find every baked tile it overlaps
+        half_sizes = {}
+        for layer_name in self.layer_names:
+            for index in level.layer_range(layer_name):
+                texture_id = level.texture_ids[index]
+                if texture_id not in half_sizes:
+                    tile_sprite = level.make_sprite(index, self.scaling, self.textures)
+                    half_sizes[texture_id] = (tile_sprite.width / 2, tile_sprite.height / 2)
+                half_width, half_height = half_sizes[texture_id]
+                center_x = level.center_xs[index] * self.scaling
+                center_y = level.center_ys[index] * self.scaling
+                for column in range(int((center_x - half_width) // tile_size),
+                                    int((center_x + half_width) // tile_size) + 1):
+                    for row in range(int((center_y - half_height) // tile_size),
+                                     int((center_y + half_height) // tile_size) + 1):
+                        self.tile_indexes.setdefault((column, row), []).append(index)
+
+    # --- Invalidation
+
+    def invalidate(self, left=None, bottom=None, right=None, top=None):
+        """ Drop the baked tiles overlapping a rectangle of the level, or all of them, to be baked again when next drawn. """
+        if left is None:
+            keys = list(self.baked)
+        else:
+            keys = [key for key in self.baked if self._overlaps(key, left, bottom, right, top)]
+        for key in keys:
+            self._release(key)
+
+    def reload(self, diff, textures):
+        """
+        Switch to a new compilation of the level, from a LevelDiff, dropping
+        just the baked tiles that a changed tile of a static layer reaches into.
+        """
+        changed = set()
+        for layer_name in self.layer_names:
+            if layer_name in diff.layers:
+                changed.update(diff.layers[layer_name].removed)
+        keys = {key for key, indexes in self.tile_indexes.items() if not changed.isdisjoint(indexes)}
+
+        self.level = diff.new
+        self.textures = textures
+        self._index_tiles()
+        changed = set()
+        for layer_name in self.layer_names:
+            if layer_name in diff.layers:
+                layer_diff = diff.layers[layer_name]
+                changed.update(layer_diff.added)
+                changed.update(new_index for old_index, new_index in layer_diff.retextured)
+        keys.update(key for key, indexes in self.tile_indexes.items() if not changed.isdisjoint(indexes))
+        for key in keys:
+            if key in self.baked:
+                self._release(key)
+
+    def _overlaps(self, key, left, bottom, right, top):
+        tile_size = self.tile_size
+        column, row = key
+        return (column * tile_size < right and left < (column + 1) * tile_size and
+                row * tile_size < top and bottom < (row + 1) * tile_size)
+
+    def _release(self, key):
+        baked_tile = self.baked.pop(key)
+        self.regions.pop(self._region_name(key), None)
+        self._pages.pop(key, None)
+        baked_tile.release()
+
+    def close(self):
+        self.invalidate()
+
+    # --- Baking
+
+    def visible_tiles(self, view_left, view_bottom, view_width, view_height):
+        tile_size = self.tile_size
+        for column in range(max(0, int(view_left // tile_size)),
+                            min(self.columns, int((view_left + view_width - 1) // tile_size) + 1)):
+            for row in range(max(0, int(view_bottom // tile_size)),
+                             min(self.rows, int((view_bottom + view_height - 1) // tile_size) + 1)):
+                yield column, row
+
+    def bake_all(self):
+        """ Bake every tile of the level up front, eg. behind a loading screen, if they all fit under max_tiles. """
+        if self.columns * self.rows > self.max_tiles:
+            return False
+        for column in range(self.columns):
+            for row in range(self.rows):
+                self.tile((column, row))
+        return True
+
+    def tile(self, key):
+        """ The BakedTile for (column, row), baking it first if it isn't. """
+        baked_tile = self.baked.get(key)
+        if baked_tile is not None:
+            self.baked.move_to_end(key)
+            return baked_tile
+
+        while len(self.baked) >= self.max_tiles:
+            self._release(next(iter(self.baked)))
+        baked_tile = self._bake(key)
+        self.baked[key] = baked_tile
+        self.bakes += 1
+        return baked_tile
+
+    def _bake(self, key):
+        tile_size = self.tile_size
+        left = key[0] * tile_size
+        bottom = key[1] * tile_size
+
+        # The level's sprites for this square, built only for as long as it takes to draw them once
+        sprite_list = BakingSpriteList(self.atlas, is_static=True)
+        for index in self.tile_indexes.get(key, ()):
+            sprite_list.append(self.level.make_sprite(index, self.scaling, self.textures))
+
+        texture = shader.texture((tile_size, tile_size), 4, np.zeros((tile_size, tile_size, 4), dtype=np.uint8))
+        # One texel per world pixel, drawn back at whole pixel offsets
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_NEAREST)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_NEAREST)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S, gl.GL_CLAMP_TO_EDGE)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T, gl.GL_CLAMP_TO_EDGE)
+
+        framebuffer = gl.GLuint()
+        gl.glGenFramebuffers(1, byref(framebuffer))
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, framebuffer)
+        gl.glFramebufferTexture2D(gl.GL_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0, gl.GL_TEXTURE_2D,
+                                  texture.texture_id, 0)
+        if gl.glCheckFramebufferStatus(gl.GL_FRAMEBUFFER) != gl.GL_FRAMEBUFFER_COMPLETE:
+            gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, 0)
+            gl.glDeleteFramebuffers(1, byref(framebuffer))
+            raise Exception("Error: Unable to create a framebuffer to bake the static layers into.")
+
+        viewport = arcade.get_viewport()
+        clear_color = (gl.GLfloat * 4)()
+        gl.glGetFloatv(gl.GL_COLOR_CLEAR_VALUE, clear_color)
+        try:
+            # set_viewport() points glViewport at the window, so the tile's own size goes in after it
+            arcade.set_viewport(left, left + tile_size, bottom, bottom + tile_size)
+            gl.glViewport(0, 0, tile_size, tile_size)
+            gl.glClearColor(0, 0, 0, 0)
+            gl.glClear(gl.GL_COLOR_BUFFER_BIT)
+            sprite_list.draw()
+        finally:
+            gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, 0)
+            gl.glClearColor(*clear_color)
+            arcade.set_viewport(*viewport)
+        return BakedTile(key, texture, framebuffer, self._tile_list(key, texture))
+
+    def _region_name(self, key):
+        return f"baked-{id(self)}-{key[0]}-{key[1]}"
+
+    def _tile_list(self, key, texture):
+        tile_size = self.tile_size
+        name = self._region_name(key)
+        # Framebuffer rows start at the bottom, image rows at the top: flip V
+        region = AtlasRegion(key, 0, 0, tile_size, tile_size)
+        region.tex_coords = [0.0, 0.0, 1.0, -1.0]
+        self.regions[name] = region
+        self._pages[key] = texture
+
+        quad = arcade.Sprite(center_x=(key[0] + .5) * tile_size, center_y=(key[1] + .5) * tile_size)
+        quad._texture = arcade.Texture(name)
+        quad.width = tile_size
+        quad.height = tile_size
+        sprite_list = BakedTileList(self, is_static=True)
+        sprite_list.append(quad)
+        return sprite_list
+
+    def page_texture(self, page):
+        """ The AtlasSpriteList side of the atlas interface: a baked tile's texture, by its key. """
+        return self._pages[page]
+
+    # --- Drawing
+
+    def draw(self, view_left, view_bottom, view_width, view_height):
+        """ Draw the baked tiles covering the viewport, baking any that aren't yet. """
+        for key in self.visible_tiles(view_left, view_bottom, view_width, view_height):
+            if key in self.tile_indexes:
+                self.tile(key).sprite_list.draw()
@@ -0,0 +1,529 @@
+# coding=utf-8
+import math
+import multiprocessing
+
+import numpy as np
+import arcade
+
+from collectibles import CollectibleLayer, overlaps
+from lasers import CELL_EMPTY, CELL_ICE, LaserSystem, raycast
+from level_cache import load_level
+from simulation import (CHARACTER_SCALE, COIN_SPIN, GRAVITY, JUMP_SPEED, LASER_SPEED, LEVEL_MAP, MOVEMENT_SPEED,
+                        PLAYER_EDGE_MARGIN, PLAYER_PUSH_BACK, PLAYER_SCALE, PLAYER_STAND_RIGHT_FILES, PLAYER_START,
+                        SCREEN_HEIGHT, SCREEN_WIDTH, SPRITE_SCALING, VIEWPORT_LEFT_MARGIN, VIEWPORT_MARGIN_BOTTOM,
+                        VIEWPORT_MARGIN_TOP, VIEWPORT_RIGHT_MARGIN)
+from tile_physics import FLOOR_PROBE, LANDING_STEP, TileGridPhysics
+
+'''
+    Many games at once, for automated playtests and agent training. BatchEnv
+    steps any number of independent copies of the level in lock-step: the
+    player's physics against the platforms, coin pickups, and laser pulses
+    melting ice. Every copy's state is a row of a few NumPy arrays, and each
+    phase of a step runs for all the copies in one vectorized pass. It plays
+    exactly like Simulation does, step for step, without the sprites, sounds
+    and level streaming a window needs (benchmarks/bench_batch_env.py checks
+    the two against each other).
+
+    ShardedBatchEnv splits the copies across a pool of worker processes, each
+    stepping a BatchEnv of its share, behind the same reset() and step().
+'''
+
+# One row per copy. move and jump are held, like keys: a change of move
+# walks or stops, jump jumps when it goes down and ends the jump when it is
+# let go. A pulse is fired at aim radians every step fire is set.
+ACTION_DTYPE = np.dtype([('move', 'i1'), ('jump', '?'), ('fire', '?'), ('aim', 'f8')])
+# The first columns of an observation, followed by what is in each cell
+# within VIEW_RADIUS of the player (lasers.CELL_*), row by row from the bottom
+OBSERVATION_FIELDS = ("x", "y", "change_x", "change_y", "on_ground", "score", "trees_saved", "lasers")
+VIEW_RADIUS = 3
+# A minute of play, copies are reset when they get there
+MAX_EPISODE_STEPS = 3600
+# Laser slots per copy to start with, grown when a copy has more in flight
+LASER_SLOTS = 8
+
+
+def no_actions(count):
+    return np.zeros(count, dtype=ACTION_DTYPE)
+
+
+class BatchEnv:
+    """ count copies of a level stepped together, each with its own player, coins, ice and laser pulses """
+
+    def __init__(self, count, map_name=LEVEL_MAP, max_steps=MAX_EPISODE_STEPS, view_radius=VIEW_RADIUS):
+        self.count = count
+        self.max_steps = max_steps
+        self.view_radius = view_radius
+
+        # --- What every copy shares
+        level = load_level(map_name, SPRITE_SCALING)
+        textures = level.load_textures(SPRITE_SCALING)
+        self.physics = TileGridPhysics(None, level, SPRITE_SCALING, solid_layers=("Platforms", ))
+        self.tile_size = self.physics.tile_size
+        self.solid = np.frombuffer(self.physics.solid, dtype=np.uint8).reshape(level.height, level.width) != 0
+        # With an empty row and column past the top and right of the map, to look up for cells off it
+        self.padded_solid = np.pad(self.solid, ((0, 1), (0, 1)))
+        # The cells lasers stop at as the level starts, ice melted in a copy is cleared in ice_alive
+        lasers = LaserSystem(level, SPRITE_SCALING, arcade.SpriteList(), capacity=0)
+        self.cells = lasers.cells
+        self.laser_reach = lasers.reach
+        self.coins = CollectibleLayer(level, "Coins", SPRITE_SCALING, textures, None, spin=COIN_SPIN)
+        ice = CollectibleLayer(level, "Ice", SPRITE_SCALING, textures, None)
+        self.ice_count = len(ice.x)
+        # Ice tile in each cell, as a column of ice_alive, -1 where there is none
+        self.ice_item = np.full(self.cells.shape, -1, dtype=np.intp)
+        for index in level.layer_range("Ice"):
+            col, row_from_top = level.grid_location(index)
+            self.ice_item[level.height - row_from_top - 1, col] = ice.item_of[index - ice.first_index]
+        # Both with an empty cell all around, for observations near the edges
+        self.padded_cells = np.pad(self.cells, 1)
+        self.padded_ice_item = np.pad(self.ice_item, 1, constant_values=-1)
+
+        # The player sprite's size once its first step gives it a texture
+        texture = arcade.load_texture(PLAYER_STAND_RIGHT_FILES[0], scale=CHARACTER_SCALE)
+        self.half_width = texture.width * PLAYER_SCALE / 2
+        self.half_height = texture.height * PLAYER_SCALE / 2
+        # Most cells a player's box can reach into, along either axis
+        self.box_span = int(2 * max(self.half_width, self.half_height) // self.tile_size) + 2
+        self.boundary_left = PLAYER_EDGE_MARGIN
+        self.boundary_right = level.width * level.tilewidth * SPRITE_SCALING - PLAYER_EDGE_MARGIN
+        self.map_height = level.height * level.tileheight * SPRITE_SCALING
+
+        # --- Each copy's own, a row each
+        self.x = np.zeros(count)
+        self.y = np.zeros(count)
+        self.change_x = np.zeros(count)
+        self.change_y = np.zeros(count)
+        # The player sprite has no size until the end of its first step
+        self.sized = np.zeros(count, dtype=bool)
+        # The move and jump held during the last step
+        self.move = np.zeros(count, dtype=np.int8)
+        self.jumping = np.zeros(count, dtype=bool)
+        self.steps = np.zeros(count, dtype=np.int64)
+        self.score = np.zeros(count, dtype=np.int64)
+        self.trees_saved = np.zeros(count, dtype=np.int64)
+        self.view_left = np.zeros(count)
+        self.view_bottom = np.zeros(count)
+        self.coin_alive = np.ones((count, len(self.coins.x)), dtype=bool)
+        self.ice_alive = np.ones((count, self.ice_count), dtype=bool)
+        # Laser pulses, a column per slot
+        self.laser_x = np.zeros((count, LASER_SLOTS))
+        self.laser_y = np.zeros((count, LASER_SLOTS))
+        self.laser_change_x = np.zeros((count, LASER_SLOTS))
+        self.laser_change_y = np.zeros((count, LASER_SLOTS))
+        self.laser_age = np.zeros((count, LASER_SLOTS), dtype=np.int32)
+        self.laser_alive = np.zeros((count, LASER_SLOTS), dtype=bool)
+        self.reset()
+
+    def __len__(self):
+        return self.count
+
+    def reset(self, indexes=None):
+        """ Start the given copies (all of them if None) over at the beginning of the level. Returns observe(). """
+        if indexes is None:
+            indexes = slice(None)
+        self.x[indexes], self.y[indexes] = PLAYER_START
+        self.change_x[indexes] = 0
+        self.change_y[indexes] = 0
+        self.sized[indexes] = False
+        self.move[indexes] = 0
+        self.jumping[indexes] = False
+        self.steps[indexes] = 0
+        self.score[indexes] = 0
+        self.trees_saved[indexes] = 0
+        self.view_left[indexes] = 0
+        self.view_bottom[indexes] = 0
+        self.coin_alive[indexes] = True
+        self.ice_alive[indexes] = True
+        self.laser_alive[indexes] = False
+        return self.observe()
+
+    # --- The player's box
+
+    def box(self):
+        """ left, bottom, right, top of every copy's player, rounded to 2 places as arcade rounds a sprite's corners. """
+        half_width = np.where(self.sized, self.half_width, 0.0)
+        half_height = np.where(self.sized, self.half_height, 0.0)
+        x = self.x
+        y = self.y
+        return (np.round(x - half_width, 2), np.round(y - half_height, 2),
+                np.round(x + half_width, 2), np.round(y + half_height, 2))
+
+    def solid_hits(self, left, bottom, right, top):
+        """
+        Whether each box overlaps a solid cell, as TileGridPhysics.hits() finds
+        them, and the lowest and highest row of those it does.
+        """
+        tile_size = self.tile_size
+        height, width = self.solid.shape
+        valid = (right > left) & (top > bottom)
+        first_col = np.maximum(np.floor(left / tile_size), 0).astype(np.int64)
+        last_col = np.minimum(np.ceil(right / tile_size) - 1, width - 1).astype(np.int64)
+        first_row = np.maximum(np.floor(bottom / tile_size), 0).astype(np.int64)
+        last_row = np.minimum(np.ceil(top / tile_size) - 1, height - 1).astype(np.int64)
+
+        # Every cell the boxes could reach, those they don't pointed at the empty row and column past the map
+        span = np.arange(self.box_span)
+        rows = first_row[:, None] + span
+        cols = first_col[:, None] + span
+        rows = np.where(valid[:, None] & (rows <= last_row[:, None]), rows, height)
+        cols = np.where(cols <= last_col[:, None], cols, width)
+        row_hit = self.padded_solid[rows[:, :, None], cols[:, None, :]].any(axis=2)
+        hit = row_hit.any(axis=1)
+        lowest = first_row + np.argmax(row_hit, axis=1)
+        highest = first_row + self.box_span - 1 - np.argmax(row_hit[:, ::-1], axis=1)
+        return hit, lowest, highest
+
+    def on_ground(self, box=None):
+        """ Simulation.jump()'s test, for every copy: is there a floor under the player. """
+        left, bottom, right, top = box or self.box()
+        return self.solid_hits(left, bottom - FLOOR_PROBE, right, top - FLOOR_PROBE)[0]
+
+    def cell_values(self, copies, row, col):
+        """ What a laser finds at row, col of the level for each of the given copies, melted ice and all. """
+        return self._unmelted(copies, self.cells[row, col], self.ice_item[row, col])
+
+    def _unmelted(self, copies, value, item):
+        # Only the few ice cells among them are looked up in ice_alive
+        ice = value == CELL_ICE
+        if ice.any():
+            value[ice] = np.where(self.ice_alive[copies[ice], item[ice]], CELL_ICE, CELL_EMPTY)
+        return value
+
+    # --- Stepping
+
+    def step(self, actions=None):
+        """
+        Apply one row of ACTION_DTYPE to each copy and advance them all one
+        step. Returns the observations, the coins collected plus trees saved
+        during the step, and which copies reached max_steps or fell out of
+        the map, and were reset.
+        """
+        if actions is not None:
+            self.apply_actions(actions)
+        score = self.score.copy()
+        trees_saved = self.trees_saved.copy()
+
+        self.steps += 1
+        self._physics()
+        # The sprite's own update() moves it again, and update_animation() gives it its size
+        self.x += self.change_x
+        self.y += self.change_y
+        self.sized[:] = True
+        fell = self._map_edges()
+        # Where the players end up, lasers don't move them
+        box = self.box()
+        self._collect_coins(box)
+        self._step_lasers()
+        self._scroll(box)
+
+        rewards = (self.score - score + self.trees_saved - trees_saved).astype(np.float32)
+        # Falling out of the map is game over, as in Simulation
+        done = (self.steps >= self.max_steps) | fell
+        if done.any():
+            return self.reset(np.flatnonzero(done)), rewards, done
+        return self.observe(box), rewards, done
+
+    def apply_actions(self, actions):
+        """ What Simulation's walk(), stop_walking(), jump(), stop_jumping() and fire() would do with them. """
+        move = actions['move']
+        changed = move != self.move
+        walk = changed & (move != 0)
+        if walk.any():
+            self.change_x[walk] = move[walk] * MOVEMENT_SPEED
+            left, _, right, _ = self.box()
+            stuck = walk & ((left <= self.boundary_left) | (right >= self.boundary_right))
+            self.change_x[stuck] = 0
+        self.change_x[changed & (move == 0)] = 0
+        self.move[:] = move
+
+        jump = actions['jump']
+        pressed = jump & ~self.jumping
+        if pressed.any():
+            self.change_y[pressed & self.on_ground()] = JUMP_SPEED
+        self.change_y[~jump & self.jumping] = 0
+        self.jumping[:] = jump
+
+        firing = np.flatnonzero(actions['fire'])
+        if len(firing):
+            self._fire(firing, actions['aim'][firing])
+
+    def _fire(self, copies, aims):
+        # A pulse per firing copy, in its lowest free slot
+        if self.laser_alive[copies].all(axis=1).any():
+            self._grow_lasers(self.laser_alive.shape[1] * 2)
+        slots = np.argmin(self.laser_alive[copies], axis=1)
+        self.laser_x[copies, slots] = self.x[copies]
+        self.laser_y[copies, slots] = self.y[copies]
+        # math rather than NumPy, to the last bit what LaserSystem.fire() works out
+        self.laser_change_x[copies, slots] = [math.cos(aim) * LASER_SPEED for aim in aims.tolist()]
+        self.laser_change_y[copies, slots] = [math.sin(aim) * LASER_SPEED for aim in aims.tolist()]
+        self.laser_age[copies, slots] = 0
+        self.laser_alive[copies, slots] = True
+
+    def _grow_lasers(self, slots):
+        for name in ("laser_x", "laser_y", "laser_change_x", "laser_change_y", "laser_age", "laser_alive"):
+            values = getattr(self, name)
+            grown = np.zeros((self.count, slots), dtype=values.dtype)
+            grown[:, :values.shape[1]] = values
+            setattr(self, name, grown)
+
+    def _physics(self):
+        """ TileGridPhysics.update() for every copy. """
+        tile_size = self.tile_size
+
+        # --- Gravity, and moving in y
+        self.change_y -= GRAVITY
+        self.y += self.change_y
+        left, bottom, right, top = self.box()
+        hit, lowest, highest = self.solid_hits(left, bottom, right, top)
+        # Bumped a ceiling, stop at the lowest one
+        ceiling = hit & (self.change_y > 0)
+        self.y[ceiling] -= top[ceiling] - np.minimum(lowest[ceiling] * tile_size, top[ceiling])
+        # Landed, lift out of the floor in LANDING_STEPs
+        overlap = (highest + 1) * tile_size - bottom
+        landed = hit & (self.change_y < 0) & (overlap > 0)
+        self.y[landed] += np.ceil(overlap[landed] / LANDING_STEP) * LANDING_STEP
+        self.change_y[hit] = 0
+        self.y = np.round(self.y, 2)
+
+        # --- Moving in x, walking into a platform is rare enough to sort out a copy at a time
+        self.x += self.change_x
+        hit = self.solid_hits(*self.box())[0]
+        for copy in np.flatnonzero(hit & (self.change_x != 0)).tolist():
+            self._walk_into(copy)
+
+    def _walk_into(self, copy):
+        """ Run one copy's player up a step, or back it out of the platform it walked into. """
+        physics = self.physics
+        tile_size = self.tile_size
+        half_width = self.half_width if self.sized[copy] else 0.0
+        half_height = self.half_height if self.sized[copy] else 0.0
+        x = float(self.x[copy])
+        y = float(self.y[copy])
+        change_x = float(self.change_x[copy])
+
+        def box():
+            return round(x - half_width, 2), round(y - half_height, 2), round(x + half_width, 2), round(y + half_height, 2)
+
+        check_again = True
+        while check_again:
+            check_again = False
+            for col, row in physics.hits(*box()):
+                y += abs(change_x)
+                if physics.hits(*box()):
+                    y -= abs(change_x)
+                    left, _, right, _ = box()
+                    if change_x > 0:
+                        x -= right - min(col * tile_size, right)
+                    else:
+                        x += max(col * tile_size + tile_size, left) - left
+                    check_again = True
+                    break
+        self.x[copy] = x
+        self.y[copy] = y
+
+    def _map_edges(self):
+        """ Keep the players inside the map's sides and under its top. Returns the copies that fell out of its bottom. """
+        left, _, right, top = self.box()
+        at_left = left <= self.boundary_left
+        self.x[at_left] += self.boundary_left + PLAYER_PUSH_BACK - left[at_left]
+        at_right = ~at_left & (right >= self.boundary_right)
+        self.x[at_right] -= right[at_right] - (self.boundary_right - PLAYER_PUSH_BACK)
+        at_top = top > self.map_height
+        self.y[at_top] -= top[at_top] - self.map_height
+        self.change_y[at_top] = 0
+        return ~at_top & (top < 0)
+
+    def _collect_coins(self, box):
+        """ CollectibleLayer.collide() for every copy's player against its own coins. """
+        coins = self.coins
+        if not len(coins.x):
+            return
+        left, bottom, right, top = box
+        reach = coins.reach
+        # The coins within reach along x of each player, one (copy, coin) pair each
+        starts = np.searchsorted(coins.x, left - reach)
+        counts = np.searchsorted(coins.x, right + reach) - starts
+        total = int(counts.sum())
+        if total == 0:
+            return
+        copies = np.repeat(np.arange(self.count), counts)
+        items = np.arange(total) + np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        y = coins.y[items]
+        near = self.coin_alive[copies, items] & (y >= bottom[copies] - reach) & (y <= top[copies] + reach)
+        copies = copies[near]
+        items = items[near]
+        if len(copies) == 0:
+            return
+
+        # Coins turn COIN_SPIN a step, copies on the same step see them at the same angle
+        steps, which = np.unique(self.steps[copies], return_inverse=True)
+        radians = [math.radians(COIN_SPIN * step) for step in steps.tolist()]
+        cos = np.array([math.cos(angle) for angle in radians])[which]
+        sin = np.array([math.sin(angle) for angle in radians])[which]
+        half_width = (right - left) / 2
+        half_height = (top - bottom) / 2
+        hit = overlaps(coins.x[items] - (left + half_width)[copies], coins.y[items] - (bottom + half_height)[copies],
+                       half_width[copies], half_height[copies], coins.half_size[coins.texture[items]], cos, sin)
+        self.coin_alive[copies[hit], items[hit]] = False
+        self.score += np.bincount(copies[hit], minlength=self.count)
+
+    def _step_lasers(self):
+        """ LaserSystem.step() for every copy's pulses, culled by its own view. """
+        copies, slots = np.nonzero(self.laser_alive)
+        if len(copies) == 0:
+            return
+        x = self.laser_x[copies, slots]
+        y = self.laser_y[copies, slots]
+        change_x = self.laser_change_x[copies, slots]
+        change_y = self.laser_change_y[copies, slots]
+        speed = np.hypot(change_x, change_y)
+        speed[speed == 0] = 1
+        nose_x = change_x / speed * self.laser_reach
+        nose_y = change_y / speed * self.laser_reach
+
+        fresh = self.laser_age[copies, slots] == 0
+        start_x = np.where(fresh, x, x + nose_x)
+        start_y = np.where(fresh, y, y + nose_y)
+        new_x = x + change_x
+        new_y = y + change_y
+        height, width = self.cells.shape
+        cell_value, hit_col, hit_row = raycast(
+            lambda segments, row, col: self.cell_values(copies[segments], row, col),
+            width, height, self.tile_size, start_x, start_y, new_x + nose_x, new_y + nose_y)
+
+        self.laser_x[copies, slots] = new_x
+        self.laser_y[copies, slots] = new_y
+        self.laser_age[copies, slots] += 1
+        view_left = self.view_left[copies]
+        view_bottom = self.view_bottom[copies]
+        off_screen = ((new_x < view_left) | (new_x > view_left + SCREEN_WIDTH) |
+                      (new_y < view_bottom) | (new_y > view_bottom + SCREEN_HEIGHT))
+        dead = (cell_value != CELL_EMPTY) | off_screen
+        self.laser_alive[copies[dead], slots[dead]] = False
+
+        ice_hit = cell_value == CELL_ICE
+        if ice_hit.any():
+            # Two pulses hitting the same ice in one step only melt it once
+            melted = np.unique(copies[ice_hit] * self.ice_count + self.ice_item[hit_row[ice_hit], hit_col[ice_hit]])
+            melted_copies = melted // self.ice_count
+            self.ice_alive[melted_copies, melted % self.ice_count] = False
+            self.trees_saved += np.bincount(melted_copies, minlength=self.count)
+
+    def _scroll(self, box):
+        """ Simulation.scroll() for every copy. """
+        left, bottom, right, top = box
+        view_left = self.view_left
+        view_bottom = self.view_bottom
+        changed = np.zeros(self.count, dtype=bool)
+
+        boundary = view_left + VIEWPORT_LEFT_MARGIN
+        scroll = left < boundary
+        view_left[scroll] -= boundary[scroll] - left[scroll]
+        changed |= scroll
+
+        boundary = view_left + SCREEN_WIDTH - VIEWPORT_RIGHT_MARGIN
+        scroll = right > boundary
+        view_left[scroll] += right[scroll] - boundary[scroll]
+        changed |= scroll
+
+        boundary = view_bottom + SCREEN_HEIGHT - VIEWPORT_MARGIN_TOP
+        scroll = top > boundary
+        view_bottom[scroll] += top[scroll] - boundary[scroll]
+        changed |= scroll
+
+        boundary = view_bottom + VIEWPORT_MARGIN_BOTTOM
+        scroll = bottom < boundary
+        view_bottom[scroll] -= boundary[scroll] - bottom[scroll]
+        changed |= scroll
+
+        view_left[changed] = np.trunc(view_left[changed])
+        view_bottom[changed] = np.trunc(view_bottom[changed])
+
+    # --- Observing
+
+    def observe(self, box=None):
+        """ A float32 row per copy: OBSERVATION_FIELDS, then the cells around the player. """
+        fields = np.stack([self.x, self.y, self.change_x, self.change_y, self.on_ground(box), self.score,
+                           self.trees_saved, np.count_nonzero(self.laser_alive, axis=1)], axis=1)
+
+        # Cells off the map are looked up in the empty border around padded_cells
+        radius = self.view_radius
+        offsets = np.arange(-radius, radius + 1) + 1
+        height, width = self.cells.shape
+        row = np.floor(self.y / self.tile_size).astype(np.int64)[:, None, None] + offsets[None, :, None]
+        col = np.floor(self.x / self.tile_size).astype(np.int64)[:, None, None] + offsets[None, None, :]
+        row = np.clip(row, 0, height + 1)
+        col = np.clip(col, 0, width + 1)
+        copies = np.broadcast_to(np.arange(self.count)[:, None, None], (self.count, len(offsets), len(offsets)))
+        cells = self._unmelted(copies, self.padded_cells[row, col], self.padded_ice_item[row, col])
+        return np.concatenate([fields, cells.reshape(self.count, -1)], axis=1).astype(np.float32)
+
+
+def _serve(connection, count, map_name, max_steps):
+    """ A ShardedBatchEnv worker: a BatchEnv of its share of the copies, doing what the pipe asks. """
+    env = BatchEnv(count, map_name, max_steps)
+    while True:
+        command, argument = connection.recv()
+        if command == "step":
+            connection.send(env.step(argument))
+        elif command == "reset":
+            connection.send(env.reset(argument))
+        else:
+            connection.close()
+            return
+
+
+class ShardedBatchEnv:
+    """ A BatchEnv split across worker processes, each stepping its own share of the copies """
+
+    def __init__(self, count, workers, map_name=LEVEL_MAP, max_steps=MAX_EPISODE_STEPS):
+        self.count = count
+        # Copies per worker, as even as they go
+        shares = [len(share) for share in np.array_split(np.arange(count), workers)]
+        self.offsets = np.cumsum([0] + shares)
+        self.connections = []
+        self.processes = []
+        for share in shares:
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_serve, args=(worker_connection, share, map_name, max_steps),
+                                              daemon=True)
+            process.start()
+            worker_connection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def __len__(self):
+        return self.count
+
+    def _gather(self):
+        results = [connection.recv() for connection in self.connections]
+        if isinstance(results[0], tuple):
+            return tuple(np.concatenate(parts) for parts in zip(*results))
+        return np.concatenate(results)
+
+    def reset(self, indexes=None):
+        """ BatchEnv.reset(), indexes counting across every worker's copies. """
+        for worker, connection in enumerate(self.connections):
+            if indexes is None:
+                local = None
+            else:
+                indexes = np.asarray(indexes)
+                start, stop = self.offsets[worker], self.offsets[worker + 1]
+                local = indexes[(indexes >= start) & (indexes < stop)] - start
+            connection.send(("reset", local))
+        return self._gather()
+
+    def step(self, actions=None):
+        """ BatchEnv.step(), each worker getting its own rows of actions; they all step at once. """
+        for worker, connection in enumerate(self.connections):
+            share = None if actions is None else actions[self.offsets[worker]:self.offsets[worker + 1]]
+            connection.send(("step", share))
+        return self._gather()
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(("close", None))
+            connection.close()
+        for process in self.processes:
+            process.join()
@@ -0,0 +1,149 @@
+# coding=utf-8
+from simulation import COIN_SPIN
+
+'''
+    Sleep/wake scheduling for entities that only need updating while the
+    player can see them, how coin and ice sprites were stepped before
+    CollectibleLayer. Kept as the baseline bench_activity and
+    bench_collectibles measure against. Entities are bucketed into a grid of cells; the
+    ones in cells within a margin of the viewport are awake and updated
+    every step, the rest are asleep and cost nothing. When a cell wakes, its
+    entities are caught up in closed form for the steps they slept through
+    (a coin's angle is just change_angle times the steps it missed), so
+    stepping stays proportional to what is on screen rather than to the
+    size of the map.
+'''
+
+# Width/height in pixels of one scheduling cell
+CELL_SIZE = 256
+# Cells within this many pixels of the viewport are kept awake
+WAKE_MARGIN = 64
+
+
+def start_coin_spin(coin):
+    """ Spin a coin sprite, the way a CollectibleLayer turns its coins. """
+    coin.angle = 0
+    coin.change_angle = COIN_SPIN
+
+
+def update_sprite(sprite):
+    sprite.update()
+
+
+def advance_sprite(sprite, steps):
+    """ Put sprite where steps calls of arcade.Sprite.update() would have. """
+    if sprite.change_x or sprite.change_y:
+        sprite.position = [sprite.center_x + sprite.change_x * steps, sprite.center_y + sprite.change_y * steps]
+    if sprite.change_angle:
+        sprite.angle += sprite.change_angle * steps
+
+
+class ActivityScheduler:
+    """ Steps the entities near the viewport and lets the rest sleep until it comes back to them """
+
+    def __init__(self, view_width, view_height, margin=WAKE_MARGIN, cell_size=CELL_SIZE,
+                 update=update_sprite, catch_up=advance_sprite):
+        """
+        update -- called with an awake entity once per step
+        catch_up -- called with an entity and the number of steps it slept
+                    through as it wakes, must leave it as if update had been
+                    called that many times
+        Entities are bucketed by where they are when added, so this is meant
+        for things that stay put (coins spinning, tiles animating), not for
+        ones that travel across the map.
+        """
+        self.view_width = view_width
+        self.view_height = view_height
+        self.margin = margin
+        self.cell_size = cell_size
+        self.update_entity = update
+        self.catch_up = catch_up
+
+        # (cell_x, cell_y) -> entities bucketed there
+        self.cells = {}
+        # entity -> its cell
+        self.entity_cells = {}
+        # Entities stepped every step, in the order they woke
+        self.awake = {}
+        # Sleeping entity -> the step it went to sleep at
+        self.asleep = {}
+        self.awake_cells = set()
+        self.steps = 0
+
+    def __len__(self):
+        return len(self.entity_cells)
+
+    def cell_of(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def add(self, entity):
+        """ Start scheduling an entity, awake if its cell is. """
+        if entity in self.entity_cells:
+            return
+        cell = self.cell_of(entity.center_x, entity.center_y)
+        self.entity_cells[entity] = cell
+        entities = self.cells.get(cell)
+        if entities is None:
+            entities = self.cells[cell] = {}
+        entities[entity] = None
+        if cell in self.awake_cells:
+            self.awake[entity] = None
+        else:
+            self.asleep[entity] = self.steps
+
+    def remove(self, entity):
+        """ Stop scheduling an entity, eg. once it is collected or unloaded. """
+        cell = self.entity_cells.pop(entity, None)
+        if cell is None:
+            return
+        entities = self.cells[cell]
+        del entities[entity]
+        if not entities:
+            del self.cells[cell]
+        self.awake.pop(entity, None)
+        self.asleep.pop(entity, None)
+
+    def clear(self):
+        """ Forget every entity and start counting steps from 0 again, eg. for a restart. """
+        self.cells.clear()
+        self.entity_cells.clear()
+        self.awake.clear()
+        self.asleep.clear()
+        self.awake_cells = set()
+        self.steps = 0
+
+    def update(self, view_left, view_bottom):
+        """ Wake the cells that came within the margin of the viewport, put the ones that left it to sleep. """
+        min_x, min_y = self.cell_of(view_left - self.margin, view_bottom - self.margin)
+        max_x, max_y = self.cell_of(view_left + self.view_width + self.margin,
+                                    view_bottom + self.view_height + self.margin)
+        in_range = {(cell_x, cell_y)
+                    for cell_x in range(min_x, max_x + 1)
+                    for cell_y in range(min_y, max_y + 1)}
+
+        for cell in self.awake_cells - in_range:
+            for entity in self.cells.get(cell, ()):
+                del self.awake[entity]
+                self.asleep[entity] = self.steps
+        for cell in in_range - self.awake_cells:
+            for entity in self.cells.get(cell, ()):
+                slept = self.steps - self.asleep.pop(entity)
+                if slept:
+                    self.catch_up(entity, slept)
+                self.awake[entity] = None
+        self.awake_cells = in_range
+
+    def step(self):
+        """ Update every awake entity once. """
+        self.steps += 1
+        update_entity = self.update_entity
+        for entity in self.awake:
+            update_entity(entity)
+
+    def catch_up_all(self):
+        """ Bring every sleeping entity up to date without waking it, eg. before saving or comparing state. """
+        for entity, slept_at in self.asleep.items():
+            slept = self.steps - slept_at
+            if slept:
+                self.catch_up(entity, slept)
+            self.asleep[entity] = self.steps
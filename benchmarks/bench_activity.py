@@ -0,0 +1,86 @@
+# coding=utf-8
+import os
+import time
+
+import arcade
+
+from benchmarks.activity import ActivityScheduler, start_coin_spin
+from benchmarks.bench_streaming import camera_path, repeat_level
+from level_cache import load_level
+from simulation import SCREEN_HEIGHT, SCREEN_WIDTH, SPRITE_SCALING
+
+'''
+    Spinning every coin on the map each step with coin_list.update() vs.
+    ActivityScheduler stepping only the ones near the viewport and catching
+    the rest up when the camera reaches them, as the level grows to 100x and
+    1000x the coins of NLA-testLvL5.tmx. The camera pans across the map the
+    whole time, and both must leave every coin at the same angle.
+
+    Run from the repository root:  python -m benchmarks.bench_activity
+'''
+
+SCALES = [(1, 1), (10, 10), (50, 20)]
+STEPS = 600
+
+
+def make_coins(level, textures):
+    coins = []
+    for index in level.layer_range("Coins"):
+        coin = level.make_sprite(index, SPRITE_SCALING, textures)
+        start_coin_spin(coin)
+        coins.append(coin)
+    return coins
+
+
+def looped_camera_path(level):
+    while True:
+        yield from camera_path(level)
+
+
+def run_all(coins, level):
+    """ The old update(): every coin, every step. Returns ms per step. """
+    coin_list = arcade.SpriteList(use_spatial_hash=False)
+    for coin in coins:
+        coin_list.append(coin)
+    views = looped_camera_path(level)
+    start = time.perf_counter()
+    for step in range(STEPS):
+        next(views)
+        coin_list.update()
+    return (time.perf_counter() - start) / STEPS * 1000
+
+
+def run_scheduled(coins, level):
+    """ Only the coins near the view, including the cost of waking and sleeping cells as it pans. """
+    scheduler = ActivityScheduler(SCREEN_WIDTH, SCREEN_HEIGHT)
+    for coin in coins:
+        scheduler.add(coin)
+    views = looped_camera_path(level)
+    start = time.perf_counter()
+    for step in range(STEPS):
+        scheduler.update(*next(views))
+        scheduler.step()
+    elapsed = time.perf_counter() - start
+    scheduler.catch_up_all()
+    return elapsed / STEPS * 1000, len(scheduler.awake)
+
+
+def main():
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    level = load_level("NLA-testLvL5.tmx", SPRITE_SCALING)
+
+    print(f"{'level':>9} {'coins':>7} {'awake':>6} {'all ms':>8} {'scheduled ms':>13} {'speedup':>8} {'same angles':>12}")
+    for copies_x, copies_y in SCALES:
+        big = repeat_level(level, copies_x, copies_y)
+        textures = big.load_textures(SPRITE_SCALING)
+        every_step = make_coins(big, textures)
+        scheduled = make_coins(big, textures)
+        all_ms = run_all(every_step, big)
+        scheduled_ms, awake = run_scheduled(scheduled, big)
+        same = [coin.angle for coin in every_step] == [coin.angle for coin in scheduled]
+        print(f"{big.width:>4}x{big.height:<4} {len(every_step):>7} {awake:>6} {all_ms:>8.3f} {scheduled_ms:>13.4f} "
+              f"{all_ms / scheduled_ms:>7.1f}x {str(same):>12}")
+
+
+if __name__ == "__main__":
+    main()
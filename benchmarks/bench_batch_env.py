@@ -0,0 +1,173 @@
+# coding=utf-8
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+from batch_env import BatchEnv, ShardedBatchEnv, no_actions
+from simulation import Simulation
+
+'''
+    Throughput of the batch environment: aggregate steps a second (copies x
+    steps) of BatchEnv as the number of copies grows, against stepping that
+    many Simulations one after the other, and of ShardedBatchEnv as the
+    workers it splits them across grow. Every copy plays random actions:
+    walking, jumping and firing now and then.
+
+    First checks that BatchEnv plays exactly like Simulation: CHECK_COPIES
+    copies and as many Simulations get the same actions, through the episode
+    reset, and every copy's player, view, score, coins, ice and laser count
+    must match its Simulation's after every step. Exits non-zero otherwise.
+
+    Run from the repository root:  python -m benchmarks.bench_batch_env [copies ...]
+'''
+
+CHECK_COPIES = 16
+CHECK_STEPS = 1500
+CHECK_EPISODE = 600
+COPIES = (1, 16, 256, 1024, 4096)
+SHARDED_COPIES = 4096
+WORKERS = (1, 2, 4, 8)
+STEPS = 300
+SIMULATION_COPIES = 16
+# How far from the player the Simulations are told to fire at
+AIM_DISTANCE = 100
+
+
+def random_actions(rng, actions):
+    """ The next step's actions after these: each copy changes what it is doing now and then. """
+    actions = actions.copy()
+    count = len(actions)
+    turning = rng.random(count) < .05
+    actions['move'][turning] = rng.choice([-1, 0, 1, 1], size=int(turning.sum()))
+    toggling = rng.random(count) < .1
+    actions['jump'][toggling] = ~actions['jump'][toggling]
+    actions['fire'] = rng.random(count) < .05
+    actions['aim'] = rng.uniform(-math.pi, math.pi, count)
+    return actions
+
+
+def drive(simulation, previous, action):
+    """ Tell a Simulation what BatchEnv does with a row of actions. Returns the aim BatchEnv should use. """
+    move = int(action['move'])
+    if move != previous['move']:
+        if move:
+            simulation.walk(move)
+        else:
+            simulation.stop_walking()
+    if action['jump'] and not previous['jump']:
+        simulation.jump()
+    elif not action['jump'] and previous['jump']:
+        simulation.stop_jumping()
+    aim = float(action['aim'])
+    if action['fire']:
+        player = simulation.player
+        dest_x = player.center_x + math.cos(aim) * AIM_DISTANCE
+        dest_y = player.center_y + math.sin(aim) * AIM_DISTANCE
+        simulation.fire(dest_x, dest_y)
+        # The angle Simulation.fire() works out from that
+        aim = math.atan2(dest_y - player.center_y, dest_x - player.center_x)
+    return aim
+
+
+def differences(env, copy, simulation):
+    player = simulation.player
+    expected = {"x": player.center_x, "y": player.center_y, "change_x": player.change_x,
+                "change_y": player.change_y, "score": simulation.score, "trees_saved": simulation.trees_saved,
+                "view_left": simulation.view_left, "view_bottom": simulation.view_bottom}
+    found = [name for name, value in expected.items() if getattr(env, name)[copy] != value]
+    if not np.array_equal(env.coin_alive[copy], simulation.coins.alive):
+        found.append("coins")
+    if not np.array_equal(env.ice_alive[copy], simulation.ice.alive):
+        found.append("ice")
+    if np.count_nonzero(env.laser_alive[copy]) != len(simulation.laser_list):
+        found.append("lasers")
+    return found
+
+
+def check():
+    """ Step BatchEnv and Simulations side by side. Returns the first mismatches found. """
+    env = BatchEnv(CHECK_COPIES, max_steps=CHECK_EPISODE)
+    simulations = []
+    for _ in range(CHECK_COPIES):
+        simulation = Simulation()
+        simulation.setup()
+        simulations.append(simulation)
+
+    rng = np.random.default_rng(1)
+    previous = no_actions(CHECK_COPIES)
+    for step in range(CHECK_STEPS):
+        actions = random_actions(rng, previous)
+        for copy, simulation in enumerate(simulations):
+            actions['aim'][copy] = drive(simulation, previous[copy], actions[copy])
+            simulation.step()
+            simulation.events.clear()
+        previous = actions
+        _, _, done = env.step(actions)
+        for copy in np.flatnonzero(done).tolist():
+            simulations[copy].restart()
+            previous[copy] = no_actions(1)[0]
+        for copy, simulation in enumerate(simulations):
+            found = differences(env, copy, simulation)
+            if found:
+                return f"copy {copy} after step {step + 1}: {', '.join(found)}"
+    return None
+
+
+def steps_per_second(env, steps=STEPS):
+    rng = np.random.default_rng(2)
+    actions = no_actions(len(env))
+    start = time.perf_counter()
+    for _ in range(steps):
+        actions = random_actions(rng, actions)
+        env.step(actions)
+    return len(env) * steps / (time.perf_counter() - start)
+
+
+def simulation_steps_per_second(count, steps=STEPS):
+    """ count Simulations stepped in turn, what bulk runs had to do before. """
+    simulations = []
+    for _ in range(count):
+        simulation = Simulation()
+        simulation.setup()
+        simulations.append(simulation)
+    rng = np.random.default_rng(2)
+    actions = no_actions(count)
+    start = time.perf_counter()
+    for _ in range(steps):
+        previous, actions = actions, random_actions(rng, actions)
+        for copy, simulation in enumerate(simulations):
+            drive(simulation, previous[copy], actions[copy])
+            simulation.step()
+            simulation.events.clear()
+    return count * steps / (time.perf_counter() - start)
+
+
+def main():
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    mismatch = check()
+    if mismatch:
+        print(f"MISMATCH BatchEnv and Simulation differ, {mismatch}")
+        sys.exit(1)
+    print(f"BatchEnv matches Simulation: {CHECK_COPIES} copies, {CHECK_STEPS} steps, "
+          f"episodes of {CHECK_EPISODE}")
+
+    print(f"\n{'copies':>7} {'steps/s':>12}")
+    print(f"{f'{SIMULATION_COPIES} Simulations':>20} {simulation_steps_per_second(SIMULATION_COPIES):>12,.0f}")
+    for count in [int(arg) for arg in sys.argv[1:]] or COPIES:
+        print(f"{count:>20} {steps_per_second(BatchEnv(count)):>12,.0f}")
+
+    print(f"\n{SHARDED_COPIES} copies sharded, {os.cpu_count()} cores")
+    print(f"{'workers':>7} {'steps/s':>12}")
+    for workers in WORKERS:
+        env = ShardedBatchEnv(SHARDED_COPIES, workers)
+        try:
+            print(f"{workers:>7} {steps_per_second(env):>12,.0f}")
+        finally:
+            env.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# coding=utf-8
+import os
+import time
+import tracemalloc
+
+import arcade
+
+from atlas import TextureAtlas
+from benchmarks.activity import ActivityScheduler, start_coin_spin
+from benchmarks.bench_streaming import camera_path
+from benchmarks.spatial_hash import SpatialHash
+from collectibles import CollectibleLayer
+from level_cache import CompiledLevel
+from simulation import COIN_SPIN, SCREEN_HEIGHT, SCREEN_WIDTH, SPRITE_SCALING
+
+'''
+    50,000 coins on a synthetic level, one in every cell of a 500x100 map, as
+    sprites (a Sprite each in a sprite list, a rotating SpatialHash for
+    pickups and the ActivityScheduler spinning the ones near the view) vs. a
+    CollectibleLayer. A player box rides along the middle of the view as it
+    pans across the map, collecting whatever it touches.
+
+    Reports the memory Python holds for the coins once built, the time to
+    build them, and ms per step spinning them and testing for pickups. For
+    the layer, also the ms to build the instance data of the coins on screen,
+    the CPU side of drawing them. Both ways must collect the same coins.
+
+    Run from the repository root:  python -m benchmarks.bench_collectibles
+'''
+
+COIN_IMAGE = "images/v2coin.png"
+COIN_TILE_ID = 39
+MAP_WIDTH = 500
+MAP_HEIGHT = 100
+STEPS = 600
+
+
+def coin_level():
+    level = CompiledLevel(MAP_WIDTH, MAP_HEIGHT, 128, 128, None, [COIN_IMAGE], ["Coins"])
+    for column in range(MAP_WIDTH):
+        for row in range(MAP_HEIGHT):
+            level.tile_ids.append(COIN_TILE_ID)
+            level.texture_ids.append(0)
+            level.layer_ids.append(0)
+            level.center_xs.append(column * 128 + 64)
+            level.center_ys.append(row * 128 + 64)
+    return level
+
+
+def player_box():
+    player = arcade.Sprite(COIN_IMAGE, scale=SPRITE_SCALING)
+    player.width = 40
+    player.height = 80
+    return player
+
+
+class CoinSprites:
+    """ How Simulation kept coins before CollectibleLayer """
+
+    def __init__(self, level, textures, atlas):
+        self.coin_list = arcade.SpriteList()
+        self.coin_hash = SpatialHash(SPRITE_SCALING * level.tilewidth, rotating=True)
+        self.activity = ActivityScheduler(SCREEN_WIDTH, SCREEN_HEIGHT)
+        for index in level.layer_range("Coins"):
+            coin = level.make_sprite(index, SPRITE_SCALING, textures)
+            start_coin_spin(coin)
+            self.coin_list.append(coin)
+            self.coin_hash.insert(coin)
+            self.activity.add(coin)
+
+    def step(self, view, player):
+        self.activity.update(*view)
+        self.activity.step()
+        collected = []
+        for coin in self.coin_hash.check_for_collision(player):
+            self.coin_hash.remove(coin)
+            self.activity.remove(coin)
+            coin.kill()
+            collected.append((coin.center_x, coin.center_y))
+        return collected
+
+
+class CoinLayer:
+    def __init__(self, level, textures, atlas):
+        self.coins = CollectibleLayer(level, "Coins", SPRITE_SCALING, textures, atlas, spin=COIN_SPIN)
+
+    def step(self, view, player):
+        coins = self.coins
+        coins.step()
+        hit = coins.collide(player)
+        coins.kill(hit)
+        return list(zip(coins.x[hit].tolist(), coins.y[hit].tolist()))
+
+
+def build(kind, level, textures, atlas):
+    """ The coins, the ms building them took, and the kB Python holds for them. """
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        coins = kind(level, textures, atlas)
+        elapsed = (time.perf_counter() - start) * 1000
+        return coins, elapsed, tracemalloc.get_traced_memory()[0] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def run(coins, level):
+    """ ms per step, and every coin collected. """
+    player = player_box()
+    collected = []
+    views = camera_path(level)
+    start = time.perf_counter()
+    for step in range(STEPS):
+        view = next(views)
+        player.center_x = view[0] + SCREEN_WIDTH / 2
+        player.center_y = view[1] + SCREEN_HEIGHT / 2
+        collected.extend(coins.step(view, player))
+    return (time.perf_counter() - start) / STEPS * 1000, sorted(collected)
+
+
+def draw_prep_ms(coins, level):
+    views = list(camera_path(level))[:STEPS]
+    start = time.perf_counter()
+    for view_left, view_bottom in views:
+        items = coins.near(view_left, view_bottom, view_left + SCREEN_WIDTH, view_bottom + SCREEN_HEIGHT)
+        coins.instance_data(items)
+    return (time.perf_counter() - start) / len(views) * 1000, len(items)
+
+
+def main():
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    level = coin_level()
+    textures = level.load_textures(SPRITE_SCALING)
+    atlas = TextureAtlas()
+    atlas.add_textures(textures)
+    atlas.build()
+
+    print(f"{len(level)} coins, {STEPS} steps")
+    print(f"{'':>8} {'held kB':>9} {'build ms':>9} {'step ms':>8} {'collected':>10}")
+    results = {}
+    for name, kind in (("sprites", CoinSprites), ("layer", CoinLayer)):
+        coins, build_ms, held_kb = build(kind, level, textures, atlas)
+        step_ms, collected = run(coins, level)
+        results[name] = collected
+        print(f"{name:>8} {held_kb:>9.0f} {build_ms:>9.1f} {step_ms:>8.4f} {len(collected):>10}")
+
+    prep_ms, on_screen = draw_prep_ms(CoinLayer(level, textures, atlas).coins, level)
+    print(f"layer instance data for the {on_screen} coins on screen: {prep_ms:.4f} ms per frame")
+    print(f"same coins collected: {results['sprites'] == results['layer']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# coding=utf-8
+import os
+import random
+import sys
+import time
+
+import arcade
+
+from benchmarks.bench_streaming import repeat_level
+from collectibles import CollectibleLayer
+from level_cache import load_level
+from simulation import SPRITE_SCALING
+from tile_physics import TileGridPhysics
+
+'''
+    Cost of one collision query, the ones the game makes for the player each
+    step, as the level grows to 10x and 100x the tiles of NLA-testLvL5.tmx:
+    the player's box against the platforms (TileGridPhysics.sprite_hits())
+    and against the coins (CollectibleLayer.collide()), each vs. the
+    arcade.check_for_collision_with_list() scan of the same tiles as sprites
+    the game made before. Every query must find as many platforms and the
+    same coins both ways.
+
+    Run from the repository root:  python -m benchmarks.bench_collisions
+'''
+
+SCALES = [(1, 1), (5, 2), (10, 10)]
+QUERIES = 200
+
+
+def player_boxes(level, rng):
+    """ QUERIES player sized boxes anywhere on the level. """
+    map_width = level.width * level.tilewidth * SPRITE_SCALING
+    map_height = level.height * level.tileheight * SPRITE_SCALING
+    boxes = []
+    for _ in range(QUERIES):
+        player = arcade.Sprite("images/rock_stand_right.png", scale=.5)
+        player.center_x = rng.uniform(0, map_width)
+        player.center_y = rng.uniform(0, map_height)
+        boxes.append(player)
+    return boxes
+
+
+def time_queries(boxes, query):
+    """ ms per query, and what each query found. """
+    start = time.perf_counter()
+    found = [query(box) for box in boxes]
+    return (time.perf_counter() - start) / len(boxes) * 1000, found
+
+
+def main():
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    rng = random.Random(5)
+    level = load_level("NLA-testLvL5.tmx", SPRITE_SCALING)
+
+    mismatches = 0
+    print(f"{'level':>9} {'query':>10} {'tiles':>7} {'list ms':>9} {'game ms':>9} {'speedup':>8} {'same hits':>10}")
+    for copies_x, copies_y in SCALES:
+        big = repeat_level(level, copies_x, copies_y)
+        textures = big.load_textures(SPRITE_SCALING)
+        boxes = player_boxes(big, rng)
+
+        platform_list = arcade.SpriteList(is_static=True)
+        big.read_sprite_list("Platforms", platform_list, SPRITE_SCALING, textures)
+        physics = TileGridPhysics(boxes[0], big, SPRITE_SCALING)
+        list_ms, list_hits = time_queries(boxes, lambda box: arcade.check_for_collision_with_list(box, platform_list))
+        grid_ms, grid_hits = time_queries(boxes, physics.sprite_hits)
+        same = [len(hits) for hits in list_hits] == [len(hits) for hits in grid_hits]
+        mismatches += not same
+        print(f"{big.width:>4}x{big.height:<4} {'platforms':>10} {len(platform_list):>7} {list_ms:>9.3f} "
+              f"{grid_ms:>9.4f} {list_ms / grid_ms:>7.0f}x {str(same):>10}")
+
+        coin_list = arcade.SpriteList(is_static=True)
+        big.read_sprite_list("Coins", coin_list, SPRITE_SCALING, textures)
+        coins = CollectibleLayer(big, "Coins", SPRITE_SCALING, textures, None)
+        list_ms, list_hits = time_queries(boxes, lambda box: arcade.check_for_collision_with_list(box, coin_list))
+        layer_ms, layer_hits = time_queries(boxes, coins.collide)
+        same = ([sorted((coin.center_x, coin.center_y) for coin in hits) for hits in list_hits] ==
+                [sorted(zip(coins.x[hits].tolist(), coins.y[hits].tolist())) for hits in layer_hits])
+        mismatches += not same
+        print(f"{big.width:>4}x{big.height:<4} {'coins':>10} {len(coin_list):>7} {list_ms:>9.3f} "
+              f"{layer_ms:>9.4f} {list_ms / layer_ms:>7.0f}x {str(same):>10}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
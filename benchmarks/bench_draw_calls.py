@@ -0,0 +1,74 @@
+# coding=utf-8
+import os
+
+import arcade
+
+from atlas import TextureAtlas
+from level_cache import load_level
+from level_streamer import LevelStreamer
+from simulation import SCREEN_WIDTH, SCREEN_HEIGHT, SPRITE_SCALING
+
+'''
+    Draw calls and texture uploads for the sprites of one on_draw on the
+    shipped level, with a sprite list and its own stitched texture per layer
+    (the old setup()) vs. the texture atlas with background, walls and
+    platforms batched together.
+
+    Counted from the sprite lists setup() builds, drawing needs a window.
+
+    Run from the repository root:  python -m benchmarks.bench_draw_calls
+'''
+
+PLAYER_FRAMES = (["images/rock_stand_right.png", "images/rock_stand_left.png"] +
+                 [f"images/rock_walk_right_00{frame}.png" for frame in range(1, 10)] +
+                 [f"images/rock_walk_left_00{frame}.png" for frame in range(1, 10)])
+
+
+def main():
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    level = load_level("NLA-testLvL5.tmx", SPRITE_SCALING)
+    tile_textures = level.load_textures(SPRITE_SCALING)
+    player_textures = [arcade.load_texture(file_name, scale=.5) for file_name in PLAYER_FRAMES]
+
+    layers = {layer_name: arcade.SpriteList() for layer_name in level.layer_names}
+    streamer = LevelStreamer(level, SPRITE_SCALING, tile_textures, SCREEN_WIDTH, SCREEN_HEIGHT)
+    for layer_name, sprite_list in layers.items():
+        streamer.add_layer(layer_name, sprite_list)
+    streamer.update(0, 0)
+
+    # Distinct images each list has to stitch into its own texture
+    images = {layer_name: {sprite.texture.name: sprite.texture for sprite in sprite_list}
+              for layer_name, sprite_list in layers.items()}
+    images["Player"] = {texture.name: texture for texture in player_textures}
+
+    atlas = TextureAtlas()
+    atlas.add_textures(tile_textures)
+    atlas.add_textures(player_textures)
+    atlas.build()
+
+    print(f"{'list':>12} {'sprites':>8} {'images':>7}")
+    for layer_name, names in images.items():
+        sprites = len(layers[layer_name]) if layer_name in layers else 1
+        print(f"{layer_name:>12} {sprites:>8} {len(names):>7}")
+
+    drawn = [name for name in images if name in ("Player", ) or len(layers[name])]
+    batched = [name for name in drawn if name not in ("Background", "Walls", "Platforms")] + ["static"]
+    # Without the atlas every list uploads a strip of its images, and the
+    # player list re-stitches and re-uploads its strip for each new frame shown
+    strips = len(drawn) - 1 + len(images["Player"])
+    pixels = sum(texture.image.width * texture.image.height
+                 for texture in {texture.name: texture for textures in images.values()
+                                 for texture in textures.values()}.values())
+
+    print()
+    print(f"{'':>12} {'draw calls':>11} {'textures':>9} {'uploads':>8}")
+    print(f"{'per layer':>12} {len(drawn):>11} {len(drawn):>9} {strips:>8}")
+    print(f"{'atlas':>12} {len(batched):>11} {len(atlas.pages):>9} {len(atlas.pages):>8}")
+    print()
+    page_pixels = sum(page.width * page.height for page in atlas.pages)
+    print(f"atlas: {len(atlas.regions)} images on {len(atlas.pages)} page(s) "
+          f"{[page.size for page in atlas.pages]}, {pixels / page_pixels:.0%} used")
+
+
+if __name__ == "__main__":
+    main()
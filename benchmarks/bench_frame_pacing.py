@@ -0,0 +1,157 @@
+# coding=utf-8
+import sys
+
+import arcade
+
+from frame_pacing import MAX_FRAME_SKIP, QUALITY_LEVELS, UPDATE_RATE, FramePacer, QualityGovernor
+from input_trace import KEY_PRESS, apply_input
+from simulation import SIMULATION_STEP, Simulation
+
+'''
+    Frame pacing through a run of loads, on a virtual clock: updates come
+    the way pyglet's schedule_interval() calls MyGame.update(), an update
+    interval after the last one started or straight away once that has
+    passed, and each runs the fixed steps FramePacer gives it of a real
+    Simulation walking right. Steps and draws don't take their real time,
+    each load says what they cost, so runs come out the same on any machine.
+    What the quality governor turns down isn't taken off the costs.
+
+    Played with frame skipping (MAX_FRAME_SKIP) and without. Reports, for
+    each load, frames a second drawn, updates left undrawn, steps of game
+    time lost to the catch-up cap, game time over wall time, the longest
+    wait between two updates (how stale input can get), and the governor's
+    quality level over it. Exits non-zero unless, with frame skipping, game
+    time is only lost to the stall, updates wait less under the slow steps
+    than without, the governor turns quality down during the slow draws and back up once
+    frames fit again, and the simulation ends in the same state whichever
+    animation_interval the governor picked.
+
+    Run from the repository root:  python -m benchmarks.bench_frame_pacing
+'''
+
+
+class Load:
+    """ seconds of wall time with steps and draws taking step_ms and draw_ms, after a stall_ms hitch """
+
+    def __init__(self, name, seconds, step_ms, draw_ms, stall_ms=0.0):
+        self.name = name
+        self.seconds = seconds
+        self.step_ms = step_ms
+        self.draw_ms = draw_ms
+        self.stall_ms = stall_ms
+
+
+LOADS = (Load("light", 3, .5, 4),
+         Load("slow draws", 5, .5, 30),
+         Load("light", 5, .5, 4),
+         Load("slow steps", 5, 15, 25),
+         Load("stall", 2, .5, 4, stall_ms=1000),
+         Load("light", 5, .5, 4))
+
+
+def run(max_frame_skip):
+    """ Play through LOADS. Returns a row per load, and the simulation. """
+    simulation = Simulation()
+    simulation.setup()
+    apply_input(simulation, KEY_PRESS, arcade.key.D)
+    governor = QualityGovernor(1000 / UPDATE_RATE)
+    pacer = FramePacer(SIMULATION_STEP, max_frame_skip=max_frame_skip, governor=governor)
+    update_interval = pacer.update_interval
+
+    clock = 0.0
+    last_update = 0.0
+    next_update = 0.0
+    rows = []
+    for load in LOADS:
+        start = (clock, pacer.frames_drawn, pacer.frames_dropped, pacer.steps_run, pacer.steps_lost)
+        levels = set()
+        longest = 0.0
+        clock += load.stall_ms / 1000
+        end = start[0] + load.seconds
+        while clock < end:
+            now = max(next_update, clock)
+            delta_time = now - last_update
+            last_update = now
+            longest = max(longest, delta_time)
+            next_update = now + update_interval
+
+            simulation.animation_interval = governor.quality.animation_interval
+            steps = pacer.steps(delta_time)
+            for _ in range(steps):
+                simulation.step()
+            simulation.events.clear()
+            pacer.record_update(steps * load.step_ms)
+            clock = now + steps * load.step_ms / 1000
+            if pacer.should_draw(clock):
+                pacer.record_draw(load.draw_ms)
+                clock += load.draw_ms / 1000
+            levels.add(governor.level)
+
+        wall = clock - start[0]
+        game = (pacer.steps_run - start[3]) * SIMULATION_STEP
+        rows.append({"load": load.name,
+                     "fps": (pacer.frames_drawn - start[1]) / wall,
+                     "dropped": pacer.frames_dropped - start[2],
+                     "steps_lost": pacer.steps_lost - start[4],
+                     "game_over_wall": game / wall,
+                     "longest_ms": longest * 1000,
+                     "max_level": max(levels),
+                     "level": governor.level})
+    return rows, simulation
+
+
+def fixed_run():
+    """ The same walk, stepped straight through with every player animation update. """
+    simulation = Simulation()
+    simulation.setup()
+    apply_input(simulation, KEY_PRESS, arcade.key.D)
+    return simulation
+
+
+def problems(rows, unskipped_rows, simulation):
+    found = []
+    for row in rows:
+        if row["steps_lost"] and row["load"] != "stall":
+            found.append(f"{row['load']}: lost {row['steps_lost']} steps")
+    if rows[1]["max_level"] == 0:
+        found.append("the governor didn't turn quality down during the slow draws")
+    if rows[-1]["level"] != 0:
+        found.append("the governor didn't turn quality back up")
+    if rows[3]["longest_ms"] >= unskipped_rows[3]["longest_ms"]:
+        found.append("frame skipping didn't shorten the waits between updates under the slow steps")
+
+    reference = fixed_run()
+    for _ in range(simulation.steps):
+        reference.step()
+    player = simulation.player
+    if ((player.center_x, player.center_y, simulation.score) !=
+            (reference.player.center_x, reference.player.center_y, reference.score)):
+        found.append("the governor's animation_interval changed how the game played")
+    return found
+
+
+def main():
+    results = {}
+    for label, max_frame_skip in (("frame skip", MAX_FRAME_SKIP), ("no frame skip", 0)):
+        rows, simulation = run(max_frame_skip)
+        results[label] = rows
+        print(f"{label}:")
+        print(f"{'load':>12} {'fps':>6} {'dropped':>8} {'steps lost':>11} {'game/wall':>10} {'longest ms':>11} "
+              f"{'quality':>8}")
+        for row in rows:
+            print(f"{row['load']:>12} {row['fps']:>6.1f} {row['dropped']:>8} {row['steps_lost']:>11} "
+                  f"{row['game_over_wall']:>10.3f} {row['longest_ms']:>11.1f} {row['max_level']:>4} -> {row['level']}")
+        if label == "frame skip":
+            skipped_simulation = simulation
+    print(f"quality levels (animation_interval, hud_interval): "
+          f"{[(level.animation_interval, level.hud_interval) for level in QUALITY_LEVELS]}")
+    found = problems(results["frame skip"], results["no frame skip"], skipped_simulation)
+    if found:
+        for problem in found:
+            print(f"MISMATCH {problem}")
+        sys.exit(1)
+    print("With frame skipping, game time kept pace with the clock but for the stall")
+
+
+if __name__ == "__main__":
+    main()
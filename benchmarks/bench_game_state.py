@@ -0,0 +1,201 @@
+# coding=utf-8
+import os
+import sys
+import time
+
+import pyglet
+from pyglet.media.drivers import get_audio_driver
+
+from game_state import (GAME_OVER, GAME_OVER_MUSIC, LEVEL_MUSIC, PAUSE_MUSIC, PAUSED, PLAYING, GameOverState,
+                        Music, PausedState, PlayingState, StateMachine)
+from simulation import EVENT_GAME_OVER, PLAYER_START, Simulation
+
+'''
+    Music handling over a session of play, pausing, resuming and finally a
+    game over left running: the old update(), which polled the pause and
+    game over flags every frame and queued the game over music on each one,
+    vs. the StateMachine switching tracks only in its enter hooks.
+
+    Reports the time update() spends on music per frame, leaving out the
+    state changes themselves, and the longest any player's queue got. Exits
+    non-zero if the state machine ever queues more than one playlist on a
+    player.
+
+    Then cuts a pit into the level under the player's start and steps a
+    real Simulation until the player falls out of the bottom of the map,
+    handing its events to the states the way MyGame.handle_events() does.
+    Exits non-zero unless that ends the game.
+
+    sounds/music.wav isn't in the repository, paused.wav stands in for it.
+    Without a sound device pyglet's Player.next_source() fails, so only the
+    state machine is run.
+
+    Run from the repository root:  python -m benchmarks.bench_game_state
+'''
+
+FRAMES = 6000
+FRAME_TIME = 1 / 60
+# Frame -> what happens on it
+SESSION = {1000: PAUSED,
+           1500: PLAYING,
+           3000: PAUSED,
+           3200: PLAYING,
+           4000: GAME_OVER}
+
+
+def load_track(file_name):
+    # Static so the same sound can be queued on both the old and the new players
+    return pyglet.media.load(file_name, streaming=False)
+
+
+class PollingMusic:
+    """ What update() and on_key_press() did with one music player and the paused/game over flags """
+
+    def __init__(self, level_music, pause_menu_music, game_over_music):
+        self.music_player = pyglet.media.Player()
+        self.level_music = level_music
+        self.pause_menu_music = pause_menu_music
+        self.game_over_music = game_over_music
+        self.paused_state = False
+        self.previously_paused = False
+        self.game_over = False
+        self.current_music_source = None
+        self.current_music_time = 0
+        # Sources queued on music_player and not yet played through or skipped
+        self.queued = 0
+
+    def queue(self, source):
+        if self.music_player.source is None:
+            self.queued = 0
+        self.music_player.queue(source)
+        self.queued += 1
+
+    def next_source(self):
+        self.music_player.next_source()
+        self.queued = max(self.queued - 1, 0)
+
+    def change(self, name):
+        if name == GAME_OVER:
+            self.game_over = True
+        elif name == PAUSED:
+            self.paused_state = True
+        elif self.paused_state:
+            self.paused_state = False
+            self.previously_paused = False
+            self.queue(self.current_music_source)
+            self.next_source()
+            self.music_player.seek(self.current_music_time)
+            self.music_player.play()
+
+    def update(self, delta_time):
+        if self.game_over:
+            self.queue(self.game_over_music)
+            self.next_source()
+            self.music_player.play()
+        if self.paused_state:
+            if self.previously_paused:
+                if not self.music_player.playing:
+                    self.queue(self.pause_menu_music)
+                    self.music_player.play()
+            elif not self.previously_paused:
+                self.music_player.pause()
+                self.current_music_time = self.music_player.time
+                self.current_music_source = self.music_player.source
+                self.queue(self.pause_menu_music)
+                self.next_source()
+                self.music_player.play()
+                self.previously_paused = True
+        if not self.game_over and not self.paused_state:
+            if not self.music_player.playing:
+                self.queue(self.level_music)
+                self.music_player.play()
+
+    def queue_length(self):
+        return self.queued if self.music_player.source is not None else 0
+
+
+class HeadlessGame:
+    """ Just the parts of MyGame the states use """
+
+    def __init__(self, level_music, pause_menu_music, game_over_music):
+        self.music = Music()
+        self.music.add(LEVEL_MUSIC, level_music)
+        self.music.add(PAUSE_MUSIC, pause_menu_music)
+        self.music.add(GAME_OVER_MUSIC, game_over_music, loop=False)
+        self.states = StateMachine([PlayingState(self), PausedState(self), GameOverState(self)])
+        self.states.change(PLAYING)
+
+    def advance(self, delta_time):
+        pass
+
+    def change(self, name):
+        self.states.change(name)
+
+    def update(self, delta_time):
+        self.states.update(delta_time)
+
+    def queue_length(self):
+        return max(self.music.queue_lengths().values())
+
+
+def run(game):
+    """ Play through SESSION, returns mean ms per frame update() took and the longest queue seen. """
+    longest = 0
+    elapsed = 0
+    for frame in range(FRAMES):
+        if frame in SESSION:
+            game.change(SESSION[frame])
+        start = time.perf_counter()
+        game.update(FRAME_TIME)
+        elapsed += time.perf_counter() - start
+        longest = max(longest, game.queue_length())
+    return elapsed / FRAMES * 1000, longest
+
+
+def fall_out(game):
+    """ Drop the player through a pit in the floor. Returns the steps until game over, None if it never came. """
+    simulation = Simulation()
+    simulation.setup()
+    physics = simulation.physics_engine
+    start_column = int(PLAYER_START[0] // physics.tile_size)
+    for column in range(start_column - 2, start_column + 3):
+        for row in range(physics.height):
+            physics.set_solid(column, row, False)
+
+    for step in range(1, FRAMES + 1):
+        simulation.step()
+        for event in simulation.events:
+            if event == EVENT_GAME_OVER:
+                game.change(GAME_OVER)
+        simulation.events.clear()
+        if game.states.name == GAME_OVER:
+            return step
+    return None
+
+
+def main():
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    tracks = [load_track("sounds/paused.wav"), load_track("sounds/paused.wav"), load_track("sounds/gameover1.wav")]
+
+    print(f"{'music':>8} {'ms/frame':>9} {'longest queue':>14}")
+    if get_audio_driver() is not None:
+        polling_ms, polling_longest = run(PollingMusic(*tracks))
+        print(f"{'polling':>8} {polling_ms:>9.4f} {polling_longest:>14}")
+    else:
+        print(f"{'polling':>8} {'-':>9} {'-':>14}  (no audio driver)")
+    states_ms, states_longest = run(HeadlessGame(*tracks))
+    print(f"{'states':>8} {states_ms:>9.4f} {states_longest:>14}")
+
+    fall_steps = fall_out(HeadlessGame(*tracks))
+    print(f"falling out of the map: {'no game over' if fall_steps is None else f'game over after {fall_steps} steps'}")
+
+    if states_longest > 1:
+        print(f"REGRESSION a music player queued {states_longest} playlists")
+        sys.exit(1)
+    if fall_steps is None:
+        print("REGRESSION falling out of the map didn't end the game")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+# coding=utf-8
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_restart import play, state
+from level_cache import CACHE_SUFFIX, compile_level
+from simulation import LEVEL_MAP, SPRITE_SCALING, Simulation
+
+'''
+    Reloading the level after an edit to its TMX file: Simulation.reload_level()
+    patching just the changed tiles in, vs. a new Simulation and setup() of the
+    edited map, what seeing an edit took before. Works on a copy of
+    NLA-testLvL5.tmx next to it (its tileset paths are relative to the
+    repository root), which every round edits near the start of the level (a
+    platform taken out and another put in, a coin and an ice tile taken out,
+    a coin put in, a background tree swapped for another) and puts back.
+
+    Reports median ms of a reload, of the TMX parse it starts with on its
+    own, and of setup(). Exits non-zero unless a reload keeps the player and
+    score, and the reloaded level, restarted, is in exactly the state a fresh
+    setup() of the edited map starts in, with the same sprites streamed in,
+    and plays a scenario out the same way, also after an edit using an image
+    the level had never loaded.
+
+    Run from the repository root:  python -m benchmarks.bench_hot_reload
+'''
+
+REPEATS = 20
+# Edits are made in the columns the view starts over, so their sprites are streamed in
+EDIT_COLUMNS = range(2, 18)
+LAYER_DATA = re.compile(r'(<layer\b[^>]*\bname="([^"]+)"[^>]*>\s*<data encoding="csv">)(.*?)(</data>)', re.S)
+
+
+def read_layers(text):
+    """ Layer name -> rows of tile ids, from the top, as in the TMX file. """
+    return {match.group(2): [[int(tile_id) for tile_id in line.strip().rstrip(",").split(",")]
+                             for line in match.group(3).strip().splitlines()]
+            for match in LAYER_DATA.finditer(text)}
+
+
+def write_layers(text, layers):
+    """ The TMX text with the csv data of its layers replaced. """
+    return LAYER_DATA.sub(lambda match: (match.group(1) + "\n" +
+                                         ",\n".join(",".join(map(str, row)) for row in layers[match.group(2)]) +
+                                         "\n" + match.group(4)), text)
+
+
+def edited(text, new_image=None):
+    """ The TMX text with a handful of tiles changed, new_image the tile id of the platform put in if given. """
+    layers = read_layers(text)
+    used = set()
+
+    def tile_cell(layer_name):
+        for row_index, row in enumerate(layers[layer_name]):
+            for col in EDIT_COLUMNS:
+                if row[col] and (col, row_index) not in used:
+                    used.add((col, row_index))
+                    return col, row_index
+        raise ValueError(f"No {layer_name} tile to edit near the start of the level.")
+
+    def empty_cell():
+        for row_index in range(len(layers["Platforms"])):
+            for col in EDIT_COLUMNS:
+                if not any(rows[row_index][col] for rows in layers.values()) and (col, row_index) not in used:
+                    used.add((col, row_index))
+                    return col, row_index
+        raise ValueError("No empty cell to edit near the start of the level.")
+
+    def first_id(layer_name, other_than=0):
+        return next(tile_id for row in layers[layer_name] for tile_id in row if tile_id not in (0, other_than))
+
+    col, row = tile_cell("Platforms")
+    platform_id = layers["Platforms"][row][col]
+    layers["Platforms"][row][col] = 0
+    col, row = empty_cell()
+    layers["Platforms"][row][col] = new_image or platform_id
+    col, row = tile_cell("Background")
+    layers["Background"][row][col] = first_id("Background", other_than=layers["Background"][row][col])
+    coin_id = first_id("Coins")
+    for layer_name in ("Coins", "Ice"):
+        col, row = tile_cell(layer_name)
+        layers[layer_name][row][col] = 0
+    col, row = empty_cell()
+    layers["Coins"][row][col] = coin_id
+    return write_layers(text, layers)
+
+
+def unused_image(text):
+    """ Tile id of an image in the tileset that no layer uses. """
+    used = {tile_id for rows in read_layers(text).values() for row in rows for tile_id in row}
+    for tile in re.finditer(r'<tile id="(\d+)"', text):
+        tile_id = int(tile.group(1)) + 1
+        if tile_id not in used:
+            return tile_id
+    return None
+
+
+def save(map_name, text):
+    with open(map_name, "w", encoding="utf-8", newline="\n") as file:
+        file.write(text)
+
+
+def sprites(simulation):
+    """ Every streamed sprite, by layer, and those of the shared draw list. """
+    found = {layer.name: sorted((tile_sprite.tile_index, tile_sprite.center_x, tile_sprite.center_y,
+                                 tile_sprite.texture.name) for tile_sprite in layer.sprite_list)
+             for layer in simulation.level_streamer.layers}
+    found["static_list"] = sorted((tile_sprite.center_x, tile_sprite.center_y, tile_sprite.texture.name)
+                                  for tile_sprite in simulation.static_list)
+    return found
+
+
+def level_state(simulation):
+    """ Everything reload_level() patches, beyond what bench_restart.state() covers. """
+    coins = simulation.coins
+    ice = simulation.ice
+    return (sprites(simulation), bytes(simulation.physics_engine.solid), simulation.ice_tiles,
+            coins.x.tobytes(), coins.y.tobytes(), coins.texture.tobytes(), ice.x.tobytes(), ice.y.tobytes(),
+            ice.texture.tobytes())
+
+
+def misplaced_sprites(simulation):
+    """ Streamed sprites whose tile_index points at another tile of the level. """
+    level = simulation.my_map
+    return [tile_sprite for layer in simulation.level_streamer.layers for tile_sprite in layer.sprite_list
+            if (level.center_xs[tile_sprite.tile_index] * SPRITE_SCALING,
+                level.center_ys[tile_sprite.tile_index] * SPRITE_SCALING) !=
+            (tile_sprite.center_x, tile_sprite.center_y)]
+
+
+def shared_chunk_sprites(simulation, other):
+    """ The streamed sprites of simulation's chunks that other has loaded too, by layer. """
+    streamer = simulation.level_streamer
+    shared = streamer.loaded & other.level_streamer.loaded
+    return {layer.name: sorted((tile_sprite.tile_index, tile_sprite.center_x, tile_sprite.center_y,
+                                tile_sprite.texture.name)
+                               for chunk in shared for tile_sprite in layer.chunk_sprites.get(chunk, ())
+                               if tile_sprite.sprite_lists)
+            for layer in streamer.layers}
+
+
+def alive_by_position(layer):
+    return {(x, y): alive for x, y, alive in zip(layer.x.tolist(), layer.y.tolist(), layer.alive.tolist())}
+
+
+def carried_over(before, after):
+    """ True if the tiles in both kept their alive flag, and the new ones are alive. """
+    return all(before.get(position, True) == alive for position, alive in after.items())
+
+
+def reload(simulation, map_name, text, changes):
+    """ Save text as the map and reload it. Returns what went wrong, or None. """
+    keep = (simulation.player.center_x, simulation.player.center_y, simulation.score, simulation.trees_saved,
+            simulation.view_left, simulation.view_bottom, simulation.steps)
+    coins = alive_by_position(simulation.coins)
+    ice = alive_by_position(simulation.ice)
+    save(map_name, text)
+    diff = simulation.reload_level()
+    if diff is None or len(diff) != changes:
+        return f"expected {changes} tiles changed, found {None if diff is None else len(diff)}"
+    if keep != (simulation.player.center_x, simulation.player.center_y, simulation.score, simulation.trees_saved,
+                simulation.view_left, simulation.view_bottom, simulation.steps):
+        return "the player, score or view changed"
+    if not carried_over(coins, alive_by_position(simulation.coins)):
+        return "collected coins came back, or new ones are missing"
+    if not carried_over(ice, alive_by_position(simulation.ice)):
+        return "melted ice came back, or new ice is missing"
+    if misplaced_sprites(simulation):
+        return "streamed sprites point at the wrong tiles"
+    return None
+
+
+def compare_fresh(simulation, map_name):
+    """ A fresh setup() of the map, scrolled to the same view, against a reloaded simulation. Returns what differs. """
+    fresh = Simulation(map_name)
+    fresh.setup()
+    fresh.level_streamer.update(simulation.view_left, simulation.view_bottom)
+    if shared_chunk_sprites(simulation, fresh) != shared_chunk_sprites(fresh, simulation):
+        return "streamed sprites differ from a fresh setup()"
+    if bytes(simulation.physics_engine.solid) != bytes(fresh.physics_engine.solid):
+        return "the physics grid differs from a fresh setup()"
+    melted = [cell for cell, index in simulation.ice_tiles.items() if not simulation.ice.tile_alive(index)]
+    cells = fresh.lasers.cells.copy()
+    for col, row in melted:
+        cells[row, col] = 0
+    if not np.array_equal(simulation.lasers.cells, cells):
+        return "the laser grid differs from a fresh setup() with the same ice melted"
+    return None
+
+
+def check(map_name, text):
+    """ Reload edits into a simulation being played. Returns what went wrong, or None. """
+    simulation = Simulation(map_name)
+    simulation.setup()
+    # Melts some ice, near the edits
+    play(simulation, "lasers_200")
+    new_image = unused_image(text)
+    problem = reload(simulation, map_name, edited(text, new_image), 6)
+    if problem:
+        return problem
+    if new_image is not None and not simulation.atlas.regions.keys() >= {texture.name for texture in
+                                                                          simulation.tile_textures}:
+        return "the new image isn't on the atlas"
+    problem = compare_fresh(simulation, map_name)
+    if problem:
+        return problem
+
+    # Collects some coins, then the edits are undone
+    play(simulation, "full_run")
+    problem = reload(simulation, map_name, text, 6) or compare_fresh(simulation, map_name)
+    if problem:
+        return problem
+
+    simulation.restart()
+    fresh = Simulation(map_name)
+    fresh.setup()
+    if state(simulation) != state(fresh) or level_state(simulation) != level_state(fresh):
+        return "restarted after the reload, it isn't the level a fresh setup() starts"
+    for name in ("lasers_200", "full_run"):
+        if play(simulation, name) != play(fresh, name) or level_state(simulation) != level_state(fresh):
+            return f"plays {name} differently from a fresh setup()"
+    return None
+
+
+def time_ms(action):
+    start = time.perf_counter()
+    action()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    with open(LEVEL_MAP, encoding="utf-8") as file:
+        text = file.read()
+    handle, map_name = tempfile.mkstemp(suffix=".tmx", prefix="hot-reload-", dir=".")
+    os.close(handle)
+    try:
+        save(map_name, text)
+        problem = check(map_name, text)
+        if problem:
+            print(f"MISMATCH {problem}")
+            sys.exit(1)
+        print("Reloaded levels match a fresh setup() of the edited map")
+
+        save(map_name, text)
+        simulation = Simulation(map_name)
+        simulation.setup()
+        play(simulation, "full_run")
+        versions = [edited(text), text]
+        reload_times = []
+        parse_times = []
+        setup_times = []
+        for repeat in range(REPEATS):
+            save(map_name, versions[repeat % 2])
+            parse_times.append(time_ms(lambda: compile_level(map_name, SPRITE_SCALING)))
+            reload_times.append(time_ms(simulation.reload_level))
+            setup_times.append(time_ms(lambda: Simulation(map_name).setup()))
+    finally:
+        for file_name in (map_name, map_name + CACHE_SUFFIX):
+            if os.path.exists(file_name):
+                os.remove(file_name)
+
+    print(f"{'':>24} {'median ms':>10}")
+    print(f"{'reload_level()':>24} {statistics.median(reload_times):>10.2f}")
+    print(f"{'  of which compile_level()':>24} {statistics.median(parse_times):>10.2f}")
+    print(f"{'setup()':>24} {statistics.median(setup_times):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
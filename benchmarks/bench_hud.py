@@ -0,0 +1,76 @@
+# coding=utf-8
+import os
+import sys
+import time
+
+import arcade
+
+'''
+    Frame time of on_draw with the HUD drawn through arcade.draw_text every
+    frame (the old on_draw) vs. the cached glyph sprites in hud.py, while the
+    score changes every few frames the way it does when coins are collected.
+
+    Needs a window to draw into.
+
+    Run from the repository root:  python -m benchmarks.bench_hud [frames]
+'''
+
+FRAMES = 600
+# Frames between score changes
+SCORE_EVERY = 10
+
+
+def legacy_game_class():
+    from rocknroo import MyGame
+
+    class LegacyHudGame(MyGame):
+        """ MyGame with the HUD text drawn the way on_draw used to """
+
+        def draw_hud(self):
+            if self.last_time and self.frame_count % 60 == 0:
+                fps = 1.0 / (time.time() - self.last_time) * 60
+                self.fps_message = f"FPS: {fps:5.0f}"
+
+            if self.fps_message:
+                arcade.draw_text(self.fps_message, self.view_left + 10, self.view_bottom + 40, arcade.color.BLACK, 14)
+
+            if self.frame_count % 60 == 0:
+                self.last_time = time.time()
+
+            output = f"Coins: {self.simulation.score}"
+            arcade.draw_text(output, self.view_left + 400, self.view_bottom + 675, arcade.color.BLACK, 16)
+            output = f"Trees Saved: {self.simulation.trees_saved}"
+            arcade.draw_text(output, self.view_left + 500, self.view_bottom + 675, arcade.color.BLACK, 16)
+
+    return LegacyHudGame
+
+
+def run(game, frames):
+    game.setup()
+    frame_times = []
+    for frame in range(frames):
+        if frame % SCORE_EVERY == 0:
+            game.simulation.score += 1
+        start = time.perf_counter()
+        game.on_draw()
+        frame_times.append((time.perf_counter() - start) * 1000)
+    frame_times.sort()
+    return sum(frame_times) / len(frame_times), frame_times[int(len(frame_times) * 0.99)]
+
+
+def main():
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from rocknroo import MyGame
+
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else FRAMES
+    game = MyGame()
+    print(f"{'hud':>10} {'mean ms':>8} {'p99 ms':>8}")
+    for name, draw_hud in (("draw_text", legacy_game_class().draw_hud), ("cached", MyGame.draw_hud)):
+        game.draw_hud = draw_hud.__get__(game)
+        mean_ms, p99_ms = run(game, frames)
+        print(f"{name:>10} {mean_ms:>8.3f} {p99_ms:>8.3f}")
+    arcade.close_window()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# coding=utf-8
+import math
+import os
+import random
+import time
+
+import arcade
+
+from benchmarks.spatial_hash import SpatialHash
+from lasers import LASER_TEXTURE_FILES, LaserSystem
+from level_cache import load_level
+from simulation import SPRITE_SCALING, LASER_SPEED
+
+'''
+    Frame time with 10 to 5000 laser pulses in flight: a sprite per pulse
+    moved by laser_list.update() and tested against the Ice, Platforms and
+    Walls spatial hashes one by one (the old update()), vs. LaserSystem
+    stepping them all as arrays with a raycast through the tile grid.
+
+    Then pulses fast enough to clear a whole tile in one step are fired at a
+    wall, counting how many get through it.
+
+    Run from the repository root:  python -m benchmarks.bench_lasers
+'''
+
+FRAMES = 200
+IN_FLIGHT = [10, 100, 1000, 5000]
+# Beyond this the sprite path takes minutes to run
+SPRITE_LIMIT = 1000
+TUNNEL_SPEED = 150
+TUNNEL_SHOTS = 200
+
+
+class SpriteLasers:
+    """ One sprite per pulse, hit-tested against spatial hashes of the tile sprites """
+
+    def __init__(self, hashes):
+        self.hashes = hashes
+        self.textures = [arcade.load_texture(file_name, scale=SPRITE_SCALING) for file_name in LASER_TEXTURE_FILES]
+        self.sprite_list = arcade.SpriteList()
+
+    def __len__(self):
+        return len(self.sprite_list)
+
+    def fire(self, x, y, angle, speed):
+        laser = arcade.Sprite(scale=SPRITE_SCALING)
+        laser.textures = self.textures
+        laser.set_texture(0)
+        laser.center_x = x
+        laser.center_y = y
+        laser.angle = math.degrees(angle)
+        laser.change_x = math.cos(angle) * speed
+        laser.change_y = math.sin(angle) * speed
+        self.sprite_list.append(laser)
+
+    def step(self, view_left, view_bottom, view_width, view_height):
+        self.sprite_list.update()
+        for laser in list(self.sprite_list):
+            for spatial_hash in self.hashes:
+                if spatial_hash.check_for_collision(laser):
+                    laser.kill()
+                    break
+            else:
+                if laser.bottom > view_height + view_bottom or laser.bottom < view_bottom or \
+                        laser.left > view_left + view_width or laser.left < view_left:
+                    laser.kill()
+        return []
+
+
+def level_hashes(level):
+    hashes = []
+    for layer_name in ("Ice", "Platforms", "Walls"):
+        sprite_list = arcade.SpriteList()
+        level.read_sprite_list(layer_name, sprite_list, SPRITE_SCALING)
+        spatial_hash = SpatialHash(level.tilewidth * SPRITE_SCALING)
+        spatial_hash.insert_list(sprite_list)
+        hashes.append(spatial_hash)
+    return hashes
+
+
+def run(lasers, in_flight, map_width, map_height, rng):
+    """ Keep in_flight pulses going across the whole map, returns mean ms per frame. """
+    frame_times = []
+    for frame in range(FRAMES):
+        start = time.perf_counter()
+        while len(lasers) < in_flight:
+            lasers.fire(rng.uniform(0, map_width), rng.uniform(0, map_height),
+                        rng.uniform(0, 2 * math.pi), LASER_SPEED)
+        lasers.step(0, 0, map_width, map_height)
+        frame_times.append((time.perf_counter() - start) * 1000)
+    return sum(frame_times) / len(frame_times)
+
+
+def tunnelled(lasers, wall_x, wall_top, map_width, map_height):
+    """ How many pulses fired right at a wall from its left side end up past it. """
+    rng = random.Random(1)
+    for shot in range(TUNNEL_SHOTS):
+        lasers.fire(wall_x - rng.uniform(100, 300), rng.uniform(wall_top - 500, wall_top - 100), 0, TUNNEL_SPEED)
+    through = set()
+    for frame in range(10):
+        lasers.step(0, 0, map_width, map_height)
+        sprites = lasers.sprite_list
+        through.update(id(laser) for laser in sprites if laser.center_x > wall_x + 200)
+    return len(through)
+
+
+def main():
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    level = load_level("NLA-testLvL5.tmx", SPRITE_SCALING)
+    map_width = level.width * level.tilewidth * SPRITE_SCALING
+    map_height = level.height * level.tileheight * SPRITE_SCALING
+    hashes = level_hashes(level)
+
+    print(f"{'in flight':>10} {'sprites ms':>11} {'arrays ms':>10} {'speedup':>8}")
+    for in_flight in IN_FLIGHT:
+        array_ms = run(LaserSystem(level, SPRITE_SCALING, arcade.SpriteList(use_spatial_hash=False)), in_flight,
+                       map_width, map_height, random.Random(0))
+        if in_flight > SPRITE_LIMIT:
+            print(f"{in_flight:>10} {'-':>11} {array_ms:>10.3f} {'-':>8}")
+            continue
+        sprite_ms = run(SpriteLasers(hashes), in_flight, map_width, map_height, random.Random(0))
+        print(f"{in_flight:>10} {sprite_ms:>11.3f} {array_ms:>10.3f} {sprite_ms / array_ms:>7.1f}x")
+
+    # A wall one tile thick and 10 tiles high, on its own
+    tile = level.tilewidth * SPRITE_SCALING
+    wall_x = 20 * tile
+    wall_top = 12 * tile
+    wall = arcade.SpriteList()
+    for row in range(int(wall_top // tile) - 10, int(wall_top // tile)):
+        tile_sprite = arcade.Sprite()
+        tile_sprite.width = tile
+        tile_sprite.height = tile
+        tile_sprite.center_x = wall_x + tile / 2
+        tile_sprite.center_y = row * tile + tile / 2
+        wall.append(tile_sprite)
+    wall_hash = SpatialHash(tile)
+    wall_hash.insert_list(wall)
+
+    sprite_lasers = SpriteLasers([wall_hash])
+    array_lasers = LaserSystem(level, SPRITE_SCALING, arcade.SpriteList(use_spatial_hash=False),
+                               blocking_layers=(), ice_layers=())
+    for sprite in wall:
+        array_lasers.cells[int(sprite.center_y // tile), int(sprite.center_x // tile)] = 1
+
+    print()
+    print(f"{TUNNEL_SHOTS} pulses at {TUNNEL_SPEED} px/step at a wall one {tile:.0f} px tile thick")
+    print(f"{'sprites':>10} {tunnelled(sprite_lasers, wall_x, wall_top, map_width, map_height):>4} got through")
+    print(f"{'arrays':>10} {tunnelled(array_lasers, wall_x, wall_top, map_width, map_height):>4} got through")
+
+
+if __name__ == "__main__":
+    main()
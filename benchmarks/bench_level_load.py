@@ -0,0 +1,83 @@
+# coding=utf-8
+import os
+import subprocess
+import sys
+import time
+
+import arcade
+
+from level_cache import LEVEL_LAYERS, CACHE_SUFFIX, compile_level, load_level
+from simulation import SPRITE_SCALING
+
+'''
+    Level startup time, parsing the TMX file and building a sprite per grid
+    location (the old setup() path) vs. loading the compiled level cache.
+    Cold runs are each timed in a fresh interpreter, warm runs repeat the load
+    in the same process.
+
+    Run from the repository root:  python -m benchmarks.bench_level_load [map.tmx]
+'''
+
+WARM_RUNS = 10
+COLD_RUNS = 3
+
+
+def load_from_tmx(map_name):
+    """ What setup() used to do. """
+    my_map = arcade.read_tiled_map(map_name, SPRITE_SCALING)
+    for layer_name in LEVEL_LAYERS:
+        sprite_list = arcade.SpriteList()
+        for row in my_map.layers[layer_name]:
+            for grid_location in row:
+                if grid_location.tile is not None:
+                    tile_sprite = arcade.Sprite(grid_location.tile.source, SPRITE_SCALING)
+                    tile_sprite.center_x = grid_location.center_x * SPRITE_SCALING
+                    tile_sprite.center_y = grid_location.center_y * SPRITE_SCALING
+                    sprite_list.append(tile_sprite)
+
+
+def load_from_cache(map_name):
+    level = load_level(map_name, SPRITE_SCALING)
+    textures = level.load_textures(SPRITE_SCALING)
+    for layer_name in LEVEL_LAYERS:
+        level.read_sprite_list(layer_name, arcade.SpriteList(), SPRITE_SCALING, textures)
+
+
+PATHS = {"tmx": load_from_tmx, "cache": load_from_cache}
+
+
+def time_load(path, map_name):
+    start = time.perf_counter()
+    PATHS[path](map_name)
+    return (time.perf_counter() - start) * 1000
+
+
+def time_cold(path, map_name):
+    """ Best of COLD_RUNS fresh interpreters, so nothing is cached in memory. """
+    timings = []
+    for _ in range(COLD_RUNS):
+        output = subprocess.check_output([sys.executable, "-m", "benchmarks.bench_level_load",
+                                          "--once", path, map_name])
+        timings.append(float(output))
+    return min(timings)
+
+
+def main():
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    if sys.argv[1:2] == ["--once"]:
+        print(time_load(sys.argv[2], sys.argv[3]))
+        return
+
+    map_name = sys.argv[1] if len(sys.argv) > 1 else "NLA-testLvL5.tmx"
+    compile_level(map_name, SPRITE_SCALING)
+    print(f"{map_name}, cache is {os.path.getsize(map_name + CACHE_SUFFIX)} bytes "
+          f"for a {os.path.getsize(map_name)} byte TMX file")
+    print(f"{'path':>6} {'cold ms':>9} {'warm ms':>9}")
+    for path in PATHS:
+        cold = time_cold(path, map_name)
+        warm = min(time_load(path, map_name) for _ in range(WARM_RUNS))
+        print(f"{path:>6} {cold:>9.2f} {warm:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# coding=utf-8
+import os
+import time
+
+import arcade
+
+from benchmarks.bench_streaming import repeat_level
+from level_cache import load_level
+from simulation import GRAVITY, MOVEMENT_SPEED, SPRITE_SCALING
+from tile_physics import TileGridPhysics
+
+'''
+    arcade.PhysicsEnginePlatformer scanning the platform sprites vs.
+    TileGridPhysics looking up grid cells, as the level grows to 10x and 100x
+    the tiles of NLA-testLvL5.tmx. Both engines move the player through the
+    same walk-and-jump and must end every step in the same place.
+
+    Run from the repository root:  python -m benchmarks.bench_physics
+'''
+
+SCALES = [(1, 1), (5, 2), (10, 10)]
+STEPS = 600
+JUMP_EVERY = 50
+TURN_EVERY = 200
+
+
+def make_player():
+    player = arcade.Sprite("images/rock_stand_right.png", scale=.5)
+    player.center_x = 384
+    player.center_y = 768
+    return player
+
+
+def run(level, engine_name):
+    player = make_player()
+    if engine_name == "sprites":
+        platforms = arcade.SpriteList()
+        level.read_sprite_list("Platforms", platforms, SPRITE_SCALING)
+        engine = arcade.PhysicsEnginePlatformer(player, platforms, gravity_constant=GRAVITY)
+    else:
+        engine = TileGridPhysics(player, level, SPRITE_SCALING, gravity_constant=GRAVITY)
+
+    positions = []
+    start = time.perf_counter()
+    for step in range(STEPS):
+        if step % TURN_EVERY == 0:
+            player.change_x = MOVEMENT_SPEED if (step // TURN_EVERY) % 2 == 0 else -MOVEMENT_SPEED
+        if step % JUMP_EVERY == 0 and engine.can_jump():
+            player.change_y = 16
+        engine.update()
+        positions.append((player.center_x, player.center_y))
+    elapsed = time.perf_counter() - start
+    return elapsed / STEPS * 1000, positions
+
+
+def main():
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    level = load_level("NLA-testLvL5.tmx", SPRITE_SCALING)
+
+    print(f"{'level':>9} {'platforms':>10} {'sprites ms':>11} {'grid ms':>8} {'speedup':>8} {'same path':>10}")
+    for copies_x, copies_y in SCALES:
+        big = repeat_level(level, copies_x, copies_y)
+        sprites_ms, sprites_path = run(big, "sprites")
+        grid_ms, grid_path = run(big, "grid")
+        print(f"{big.width:>4}x{big.height:<4} {len(big.layer_range('Platforms')):>10} {sprites_ms:>11.3f} "
+              f"{grid_ms:>8.4f} {sprites_ms / grid_ms:>7.0f}x {str(sprites_path == grid_path):>10}")
+
+
+if __name__ == "__main__":
+    main()
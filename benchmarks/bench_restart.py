@@ -0,0 +1,106 @@
+# coding=utf-8
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+from benchmarks.suite import SCENARIOS
+from simulation import Simulation
+
+'''
+    Restarting the level after a round of play: a new Simulation and setup()
+    (the only way to restart before), vs. Simulation.restart() putting the
+    same one back to the snapshot setup() took. setup() is timed cold (first
+    in the process, reading the level and decoding the images) and warm
+    (arcade's texture cache already filled), the way a restart would find it.
+
+    Reports the median ms and the peak Python memory each allocates. Exits
+    non-zero unless a restarted simulation ends up in exactly the state a
+    fresh one starts in, and plays the same scenario out the same way.
+
+    Run from the repository root:  python -m benchmarks.bench_restart
+'''
+
+REPEATS = 20
+
+
+def play(simulation, name):
+    """ Replay a suite scenario. Returns the state it ended in. """
+    trace, steps = SCENARIOS[name](simulation)
+    trace.replay(simulation, steps, lambda simulation: simulation.events.clear())
+    return state(simulation)
+
+
+def state(simulation):
+    """ What a player could tell apart between two simulations. """
+    player = simulation.player
+    return (simulation.steps, player.center_x, player.center_y, player.change_x, player.change_y,
+            simulation.score, simulation.trees_saved, simulation.view_left, simulation.view_bottom,
+            simulation.coins.alive.tobytes(), simulation.coins.angle, simulation.ice.alive.tobytes(),
+            len(simulation.laser_list), simulation.lasers.cells.tobytes())
+
+
+def played_simulation():
+    simulation = Simulation()
+    simulation.setup()
+    play(simulation, "lasers_200")
+    play(simulation, "full_run")
+    return simulation
+
+
+def new_setup():
+    simulation = Simulation()
+    simulation.setup()
+    return simulation
+
+
+def time_ms(action):
+    start = time.perf_counter()
+    action()
+    return (time.perf_counter() - start) * 1000
+
+
+def peak_kb(action):
+    """ In a call of its own, since tracing slows it down. """
+    tracemalloc.start()
+    try:
+        action()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    cold_ms = time_ms(new_setup)
+    fresh = new_setup()
+    setup_ms = statistics.median(time_ms(new_setup) for _ in range(REPEATS))
+    setup_kb = statistics.median(peak_kb(new_setup) for _ in range(REPEATS))
+
+    # Each simulation is restarted once, a second restart would find it pristine already
+    played = [played_simulation() for _ in range(REPEATS * 2)]
+    restart_ms = statistics.median(time_ms(simulation.restart) for simulation in played[:REPEATS])
+    restart_kb = statistics.median(peak_kb(simulation.restart) for simulation in played[REPEATS:])
+
+    print(f"{'':>12} {'ms':>8} {'peak kB':>8}")
+    print(f"{'setup, cold':>12} {cold_ms:>8.2f} {'-':>8}")
+    print(f"{'setup, warm':>12} {setup_ms:>8.2f} {setup_kb:>8.0f}")
+    print(f"{'restart':>12} {restart_ms:>8.2f} {restart_kb:>8.0f}")
+
+    failures = []
+    if state(played[-1]) != state(fresh):
+        failures.append("a restarted simulation isn't in the state a fresh one starts in")
+    for name in ("full_run", "lasers_200"):
+        if play(played.pop(), name) != play(new_setup(), name):
+            failures.append(f"{name} plays out differently after a restart")
+    for failure in failures:
+        print(f"MISMATCH {failure}")
+    if failures:
+        sys.exit(1)
+    print("restarted simulations match fresh ones")
+
+
+if __name__ == "__main__":
+    main()
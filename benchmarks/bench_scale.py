@@ -0,0 +1,118 @@
+# coding=utf-8
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.suite import full_run
+from level_cache import compile_level
+from level_generator import TEMPLATE_MAP, generate, scaled_size, write_tmx
+from profiler import percentile
+from simulation import SPRITE_SCALING, Simulation
+
+'''
+    How the game copes with bigger levels. Generates maps with level_generator
+    at 10x, 100x and 1000x the cells of NLA-testLvL5.tmx (1x for reference),
+    and for each one, in a fresh interpreter so memory isn't shared between
+    them, reports:
+
+        - parsing the TMX file and writing its level cache, and the peak
+          resident memory of doing so
+        - Simulation.setup() from that cache, and the peak resident memory
+          of setting up and playing
+        - update ms per frame percentiles for the first STEPS frames of the
+          suite's full_run, walking right and hopping now and then
+
+    Run from the repository root:  python -m benchmarks.bench_scale [scale ...] [--density 1] [--seed 0]
+'''
+
+SCALES = (1, 10, 100, 1000)
+STEPS = 1200
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def compile_once(map_name):
+    start = time.perf_counter()
+    level = compile_level(map_name, SPRITE_SCALING)
+    return {"tiles": len(level), "compile_ms": (time.perf_counter() - start) * 1000,
+            "compile_rss_mb": peak_rss_mb()}
+
+
+def play_once(map_name):
+    start = time.perf_counter()
+    simulation = Simulation(map_name)
+    simulation.setup()
+    setup_ms = (time.perf_counter() - start) * 1000
+
+    trace, steps = full_run(simulation)
+    update_times = []
+    clock = [time.perf_counter()]
+
+    def on_step(simulation):
+        now = time.perf_counter()
+        update_times.append((now - clock[0]) * 1000)
+        simulation.events.clear()
+        clock[0] = now
+
+    clock[0] = time.perf_counter()
+    trace.replay(simulation, min(steps, STEPS), on_step)
+    update_times.sort()
+    return {"setup_ms": setup_ms, "play_rss_mb": peak_rss_mb(),
+            "update_p50_ms": percentile(update_times, 50), "update_p95_ms": percentile(update_times, 95),
+            "update_max_ms": update_times[-1],
+            "streamed_sprites": simulation.level_streamer.loaded_sprite_count()}
+
+
+def run_once(action, map_name):
+    """ One of the _once functions in a fresh interpreter, its result as a dict. """
+    output = subprocess.check_output([sys.executable, "-m", "benchmarks.bench_scale", "--once", action, map_name])
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    args = sys.argv[1:]
+    if args[:1] == ["--once"]:
+        action, map_name = args[1:3]
+        result = compile_once(map_name) if action == "compile" else play_once(map_name)
+        print(json.dumps(result))
+        return
+
+    density = 1.0
+    seed = 0
+    scales = []
+    while args:
+        arg = args.pop(0)
+        if arg == "--density":
+            density = float(args.pop(0))
+        elif arg == "--seed":
+            seed = int(args.pop(0))
+        else:
+            scales.append(float(arg))
+
+    print(f"Levels generated from {TEMPLATE_MAP} at density {density}, seed {seed}, {STEPS} steps each")
+    print(f"{'scale':>6} {'size':>10} {'tiles':>7} {'TMX MB':>7} {'compile ms':>11} {'RSS MB':>7} "
+          f"{'setup ms':>9} {'RSS MB':>7} {'p50 ms':>7} {'p95 ms':>7} {'max ms':>7} {'streamed':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in scales or SCALES:
+            width, height = scaled_size(scale)
+            map_name = os.path.join(directory, f"scale-{scale:g}.tmx")
+            write_tmx(generate(width, height, density, seed), map_name)
+            compiled = run_once("compile", map_name)
+            played = run_once("play", map_name)
+            print(f"{scale:>6g} {f'{width}x{height}':>10} {compiled['tiles']:>7} "
+                  f"{os.path.getsize(map_name) / 1024 ** 2:>7.2f} {compiled['compile_ms']:>11.0f} "
+                  f"{compiled['compile_rss_mb']:>7.0f} {played['setup_ms']:>9.1f} {played['play_rss_mb']:>7.0f} "
+                  f"{played['update_p50_ms']:>7.3f} {played['update_p95_ms']:>7.3f} "
+                  f"{played['update_max_ms']:>7.3f} {played['streamed_sprites']:>9}")
+
+
+if __name__ == "__main__":
+    main()
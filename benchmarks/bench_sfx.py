@@ -0,0 +1,102 @@
+# coding=utf-8
+import os
+import time
+
+import arcade
+from pyglet.media import Source
+
+from benchmarks.suite import SCENARIOS
+from input_trace import KEY_PRESS, InputTrace
+from sfx import SfxMixer
+from simulation import (EVENT_COIN, EVENT_ICE_HIT, EVENT_JUMP, EVENT_LASER, EVENT_WALL_HIT, SIMULATION_STEP,
+                        Simulation)
+
+'''
+    Sound effects for the events of a few replayed scenarios: arcade.play_sound()
+    for every event (the old play_event_sounds()) vs. SfxMixer's voice pool
+    with the limits MyGame sets up. Reports the ms per step spent starting
+    sounds, and how many pyglet Players each way needed.
+
+    Without a sound device the mixer plays nothing and every new Player
+    looks for an audio driver, so only the player counts compare there.
+
+    Run from the repository root:  python -m benchmarks.bench_sfx
+'''
+
+SOUND_FILES = {EVENT_COIN: "sounds/coin1.wav",
+               EVENT_JUMP: "sounds/jump1.wav",
+               EVENT_WALL_HIT: "sounds/hit4.wav",
+               EVENT_ICE_HIT: "sounds/hit2.wav",
+               EVENT_LASER: "sounds/laser1.wav"}
+# max_concurrent, min_interval, as in MyGame.setup()
+SOUND_LIMITS = {EVENT_COIN: (3, .05),
+                EVENT_JUMP: (1, .05),
+                EVENT_WALL_HIT: (1, .5),
+                EVENT_ICE_HIT: (2, .05),
+                EVENT_LASER: (3, .08)}
+
+
+def pinned(simulation):
+    """ Walk left into the edge of the map and stay there, a wall hit every step. """
+    trace = InputTrace()
+    trace.record(0, KEY_PRESS, arcade.key.A)
+    return trace, 600
+
+
+def scenario_events(scenario):
+    """ The events of every step of a scenario, replayed once up front so only the sounds are timed. """
+    simulation = Simulation()
+    simulation.setup()
+    trace, steps = scenario(simulation)
+    events = []
+
+    def on_step(simulation):
+        events.append(list(simulation.events))
+        simulation.events.clear()
+
+    trace.replay(simulation, steps, on_step)
+    return events
+
+
+def run_play_sound(events):
+    sounds = {name: arcade.load_sound(file_name) for name, file_name in SOUND_FILES.items()}
+    players_before = len(Source._players)
+    start = time.perf_counter()
+    for step_events in events:
+        for event in step_events:
+            arcade.play_sound(sounds[event])
+    elapsed = time.perf_counter() - start
+    return elapsed / len(events) * 1000, len(Source._players) - players_before
+
+
+def run_mixer(events):
+    step = [0]
+    mixer = SfxMixer(clock=lambda: step[0] * SIMULATION_STEP)
+    for name, file_name in SOUND_FILES.items():
+        max_concurrent, min_interval = SOUND_LIMITS[name]
+        mixer.add(name, arcade.load_sound(file_name), max_concurrent, min_interval)
+    start = time.perf_counter()
+    for step[0], step_events in enumerate(events):
+        for event in step_events:
+            mixer.play(event)
+    elapsed = time.perf_counter() - start
+    return elapsed / len(events) * 1000, len(mixer.voices), mixer
+
+
+def main():
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    scenarios = {"full_run": SCENARIOS["full_run"], "lasers_200": SCENARIOS["lasers_200"], "pinned": pinned}
+
+    print(f"{'scenario':>11} {'events':>7} {'play_sound ms':>14} {'players':>8} {'mixer ms':>9} {'voices':>7} "
+          f"{'played':>7} {'skipped':>8} {'stolen':>7}")
+    for name, scenario in scenarios.items():
+        events = scenario_events(scenario)
+        count = sum(len(step_events) for step_events in events)
+        old_ms, old_players = run_play_sound(events)
+        mixer_ms, voices, mixer = run_mixer(events)
+        print(f"{name:>11} {count:>7} {old_ms:>14.3f} {old_players:>8} {mixer_ms:>9.4f} {voices:>7} "
+              f"{mixer.played:>7} {mixer.skipped:>8} {mixer.stolen:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# coding=utf-8
+import os
+import sys
+import time
+
+from simulation import SIMULATION_STEP, Simulation
+
+'''
+    Headless steps per second of the game logic, with no window: the player
+    walks right, jumps and fires now and then, so physics, coin and laser
+    collisions and level streaming all get exercised. The same input is run
+    twice and the final states compared, as a check that stepping is
+    deterministic.
+
+    Run from the repository root:  python -m benchmarks.bench_simulation [steps]
+'''
+
+STEPS = 3000
+JUMP_EVERY = 45
+FIRE_EVERY = 20
+TURN_EVERY = 900
+
+
+def scripted_input(simulation, step):
+    """ Same input for the same step, every run. """
+    if step % TURN_EVERY == 0:
+        simulation.walk(1 if (step // TURN_EVERY) % 2 == 0 else -1)
+    if step % JUMP_EVERY == 0:
+        simulation.jump()
+    if step % FIRE_EVERY == 0:
+        player = simulation.player
+        simulation.fire(player.center_x + 300, player.center_y + (step % 200) - 100)
+
+
+def state(simulation):
+    player = simulation.player
+    return (simulation.steps, round(player.center_x, 3), round(player.center_y, 3), simulation.score,
+            simulation.trees_saved, simulation.view_left, simulation.view_bottom, len(simulation.laser_list))
+
+
+def run(steps):
+    simulation = Simulation()
+    simulation.setup()
+    start = time.perf_counter()
+    for step in range(steps):
+        scripted_input(simulation, step)
+        simulation.step()
+        simulation.events.clear()
+    elapsed = time.perf_counter() - start
+    return elapsed, state(simulation)
+
+
+def main():
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else STEPS
+
+    first_elapsed, first_state = run(steps)
+    second_elapsed, second_state = run(steps)
+    elapsed = min(first_elapsed, second_elapsed)
+
+    print(f"{steps} steps in {elapsed:.2f} s: {steps / elapsed:,.0f} steps/s, "
+          f"{steps * SIMULATION_STEP / elapsed:.1f}x real time")
+    print(f"final state {first_state}")
+    if first_state != second_state:
+        print(f"Warning, second run ended in a different state {second_state}")
+        sys.exit(1)
+    print("deterministic: both runs ended in the same state")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# coding=utf-8
+import os
+import statistics
+import time
+
+import arcade
+import pyglet
+
+from assets import IMAGE, MUSIC, AssetLoader, AssetManifest
+from rocknroo import build_manifest
+from simulation import Simulation
+
+'''
+    Time from nothing loaded to a Simulation ready for its first frame: every
+    file read and decoded on the main thread as setup() used to, vs. an
+    AssetLoader decoding the manifest on 1, 2, 4... worker threads first.
+    Drawing that frame needs a window and isn't included, neither is the GPU
+    upload MyGame does behind its loading screen.
+
+    Files in the manifest that aren't in the repository (sounds/music.wav)
+    are left out of both.
+
+    Run from the repository root:  python -m benchmarks.bench_startup
+'''
+
+REPEATS = 5
+
+
+def existing_manifest():
+    manifest = AssetManifest()
+    for kind, file_name in build_manifest():
+        if os.path.exists(file_name):
+            manifest.add(kind, file_name)
+    return manifest
+
+
+def forget_loaded():
+    arcade.load_texture.texture_cache.clear()
+
+
+def load_in_order(manifest):
+    """ What setup() did: sounds and images read as they are reached, images decoded as the atlas packs them. """
+    for kind, file_name in manifest:
+        if kind == IMAGE:
+            continue
+        if kind == MUSIC:
+            pyglet.media.load(file_name)
+        else:
+            pyglet.media.StaticSource(arcade.load_sound(file_name).player)
+    simulation = Simulation()
+    simulation.setup()
+    for kind, file_name in manifest:
+        if kind == IMAGE:
+            arcade.load_texture(file_name).image.load()
+
+
+def load_with_workers(manifest, workers):
+    loader = AssetLoader(manifest, workers)
+    loader.start()
+    loader.wait()
+    simulation = Simulation()
+    simulation.setup()
+
+
+def time_ms(load, *args):
+    times = []
+    for _ in range(REPEATS):
+        forget_loaded()
+        start = time.perf_counter()
+        load(*args)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    manifest = existing_manifest()
+    # Warm the OS file cache so every run reads from memory
+    load_in_order(manifest)
+
+    print(f"{len(manifest)} files, {os.cpu_count()} cores, median of {REPEATS}")
+    sequential_ms = time_ms(load_in_order, manifest)
+    print(f"{'main thread':>12} {sequential_ms:>8.1f} ms")
+    for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+        loader_ms = time_ms(load_with_workers, manifest, workers)
+        print(f"{f'{workers} workers':>12} {loader_ms:>8.1f} ms {sequential_ms / loader_ms:>5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
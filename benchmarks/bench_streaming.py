@@ -0,0 +1,109 @@
+# coding=utf-8
+import os
+import time
+
+import arcade
+
+from benchmarks.activity import start_coin_spin
+from level_cache import CompiledLevel, LEVEL_LAYERS, load_level
+from level_streamer import LevelStreamer
+from simulation import SCREEN_WIDTH, SCREEN_HEIGHT, SPRITE_SCALING
+
+'''
+    Frame cost and sprite count while the camera pans across levels 1x, 10x
+    and 100x the size of NLA-testLvL5.tmx, with every tile loaded up front
+    (the old setup()) vs. streamed in chunks around the viewport.
+
+    Only update() work is timed, drawing needs a window.
+
+    Run from the repository root:  python -m benchmarks.bench_streaming
+'''
+
+# Copies of the shipped level across and up
+SCALES = [(1, 1), (5, 2), (10, 10)]
+PAN_SPEED = 16
+
+
+def repeat_level(level, copies_x, copies_y):
+    """ The level tiled copies_x times across and copies_y times up. """
+    big = CompiledLevel(level.width * copies_x, level.height * copies_y, level.tilewidth, level.tileheight,
+                        level.backgroundcolor, level.textures, level.layer_names)
+    for layer_name in level.layer_names:
+        for copy_x in range(copies_x):
+            for copy_y in range(copies_y):
+                for index in level.layer_range(layer_name):
+                    big.tile_ids.append(level.tile_ids[index])
+                    big.texture_ids.append(level.texture_ids[index])
+                    big.layer_ids.append(level.layer_ids[index])
+                    big.center_xs.append(level.center_xs[index] + copy_x * level.width * level.tilewidth)
+                    big.center_ys.append(level.center_ys[index] + copy_y * level.height * level.tileheight)
+    return big
+
+
+def camera_path(level):
+    """ Pan right along the bottom of the map, then up. """
+    map_width = level.width * level.tilewidth * SPRITE_SCALING
+    map_height = level.height * level.tileheight * SPRITE_SCALING
+    for view_left in range(0, int(map_width - SCREEN_WIDTH), PAN_SPEED):
+        yield view_left, 0
+    for view_bottom in range(0, int(map_height - SCREEN_HEIGHT), PAN_SPEED):
+        yield int(map_width - SCREEN_WIDTH), view_bottom
+
+
+class SpinningStreamer(LevelStreamer):
+    """ Starts the coin sprites it loads spinning, like the full load does """
+
+    def _load_tile(self, layer, index):
+        tile_sprite = super()._load_tile(layer, index)
+        if layer.name == "Coins":
+            start_coin_spin(tile_sprite)
+        return tile_sprite
+
+
+def run(level, streamed):
+    textures = level.load_textures(SPRITE_SCALING)
+    lists = {layer_name: arcade.SpriteList() for layer_name in LEVEL_LAYERS}
+
+    start = time.perf_counter()
+    if streamed:
+        streamer = SpinningStreamer(level, SPRITE_SCALING, textures, SCREEN_WIDTH, SCREEN_HEIGHT)
+        for layer_name in LEVEL_LAYERS:
+            streamer.add_layer(layer_name, lists[layer_name])
+    else:
+        streamer = None
+        for layer_name in LEVEL_LAYERS:
+            level.read_sprite_list(layer_name, lists[layer_name], SPRITE_SCALING, textures)
+        for coin in lists["Coins"]:
+            start_coin_spin(coin)
+    setup_ms = (time.perf_counter() - start) * 1000
+
+    frame_times = []
+    most_sprites = 0
+    for view_left, view_bottom in camera_path(level):
+        start = time.perf_counter()
+        if streamer is not None:
+            streamer.update(view_left, view_bottom)
+        lists["Ice"].update()
+        lists["Coins"].update()
+        frame_times.append((time.perf_counter() - start) * 1000)
+        most_sprites = max(most_sprites, sum(len(sprite_list) for sprite_list in lists.values()))
+
+    frame_times.sort()
+    return setup_ms, sum(frame_times) / len(frame_times), frame_times[int(len(frame_times) * 0.99)], most_sprites
+
+
+def main():
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    level = load_level("NLA-testLvL5.tmx", SPRITE_SCALING)
+
+    print(f"{'level':>9} {'tiles':>7} {'mode':>9} {'setup ms':>9} {'mean ms':>8} {'p99 ms':>8} {'max sprites':>12}")
+    for copies_x, copies_y in SCALES:
+        big = repeat_level(level, copies_x, copies_y)
+        for streamed in (False, True):
+            setup_ms, mean_ms, p99_ms, most_sprites = run(big, streamed)
+            print(f"{big.width:>4}x{big.height:<4} {len(big):>7} {'streamed' if streamed else 'full':>9} "
+                  f"{setup_ms:>9.1f} {mean_ms:>8.3f} {p99_ms:>8.3f} {most_sprites:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# coding=utf-8
+import math
+
+import arcade
+
+'''
+    Uniform grid spatial index used to narrow collision checks down to the
+    sprites that share a grid cell with the sprite being tested. The game
+    tests against its tile grids and CollectibleLayer arrays now, this is
+    the sprite baseline bench_collisions, bench_lasers and bench_collectibles
+    measure them against.
+'''
+
+
+class SpatialHash:
+    """ Buckets sprites into square cells so a collision query only looks at the sprites near the one being tested """
+
+    def __init__(self, cell_size, rotating=False):
+        """
+        cell_size -- width/height in pixels of one grid cell
+        rotating -- set when the indexed sprites spin in place (eg. coins), so
+                    they are bucketed by the circle they sweep instead of
+                    their current corners
+        """
+        self.cell_size = cell_size
+        self.rotating = rotating
+
+        # (cell_x, cell_y) -> sprites overlapping that cell
+        self.cells = {}
+        # sprite -> cells it was bucketed into, so it can be removed without a search
+        self.sprite_cells = {}
+
+    def __len__(self):
+        return len(self.sprite_cells)
+
+    def __contains__(self, sprite):
+        return sprite in self.sprite_cells
+
+    def _cell_range(self, left, right, bottom, top):
+        """ Every cell touched by the given box, edges included. """
+        cell_size = self.cell_size
+        min_x = int(left // cell_size)
+        max_x = int(right // cell_size)
+        min_y = int(bottom // cell_size)
+        max_y = int(top // cell_size)
+        return [(cell_x, cell_y)
+                for cell_x in range(min_x, max_x + 1)
+                for cell_y in range(min_y, max_y + 1)]
+
+    def _cells_for(self, sprite, rotating=False):
+        if rotating:
+            radius = math.hypot(sprite.width, sprite.height) / 2
+            return self._cell_range(sprite.center_x - radius, sprite.center_x + radius,
+                                    sprite.center_y - radius, sprite.center_y + radius)
+        points = sprite.get_points()
+        xs = [point[0] for point in points]
+        ys = [point[1] for point in points]
+        return self._cell_range(min(xs), max(xs), min(ys), max(ys))
+
+    def insert(self, sprite):
+        """ Add a sprite to every cell its bounds overlap. """
+        if sprite in self.sprite_cells:
+            self.remove(sprite)
+        cells = self._cells_for(sprite, self.rotating)
+        self.sprite_cells[sprite] = cells
+        for cell in cells:
+            bucket = self.cells.get(cell)
+            if bucket is None:
+                self.cells[cell] = [sprite]
+            else:
+                bucket.append(sprite)
+
+    def insert_list(self, sprite_list):
+        for sprite in sprite_list:
+            self.insert(sprite)
+
+    def remove(self, sprite):
+        """ Drop a sprite from the index, eg. right after it was kill()ed. Unknown sprites are ignored. """
+        cells = self.sprite_cells.pop(sprite, None)
+        if cells is None:
+            return
+        for cell in cells:
+            bucket = self.cells[cell]
+            bucket.remove(sprite)
+            if not bucket:
+                del self.cells[cell]
+
+    def move(self, sprite):
+        """ Re-bucket a sprite whose position changed since it was inserted. """
+        self.remove(sprite)
+        self.insert(sprite)
+
+    def clear(self):
+        self.cells.clear()
+        self.sprite_cells.clear()
+
+    def candidates(self, sprite):
+        """ Sprites sharing at least one cell with the given sprite, without duplicates. """
+        cells = self.cells
+        found = []
+        seen = set()
+        for cell in self._cells_for(sprite):
+            bucket = cells.get(cell)
+            if bucket is None:
+                continue
+            for other in bucket:
+                if other not in seen:
+                    seen.add(other)
+                    found.append(other)
+        return found
+
+    def check_for_collision(self, sprite):
+        """ Same result as arcade.check_for_collision_with_list, only testing nearby sprites. """
+        return [other for other in self.candidates(sprite)
+                if other is not sprite and arcade.check_for_collision(sprite, other)]
@@ -0,0 +1,217 @@
+# coding=utf-8
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+
+import arcade
+
+from baking import StaticLayerBaker
+from input_trace import KEY_PRESS, KEY_RELEASE, MOUSE_PRESS, InputTrace
+from profiler import percentile
+from simulation import SCREEN_HEIGHT, SCREEN_WIDTH, SPRITE_SCALING, Simulation
+
+'''
+    Regression suite. Each scenario is an input trace replayed against a fresh
+    Simulation of NLA-testLvL5.tmx, reporting update (and with --draw, draw)
+    ms per frame percentiles and the peak memory Python allocated. The run
+    fails if the p95s or peak memory go over their limits in
+    benchmarks/thresholds.json. The limits only hold for the machine they
+    were measured on, so the file isn't in the repository: record it once
+    with --write-thresholds.
+
+    Drawing needs a window, without --draw only the simulation is measured.
+    With --bake the static layers are drawn from StaticLayerBaker tiles, as
+    MyGame does with ROCKNROO_BAKE=1, instead of streamed into static_list.
+
+    Run from the repository root:
+        python -m benchmarks.suite [--draw [--bake]] [--scenario name ...] [--write-thresholds]
+'''
+
+THRESHOLDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thresholds.json")
+# Only these are checked, the tails of a few hundred frames are too noisy to fail a build on
+THRESHOLD_KEYS = ("update_p95_ms", "draw_p95_ms", "peak_kb")
+# --write-thresholds allows this much over the numbers just measured
+TIME_MARGIN = 2.0
+MEMORY_MARGIN = 1.25
+REPORTED_PERCENTILES = (50, 95, 99)
+
+LASER_COUNT = 200
+LASER_VOLLEY_EVERY = 30
+
+
+def idle(simulation):
+    """ Nobody touches the controls. """
+    return InputTrace(), 600
+
+
+def full_run(simulation):
+    """ Walk right to the end of the map, hopping over whatever is in the way. """
+    trace = InputTrace()
+    trace.record(0, KEY_PRESS, arcade.key.D)
+    steps = int(simulation.end_of_map // 4)
+    for step in range(10, steps, 40):
+        trace.record(step, KEY_PRESS, arcade.key.W)
+        trace.record(step + 20, KEY_RELEASE, arcade.key.W)
+    return trace, steps
+
+
+def lasers(simulation):
+    """ LASER_COUNT pulses fanned out around the player, topped up every LASER_VOLLEY_EVERY steps. """
+    trace = InputTrace()
+    steps = 240
+    player = simulation.player
+    for step in range(0, steps, LASER_VOLLEY_EVERY):
+        for i in range(LASER_COUNT):
+            angle = 2 * math.pi * i / LASER_COUNT
+            trace.record(step, MOUSE_PRESS, arcade.MOUSE_BUTTON_LEFT,
+                         player.center_x + math.cos(angle) * 100, player.center_y + math.sin(angle) * 100)
+    return trace, steps
+
+
+def all_coins(simulation):
+    """ The whole map streamed in at once. Coins are always all loaded, as arrays, and spin together. """
+    streamer = simulation.level_streamer
+    level = simulation.my_map
+    streamer.view_width = level.width * level.tilewidth * streamer.scaling
+    streamer.view_height = level.height * level.tileheight * streamer.scaling
+    streamer._last_view = None
+    streamer.update(0, 0)
+    return InputTrace(), 300
+
+
+SCENARIOS = {"idle": idle,
+             "full_run": full_run,
+             "lasers_200": lasers,
+             "all_coins": all_coins}
+
+
+def draw(simulation, baker=None):
+    """ What MyGame.on_draw draws of the world. """
+    arcade.start_render()
+    arcade.set_viewport(simulation.view_left, SCREEN_WIDTH + simulation.view_left,
+                        simulation.view_bottom, SCREEN_HEIGHT + simulation.view_bottom)
+    if baker is not None:
+        baker.draw(simulation.view_left, simulation.view_bottom, SCREEN_WIDTH, SCREEN_HEIGHT)
+    else:
+        simulation.static_list.draw()
+    simulation.ice.draw(simulation.view_left, simulation.view_bottom, SCREEN_WIDTH, SCREEN_HEIGHT)
+    simulation.coins.draw(simulation.view_left, simulation.view_bottom, SCREEN_WIDTH, SCREEN_HEIGHT)
+    simulation.npc_list.draw()
+    simulation.player_list.draw()
+    simulation.laser_list.draw()
+    arcade.finish_render()
+
+
+def run_scenario(scenario, with_draw, bake=False):
+    """ Replay a scenario once. Returns update ms and draw ms for every step. """
+    simulation = Simulation(stream_static=not bake)
+    simulation.setup()
+    baker = None
+    if bake:
+        baker = StaticLayerBaker(simulation.my_map, SPRITE_SCALING, simulation.tile_textures, simulation.atlas)
+        if with_draw:
+            baker.bake_all()
+    trace, steps = scenario(simulation)
+
+    update_times = []
+    draw_times = []
+    clock = [time.perf_counter()]
+
+    def on_step(simulation):
+        now = time.perf_counter()
+        update_times.append((now - clock[0]) * 1000)
+        simulation.events.clear()
+        if with_draw:
+            draw(simulation, baker)
+            draw_end = time.perf_counter()
+            draw_times.append((draw_end - now) * 1000)
+            now = draw_end
+        clock[0] = now
+
+    clock[0] = time.perf_counter()
+    trace.replay(simulation, steps, on_step)
+    if baker is not None:
+        baker.close()
+    return update_times, draw_times
+
+
+def peak_memory_kb(scenario, bake=False):
+    """ Peak Python memory from setup to the end of the scenario, in its own run since tracing slows it down. """
+    tracemalloc.start()
+    try:
+        run_scenario(scenario, False, bake)
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def summarize(times, prefix):
+    times = sorted(times)
+    return {f"{prefix}_p{percent}_ms": percentile(times, percent) for percent in REPORTED_PERCENTILES}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the benchmark scenarios and check them against thresholds")
+    parser.add_argument("--draw", action="store_true", help="open a window and time drawing too")
+    parser.add_argument("--bake", action="store_true", help="draw the static layers from baked tiles")
+    parser.add_argument("--scenario", nargs="*", choices=sorted(SCENARIOS), help="only run these")
+    parser.add_argument("--write-thresholds", action="store_true",
+                        help="save what was measured, plus a margin, as the new thresholds")
+    args = parser.parse_args()
+
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    window = arcade.Window(SCREEN_WIDTH, SCREEN_HEIGHT, "benchmark") if args.draw else None
+
+    thresholds = {}
+    if os.path.exists(THRESHOLDS_FILE):
+        with open(THRESHOLDS_FILE) as file:
+            thresholds = json.load(file)
+    elif not args.write_thresholds:
+        print(f"Warning, no {THRESHOLDS_FILE}, nothing will be checked. Record it with --write-thresholds.")
+
+    results = {}
+    failures = []
+    print(f"{'scenario':>11} {'steps':>6} {'update p50':>11} {'p95':>7} {'p99':>7} "
+          f"{'draw p50':>9} {'p95':>7} {'p99':>7} {'peak kb':>9}")
+    for name in args.scenario or SCENARIOS:
+        scenario = SCENARIOS[name]
+        update_times, draw_times = run_scenario(scenario, args.draw, args.bake)
+        result = summarize(update_times, "update")
+        if draw_times:
+            result.update(summarize(draw_times, "draw"))
+        result["peak_kb"] = peak_memory_kb(scenario, args.bake)
+        results[name] = result
+
+        draw_columns = (f"{result['draw_p50_ms']:>9.3f} {result['draw_p95_ms']:>7.3f} {result['draw_p99_ms']:>7.3f}"
+                        if draw_times else f"{'-':>9} {'-':>7} {'-':>7}")
+        print(f"{name:>11} {len(update_times):>6} {result['update_p50_ms']:>11.3f} {result['update_p95_ms']:>7.3f} "
+              f"{result['update_p99_ms']:>7.3f} {draw_columns} {result['peak_kb']:>9.0f}")
+
+        for key, limit in thresholds.get(name, {}).items():
+            if key in result and result[key] > limit:
+                failures.append(f"{name} {key} {result[key]:.3f} is over its threshold of {limit:.3f}")
+
+    if window is not None:
+        window.close()
+
+    if args.write_thresholds:
+        for name, result in results.items():
+            thresholds[name] = {key: round(result[key] * (MEMORY_MARGIN if key == "peak_kb" else TIME_MARGIN), 3)
+                                for key in THRESHOLD_KEYS if key in result}
+        with open(THRESHOLDS_FILE, "w") as file:
+            json.dump(thresholds, file, indent=4, sort_keys=True)
+        print(f"Thresholds written to {THRESHOLDS_FILE}")
+        return
+
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+# coding=utf-8
+import math
+
+import numpy as np
+import arcade
+import pyglet.gl as gl
+from arcade import shader
+from arcade.sprite_list import FRAGMENT_SHADER, VERTEX_SHADER
+
+'''
+    Coins, ice and the like as arrays instead of sprites. Every tile of a
+    layer is one entry in a handful of NumPy arrays (position, texture index,
+    alive flag) sorted by x, and the whole layer shares one rotation worked
+    out from the step count, so nothing is updated per tile per step. Drawing
+    builds the instance data of the tiles under the viewport straight from
+    the arrays into one buffer, and pickups are a vectorized overlap test
+    against the few tiles near the player.
+'''
+
+# Same per-instance layout as arcade's SpriteList and the AtlasSpriteList buffer
+INSTANCE_DTYPE = np.dtype([('position', '2f4'), ('angle', 'f4'), ('size', '2f4'),
+                           ('sub_tex_coords', '4f4'), ('color', '4B')])
+
+
+def overlaps(offset_x, offset_y, half_width, half_height, tile_half, cos, sin):
+    """
+    Which tiles, at offset_x, offset_y from the center of an unrotated box and
+    turned by an angle with the given cos and sin, overlap that box: the
+    separating axes of the box and of each tile's rotated box, as
+    arcade.check_for_collision tests them. Edges touching don't count.
+    """
+    abs_cos = np.abs(cos)
+    abs_sin = np.abs(sin)
+    # The offset along the tile's own axes
+    along_x = np.abs(offset_x * cos + offset_y * sin)
+    along_y = np.abs(-offset_x * sin + offset_y * cos)
+    # Apart along either of the box's axes, or either of the tile's
+    return ((np.abs(offset_x) < half_width + abs_cos * tile_half[:, 0] + abs_sin * tile_half[:, 1]) &
+            (np.abs(offset_y) < half_height + abs_sin * tile_half[:, 0] + abs_cos * tile_half[:, 1]) &
+            (along_x < tile_half[:, 0] + abs_cos * half_width + abs_sin * half_height) &
+            (along_y < tile_half[:, 1] + abs_sin * half_width + abs_cos * half_height))
+
+
+class CollectibleLayer:
+    """ One layer of a CompiledLevel as parallel arrays, drawn from a TextureAtlas and hit-tested in bulk """
+
+    def __init__(self, level, layer_name, scaling, textures, atlas, spin=0):
+        """
+        textures -- the level's textures as returned by load_textures, by texture id
+        atlas -- the TextureAtlas they are packed in, None if the layer is never drawn
+        spin -- degrees every tile of the layer turns each step, like a sprite's change_angle
+        """
+        self.layer_name = layer_name
+        self.scaling = scaling
+        self.atlas = atlas
+        self.spin = spin
+        self.steps = 0
+        self._load(level, textures)
+
+        self.program = None
+        self.vao = None
+        self.instance_buf = None
+        self.vbo_buf = None
+
+    def _load(self, level, textures):
+        layer_name = self.layer_name
+        scaling = self.scaling
+        atlas = self.atlas
+        tiles = level.layer_range(layer_name)
+        self.first_index = tiles.start
+        xs = np.frombuffer(level.center_xs, dtype=np.float32)[tiles.start:tiles.stop] * scaling
+        ys = np.frombuffer(level.center_ys, dtype=np.float32)[tiles.start:tiles.stop] * scaling
+        texture_ids = np.frombuffer(level.texture_ids, dtype=np.uint16)[tiles.start:tiles.stop]
+
+        # Sorted by x, so the tiles between two x's are one slice found by binary search
+        order = np.argsort(xs, kind="stable")
+        self.x = xs[order].astype(np.float64)
+        self.y = ys[order].astype(np.float64)
+        self.texture = texture_ids[order].astype(np.intp)
+        self.alive = np.ones(len(order), dtype=bool)
+        # Position in the arrays of each tile of the layer, in level order
+        self.item_of = np.empty(len(order), dtype=np.intp)
+        self.item_of[order] = np.arange(len(order))
+
+        # Per texture id: half size, atlas page and texture coordinates
+        self.half_size = np.zeros((len(textures), 2), dtype=np.float64)
+        self.page = np.full(len(textures), -1, dtype=np.intp)
+        self.tex_coords = np.zeros((len(textures), 4), dtype=np.float32)
+        for texture_id in np.unique(self.texture).tolist():
+            index = tiles.start + int(np.argmax(texture_ids == texture_id))
+            tile_sprite = level.make_sprite(index, scaling, textures)
+            self.half_size[texture_id] = (tile_sprite.width / 2, tile_sprite.height / 2)
+            if atlas is None:
+                continue
+            region = atlas.regions.get(textures[texture_id].name)
+            if region is None:
+                print(f"Warning, '{textures[texture_id].name}' isn't on the atlas, "
+                      f"the {layer_name} using it won't be drawn.")
+                continue
+            self.page[texture_id] = region.page
+            self.tex_coords[texture_id] = region.tex_coords
+        # Furthest any corner reaches from its tile's center, whatever the rotation
+        self.reach = float(np.hypot(self.half_size[:, 0], self.half_size[:, 1]).max()) if len(textures) else 0.0
+
+    def __len__(self):
+        return int(np.count_nonzero(self.alive))
+
+    @property
+    def angle(self):
+        """ Degrees every tile of the layer is turned by, the same for all of them. """
+        return self.spin * self.steps
+
+    def step(self):
+        self.steps += 1
+
+    # --- Queries
+
+    def near(self, left, bottom, right, top):
+        """ Indexes of the alive tiles whose reach overlaps a rectangle. """
+        reach = self.reach
+        start, stop = np.searchsorted(self.x, (left - reach, right + reach))
+        y = self.y[start:stop]
+        found = np.flatnonzero(self.alive[start:stop] & (y >= bottom - reach) & (y <= top + reach))
+        return found + start
+
+    def collide(self, sprite):
+        """
+        Indexes of the alive tiles overlapping an unrotated sprite. The same
+        test arcade.check_for_collision makes, separating axes of the sprite's
+        box and each tile's rotated box, edges touching don't count.
+        """
+        left, right, bottom, top = sprite.left, sprite.right, sprite.bottom, sprite.top
+        items = self.near(left, bottom, right, top)
+        if len(items) == 0:
+            return items
+        half_width = (right - left) / 2
+        half_height = (top - bottom) / 2
+        radians = math.radians(self.angle)
+        hit = overlaps(self.x[items] - (left + half_width), self.y[items] - (bottom + half_height),
+                       half_width, half_height, self.half_size[self.texture[items]],
+                       math.cos(radians), math.sin(radians))
+        return items[hit]
+
+    def kill(self, items):
+        self.alive[items] = False
+
+    def remove_tile(self, index):
+        """ Take out the tile at an index of the level, eg. melted ice. """
+        self.alive[self.item_of[index - self.first_index]] = False
+
+    def tile_alive(self, index, snapshot=None):
+        """ Whether the tile at an index of the level is still there, or was in a snapshot of the layer. """
+        alive = self.alive if snapshot is None else snapshot[0]
+        return bool(alive[self.item_of[index - self.first_index]])
+
+    # --- Reloading
+
+    def reload(self, diff, textures, snapshots=()):
+        """
+        Switch to a new compilation of the level, from a LevelDiff. Tiles that
+        are in both keep their alive flag, so collected coins stay collected,
+        tiles new to the layer start alive. Returns the snapshots, taken of
+        the old level, carried over to the new one the same way.
+        """
+        first_index = self.first_index
+        item_of = self.item_of
+        alive = self.alive
+        self._load(diff.new, textures)
+        # Where each tile of the old layer went, in level order
+        new_indexes = diff.index_map[first_index:first_index + len(item_of)]
+        kept = new_indexes >= 0
+        new_items = self.item_of[new_indexes[kept] - self.first_index]
+
+        def carry_over(old_alive):
+            carried = np.ones(len(self.alive), dtype=bool)
+            carried[new_items] = old_alive[item_of][kept]
+            return carried
+
+        self.alive = carry_over(alive)
+        return [(carry_over(snapshot_alive), steps) for snapshot_alive, steps in snapshots]
+
+    # --- Restarting
+
+    def snapshot(self):
+        return self.alive.copy(), self.steps
+
+    def load_snapshot(self, snapshot):
+        alive, self.steps = snapshot
+        self.alive[:] = alive
+
+    # --- Drawing
+
+    def instance_data(self, items):
+        """ What the sprite shader needs for each of the given tiles. """
+        data = np.zeros(len(items), dtype=INSTANCE_DTYPE)
+        texture = self.texture[items]
+        data['position'][:, 0] = self.x[items]
+        data['position'][:, 1] = self.y[items]
+        data['angle'] = math.radians(self.angle)
+        data['size'] = self.half_size[texture]
+        data['sub_tex_coords'] = self.tex_coords[texture]
+        data['color'] = 255
+        return data
+
+    def draw(self, view_left, view_bottom, view_width, view_height):
+        """ Draw the alive tiles under the viewport, one instanced draw per atlas page they use. """
+        items = self.near(view_left, view_bottom, view_left + view_width, view_bottom + view_height)
+        items = items[self.page[self.texture[items]] >= 0]
+        if len(items) == 0:
+            return
+        data = self.instance_data(items)
+        pages = self.page[self.texture[items]]
+        first_page = pages[0]
+        if (pages == first_page).all():
+            self._render(first_page, data)
+            return
+        for page in np.unique(pages).tolist():
+            self._render(page, data[pages == page])
+
+    def _render(self, page, data):
+        if self.program is None:
+            self.program = shader.program(vertex_shader=VERTEX_SHADER, fragment_shader=FRAGMENT_SHADER)
+        if self.instance_buf is None or self.instance_buf.size < data.nbytes:
+            # Room for twice as many as this frame needs, it only grows
+            self.instance_buf = shader.Buffer.create_with_size(data.nbytes * 2, usage='stream')
+            if self.vbo_buf is None:
+                vertices = np.array([
+                    #  x,    y,   u,   v
+                    -1.0, -1.0, 0.0, 0.0,
+                    -1.0, 1.0, 0.0, 1.0,
+                    1.0, -1.0, 1.0, 0.0,
+                    1.0, 1.0, 1.0, 1.0,
+                ], dtype=np.float32)
+                self.vbo_buf = shader.buffer(vertices.tobytes())
+            vbo_buf_desc = shader.BufferDescription(self.vbo_buf, '2f 2f', ('in_vert', 'in_texture'))
+            instance_buf_desc = shader.BufferDescription(
+                self.instance_buf,
+                '2f 1f 2f 4f 4B',
+                ('in_pos', 'in_angle', 'in_scale', 'in_sub_tex_coords', 'in_color'),
+                normalized=['in_color'], instanced=True)
+            self.vao = shader.vertex_array(self.program, [vbo_buf_desc, instance_buf_desc])
+
+        self.instance_buf.orphan()
+        self.instance_buf.write(data.tobytes())
+        self.atlas.page_texture(page).use(0)
+        gl.glEnable(gl.GL_BLEND)
+        gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+        with self.vao:
+            self.program['Texture'] = 0
+            self.program['Projection'] = arcade.get_projection().flatten()
+            self.vao.render(gl.GL_TRIANGLE_STRIP, instances=len(data))
@@ -0,0 +1,224 @@
+# coding=utf-8
+from profiler import RingBuffer, percentile
+
+'''
+    Frame pacing. The window's update() runs at a target update rate, and
+    FramePacer turns the time between two updates into fixed simulation
+    steps, up to a catch-up cap, and decides which updates are also drawn:
+    at most at the target render rate, and not at all for a few updates in
+    a row while the game is behind, so the simulation keeps real-time pace
+    under load and only the frame rate drops.
+
+    QualityGovernor watches how long each frame's work takes against the
+    frame budget and trades away what can go without changing how the game
+    plays: how often the player's animation frame is picked, and how often
+    the HUD is refreshed. Counters and timings for all of it are in
+    FramePacer.stats(), the per-frame timings also in the game's profiler.
+'''
+
+# Updates a second the window asks for, and frames a second drawn at most (0: every update)
+UPDATE_RATE = 60
+RENDER_RATE = 0
+# At most this many fixed steps in one update; game time beyond that is
+# dropped, eg. after a stall or dragging the window, rather than run as a
+# burst that makes the next update late too
+MAX_CATCH_UP_STEPS = 15
+# An update that has to run this many updates' worth of steps is behind, and isn't
+# drawn: the time goes to the next update's steps instead. Frames slower than
+# that still all get drawn, dropping them would only lower the frame rate...
+BEHIND_STEPS = 4
+# ...and never more than this many updates in a row go undrawn, so the screen still moves
+MAX_FRAME_SKIP = 4
+
+# Drawn frames the frame rate and frame interval percentiles of stats() are over
+STATS_FRAMES = 60
+
+# Frames of work timings the governor averages before changing the quality level
+GOVERNOR_WINDOW = 30
+# Quality only goes back up once frames take less than this much of their budget
+GOVERNOR_RECOVER = .6
+
+
+class QualityLevel:
+    """ What the governor turns down, from the best quality at level 0 """
+
+    def __init__(self, animation_interval, hud_interval):
+        # Simulation steps between picking the player's animation frame
+        self.animation_interval = animation_interval
+        # Frames between refreshes of the HUD's values
+        self.hud_interval = hud_interval
+
+
+QUALITY_LEVELS = (QualityLevel(1, 1), QualityLevel(2, 10), QualityLevel(4, 30))
+
+
+class QualityGovernor:
+    """ Steps the quality level down while frames take longer than their budget, and back up once they fit easily """
+
+    def __init__(self, budget_ms, levels=QUALITY_LEVELS, window=GOVERNOR_WINDOW, recover=GOVERNOR_RECOVER):
+        self.budget_ms = budget_ms
+        self.levels = levels
+        self.window = window
+        self.recover = recover
+        self.level = 0
+        self.changes = 0
+        self._samples = []
+
+    @property
+    def quality(self):
+        return self.levels[self.level]
+
+    def record(self, frame_ms):
+        """ How long a frame's update and draw took. Returns True if the quality level changed. """
+        samples = self._samples
+        samples.append(frame_ms)
+        if len(samples) < self.window:
+            return False
+        mean = sum(samples) / len(samples)
+        samples.clear()
+        if mean > self.budget_ms and self.level < len(self.levels) - 1:
+            self.level += 1
+        elif mean < self.budget_ms * self.recover and self.level > 0:
+            self.level -= 1
+        else:
+            return False
+        self.changes += 1
+        return True
+
+
+class FramePacer:
+    """ How many fixed steps each update runs, and which updates get drawn """
+
+    def __init__(self, step, update_rate=UPDATE_RATE, render_rate=RENDER_RATE, max_catch_up=MAX_CATCH_UP_STEPS,
+                 max_frame_skip=MAX_FRAME_SKIP, profiler=None, governor=None):
+        """
+        step -- seconds of game time in one simulation step
+        profiler -- FrameProfiler the update and draw timings are recorded into, if any
+        governor -- QualityGovernor told how long each frame's work took, if any
+        """
+        self.step = step
+        self.update_interval = 1 / update_rate
+        self.render_interval = 1 / render_rate if render_rate else 0.0
+        self.max_catch_up = max_catch_up
+        self.max_frame_skip = max_frame_skip
+        self.behind_steps = BEHIND_STEPS * max(1, round(self.update_interval / step))
+        self.profiler = profiler
+        self.governor = governor
+
+        # Game time not yet simulated, always less than one step after steps()
+        self.accumulator = 0.0
+        self.behind = False
+        self.skipped_in_row = 0
+        self.next_draw = None
+        # Work of the update being paced, until it is drawn or skipped
+        self._frame_ms = 0.0
+
+        self.updates = 0
+        self.steps_run = 0
+        # Steps' worth of game time dropped by the catch-up cap
+        self.steps_lost = 0
+        self.frames_drawn = 0
+        # Updates not drawn because the game was behind...
+        self.frames_dropped = 0
+        # ...and because a frame was drawn less than a render interval ago
+        self.frames_held = 0
+        self._last_draw = None
+        self._intervals = RingBuffer(STATS_FRAMES)
+
+    @property
+    def alpha(self):
+        """ How far into the next step the game is, to draw it that far between the last two. """
+        return self.accumulator / self.step
+
+    def reset(self):
+        """ Nothing left to catch up on, eg. after a restart. """
+        self.accumulator = 0.0
+        self.behind = False
+
+    def steps(self, delta_time):
+        """ The fixed steps to run for delta_time seconds since the last update, at most max_catch_up. """
+        self.accumulator += delta_time
+        steps = 0
+        while self.accumulator >= self.step:
+            self.accumulator -= self.step
+            steps += 1
+        self.behind = steps >= self.behind_steps
+        if steps > self.max_catch_up:
+            self.steps_lost += steps - self.max_catch_up
+            steps = self.max_catch_up
+        self.steps_run += steps
+        return steps
+
+    def should_draw(self, now):
+        """ Whether the update that just ran at time now (seconds) is drawn. Call once an update. """
+        self.updates += 1
+        behind = self.behind
+        # Updates that don't step, eg. while paused, are never behind
+        self.behind = False
+        if behind and self.skipped_in_row < self.max_frame_skip:
+            self.frames_dropped += 1
+            self._skip()
+            return False
+        if self.render_interval and self.next_draw is not None and now < self.next_draw - self.update_interval / 2:
+            self.frames_held += 1
+            self._skip()
+            return False
+
+        self.skipped_in_row = 0
+        self.frames_drawn += 1
+        if self.render_interval:
+            self.next_draw = (now if self.next_draw is None else self.next_draw) + self.render_interval
+            if self.next_draw < now:
+                # Fell a whole render interval behind, start the cadence again from here
+                self.next_draw = now + self.render_interval
+        if self._last_draw is not None:
+            self._intervals.append(self.frames_drawn, (now - self._last_draw) * 1000)
+        self._last_draw = now
+        return True
+
+    def _skip(self):
+        self.skipped_in_row += 1
+        self._end_frame()
+
+    def record_update(self, ms):
+        """ How long an update's steps and game logic took. """
+        self._frame_ms = ms
+        if self.profiler is not None:
+            self.profiler.record("update", ms)
+
+    def record_draw(self, ms):
+        """ How long drawing the update took, ending its frame. """
+        self._frame_ms += ms
+        if self.profiler is not None:
+            self.profiler.record("draw", ms)
+        self._end_frame()
+
+    def _end_frame(self):
+        if self.governor is not None:
+            self.governor.record(self._frame_ms)
+        self._frame_ms = 0.0
+
+    @property
+    def budget_ms(self):
+        """ The time one frame's update and draw should fit in. """
+        return max(self.render_interval, self.update_interval) * 1000
+
+    def stats(self):
+        """ Counters since the start, and the frame rate and frame interval percentiles of the last drawn frames. """
+        intervals = sorted(value for frame, value in self._intervals.samples())
+        mean = sum(intervals) / len(intervals) if intervals else 0.0
+        result = {"updates": self.updates,
+                  "steps": self.steps_run,
+                  "steps_lost": self.steps_lost,
+                  "frames_drawn": self.frames_drawn,
+                  "frames_dropped": self.frames_dropped,
+                  "frames_held": self.frames_held,
+                  "fps": 1000 / mean if mean else 0.0,
+                  "frame_interval_mean_ms": mean,
+                  "frame_interval_p95_ms": percentile(intervals, 95),
+                  "frame_interval_max_ms": intervals[-1] if intervals else 0.0,
+                  "budget_ms": self.budget_ms}
+        if self.governor is not None:
+            result["quality_level"] = self.governor.level
+            result["quality_changes"] = self.governor.changes
+        return result
@@ -0,0 +1,162 @@
+# coding=utf-8
+import pyglet
+
+'''
+    The game's top level states (playing, paused, game over, and later menus
+    and cut scenes) as an explicit state machine. A state's enter() and
+    exit() run only when the machine switches to or from it, and that is
+    where music changes, so a frame's update() does no audio bookkeeping
+    at all.
+'''
+
+# State names
+LOADING = "loading"
+PLAYING = "playing"
+PAUSED = "paused"
+GAME_OVER = "game_over"
+
+# Music track names
+LEVEL_MUSIC = "level"
+PAUSE_MUSIC = "pause"
+GAME_OVER_MUSIC = "game_over"
+
+
+class Music:
+    """ A pyglet Player per track, so switching tracks pauses one and plays another without re-queueing """
+
+    def __init__(self):
+        # Track name -> (player, source)
+        self.tracks = {}
+        # Track name -> times its source was queued since the player last played through it
+        self.queued = {}
+        self.current = None
+
+    def add(self, name, source, loop=True):
+        """ A track that failed to load (source None) is left out, switching to it just stops the music. """
+        if source is None:
+            return
+        player = pyglet.media.Player()
+        player.loop = loop
+        self.tracks[name] = (player, source)
+        self.queued[name] = 0
+        self._queue(name)
+
+    def _queue(self, name):
+        player, source = self.tracks[name]
+        if player.source is None:
+            # Played through, nothing is queued any more
+            self.queued[name] = 0
+        player.queue(source)
+        self.queued[name] += 1
+
+    def play(self, name, from_start=False):
+        """ Switch to a track, picking up where it was paused unless from_start. """
+        self.pause()
+        if name not in self.tracks:
+            return
+        player = self.tracks[name][0]
+        if player.source is None:
+            # A track that doesn't loop empties its player once it has played through
+            self._queue(name)
+        elif from_start:
+            player.seek(0.0)
+        player.play()
+        self.current = name
+
+    def pause(self):
+        if self.current is not None:
+            self.tracks[self.current][0].pause()
+            self.current = None
+
+    def queue_lengths(self):
+        """ Sources queued on each track's player, never more than one. """
+        return {name: self.queued[name] if player.source is not None else 0
+                for name, (player, source) in self.tracks.items()}
+
+
+class GameState:
+    """ One state of a StateMachine, the hooks do nothing unless overridden """
+
+    name = None
+    # Whether the simulation steps and the actors are drawn while in this state
+    simulating = False
+
+    def __init__(self, game):
+        self.game = game
+
+    def enter(self, previous):
+        """ Called as the machine switches to this state from previous (None the first time). """
+
+    def exit(self, following):
+        """ Called as the machine switches from this state to following. """
+
+    def update(self, delta_time):
+        """ Called every frame while this is the current state. """
+
+
+class LoadingState(GameState):
+    """ A loading screen while the game's AssetLoader works, then on to playing """
+
+    name = LOADING
+
+    def update(self, delta_time):
+        if self.game.assets.poll():
+            self.game.finish_setup()
+            self.game.states.change(PLAYING)
+
+
+class PlayingState(GameState):
+    """ The level running, with its music """
+
+    name = PLAYING
+    simulating = True
+
+    def enter(self, previous):
+        self.game.music.play(LEVEL_MUSIC)
+
+    def update(self, delta_time):
+        self.game.advance(delta_time)
+
+
+class PausedState(GameState):
+    """ The game frozen under the pause menu, the level music keeps its place for when play resumes """
+
+    name = PAUSED
+
+    def enter(self, previous):
+        self.game.music.play(PAUSE_MUSIC, from_start=True)
+
+
+class GameOverState(GameState):
+    """ The level ended, nothing steps any more """
+
+    name = GAME_OVER
+
+    def enter(self, previous):
+        self.game.music.play(GAME_OVER_MUSIC, from_start=True)
+
+
+class StateMachine:
+    """ Holds the current GameState and switches between states by name """
+
+    def __init__(self, states):
+        self.states = {state.name: state for state in states}
+        self.state = None
+
+    @property
+    def name(self):
+        return self.state.name if self.state is not None else None
+
+    def change(self, name):
+        """ Switch to the named state, running the exit and enter hooks. Switching to the current state does nothing. """
+        state = self.states[name]
+        previous = self.state
+        if state is previous:
+            return
+        if previous is not None:
+            previous.exit(state)
+        self.state = state
+        state.enter(previous)
+
+    def update(self, delta_time):
+        self.state.update(delta_time)
@@ -0,0 +1,143 @@
+# coding=utf-8
+import PIL.Image
+import PIL.ImageDraw
+import PIL.ImageFont
+import arcade
+
+from atlas import AtlasSpriteList, TextureAtlas
+
+'''
+    Heads-up display text. Every printable character is rendered once into a
+    glyph atlas, and each line of HUD text is a row of glyph sprites that is
+    only rebuilt when the value it shows changes. The HUD is drawn in screen
+    space, so it never has to follow view_left/view_bottom.
+'''
+
+# Same preference order as arcade.draw_text
+HUD_FONT_NAMES = ("calibri.ttf",
+                  "arial.ttf",
+                  "NotoSans-Regular.ttf",
+                  "/usr/share/fonts/truetype/freefont/FreeMono.ttf",
+                  "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+                  "/System/Library/Fonts/SFNSDisplay.ttf")
+HUD_CHARACTERS = "".join(chr(code) for code in range(32, 127))
+
+
+def load_font(font_size):
+    for font_name in HUD_FONT_NAMES:
+        try:
+            return PIL.ImageFont.truetype(font_name, int(font_size))
+        except OSError:
+            pass
+    return PIL.ImageFont.load_default()
+
+
+def _text_width(font, text):
+    if hasattr(font, "getlength"):
+        return int(round(font.getlength(text)))
+    return font.getsize(text)[0]
+
+
+class GlyphFont:
+    """ White glyphs for one font size, tinted per sprite when they are drawn """
+
+    def __init__(self, atlas, font_size):
+        # Scaled up the same way arcade.draw_text scales its font sizes
+        font = load_font(font_size * 1.25)
+        ascent, descent = font.getmetrics()
+        self.line_height = ascent + descent
+        self.textures = {}
+        self.advances = {}
+        for character in HUD_CHARACTERS:
+            advance = _text_width(font, character)
+            self.advances[character] = advance
+            if character == " ":
+                continue
+            # Some glyphs reach past their advance (italics, "j"), keep all of the ink
+            width = advance
+            if hasattr(font, "getbbox"):
+                width = max(width, font.getbbox(character)[2])
+            image = PIL.Image.new("RGBA", (max(width, 1), self.line_height))
+            PIL.ImageDraw.Draw(image).text((0, 0), character, (255, 255, 255), font=font)
+            texture = arcade.Texture(f"glyph-{font_size}-{ord(character)}", image)
+            self.textures[character] = texture
+            atlas.add(texture)
+
+
+class HudText:
+    """ One line of HUD text, laid out from glyph sprites whenever set() gets a different value """
+
+    def __init__(self, hud, x, y, font, color, template="{}"):
+        self.hud = hud
+        self.x = x
+        self.y = y
+        self.font = font
+        self.color = color
+        self.template = template
+        self.value = None
+        self.sprites = []
+
+    def set(self, value):
+        """ Show template.format(value), doing nothing if value is what is already shown. """
+        if value == self.value:
+            return
+        self.value = value
+        self._layout(self.template.format(value))
+
+    def _layout(self, text):
+        font = self.font
+        sprite_list = self.hud.sprite_list
+        glyphs = [character for character in text if character in font.textures]
+
+        while len(self.sprites) < len(glyphs):
+            glyph_sprite = arcade.Sprite()
+            glyph_sprite.append_texture(font.textures[glyphs[len(self.sprites)]])
+            glyph_sprite.set_texture(0)
+            glyph_sprite.color = self.color
+            self.sprites.append(glyph_sprite)
+            sprite_list.append(glyph_sprite)
+        while len(self.sprites) > len(glyphs):
+            self.sprites.pop().kill()
+
+        left = self.x
+        index = 0
+        for character in text:
+            texture = font.textures.get(character)
+            if texture is not None:
+                glyph_sprite = self.sprites[index]
+                glyph_sprite.texture = texture
+                glyph_sprite.center_x = left + texture.width / 2
+                glyph_sprite.center_y = self.y + font.line_height / 2
+                index += 1
+            left += font.advances.get(character, 0)
+
+
+class Hud:
+    """ Screen-space text drawn in a single batch """
+
+    def __init__(self, screen_width, screen_height):
+        self.screen_width = screen_width
+        self.screen_height = screen_height
+        self.atlas = TextureAtlas()
+        self.fonts = {}
+        self.lines = []
+        self.sprite_list = AtlasSpriteList(self.atlas)
+
+    def add_text(self, x, y, font_size, color, template="{}"):
+        """ A line at (x, y) pixels from the bottom left of the screen. """
+        font = self.fonts.get(font_size)
+        if font is None:
+            font = self.fonts[font_size] = GlyphFont(self.atlas, font_size)
+            self.atlas.build()
+            # Glyphs already on screen moved when the atlas was repacked
+            self.sprite_list.vao = None
+        line = HudText(self, x, y, font, color, template)
+        self.lines.append(line)
+        return line
+
+    def draw(self, view_left, view_bottom):
+        """ Draw in screen coordinates, then put the scrolled viewport back. """
+        arcade.set_viewport(0, self.screen_width, 0, self.screen_height)
+        self.sprite_list.draw()
+        arcade.set_viewport(view_left, self.screen_width + view_left,
+                            view_bottom, self.screen_height + view_bottom)
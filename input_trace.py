@@ -0,0 +1,123 @@
+# coding=utf-8
+import struct
+import sys
+import time
+
+import arcade
+
+'''
+    Input recording and replay. Key and mouse presses are stored with the
+    simulation step they arrived before, so feeding them back into a fresh
+    Simulation of the same level replays the session exactly, with or without
+    a window. Mouse presses are stored in map coordinates, so the replay
+    doesn't depend on where the camera was drawn.
+
+    Traces are a small binary file: a header, then one fixed-size record per
+    event.
+'''
+
+TRACE_MAGIC = b"RNRI"
+TRACE_VERSION = 1
+# magic, version, number of events
+_HEADER = struct.Struct("<4sHI")
+# step, kind, key or mouse button, x, y
+_EVENT = struct.Struct("<IBiff")
+
+KEY_PRESS = 1
+KEY_RELEASE = 2
+MOUSE_PRESS = 3
+
+
+def apply_input(simulation, kind, key, x=0.0, y=0.0):
+    """ What the game does with one input event. """
+    if kind == KEY_PRESS:
+        if key == arcade.key.W:
+            simulation.jump()
+        elif key == arcade.key.A:
+            simulation.walk(-1)
+        elif key == arcade.key.D:
+            simulation.walk(1)
+    elif kind == KEY_RELEASE:
+        if key == arcade.key.A or key == arcade.key.D:
+            simulation.stop_walking()
+        elif key == arcade.key.W:
+            simulation.stop_jumping()
+    elif kind == MOUSE_PRESS:
+        if key == arcade.MOUSE_BUTTON_LEFT:
+            simulation.fire(x, y)
+
+
+class InputTrace:
+    """ Input events, each tagged with the simulation step it was applied before """
+
+    def __init__(self):
+        # (step, kind, key, x, y), in the order they happened
+        self.events = []
+
+    def __len__(self):
+        return len(self.events)
+
+    def record(self, step, kind, key, x=0.0, y=0.0):
+        self.events.append((step, kind, key, x, y))
+
+    def last_step(self):
+        return self.events[-1][0] if self.events else 0
+
+    def replay(self, simulation, steps=None, on_step=None):
+        """
+        Step simulation from where it is, applying each event before the step
+        it was recorded at. Runs to the last event if steps isn't given.
+        on_step(simulation) is called after every step.
+        """
+        if steps is None:
+            steps = self.last_step() + 1
+        events = self.events
+        index = 0
+        # Skip anything recorded before the simulation's current step
+        while index < len(events) and events[index][0] < simulation.steps:
+            index += 1
+        for _ in range(steps):
+            while index < len(events) and events[index][0] == simulation.steps:
+                step, kind, key, x, y = events[index]
+                apply_input(simulation, kind, key, x, y)
+                index += 1
+            simulation.step()
+            if on_step is not None:
+                on_step(simulation)
+
+    def save(self, file_name):
+        with open(file_name, "wb") as file:
+            file.write(_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, len(self.events)))
+            for event in self.events:
+                file.write(_EVENT.pack(*event))
+
+    @classmethod
+    def load(cls, file_name):
+        trace = cls()
+        with open(file_name, "rb") as file:
+            data = file.read()
+        magic, version, count = _HEADER.unpack_from(data, 0)
+        if magic != TRACE_MAGIC or version != TRACE_VERSION:
+            raise ValueError(f"{file_name} is not a version {TRACE_VERSION} input trace")
+        if len(data) != _HEADER.size + count * _EVENT.size:
+            raise ValueError(f"{file_name} is truncated")
+        trace.events = list(_EVENT.iter_unpack(data[_HEADER.size:]))
+        return trace
+
+
+def main():
+    """ Replay a trace headless, eg.  python input_trace.py session.rnri """
+    from simulation import Simulation
+
+    trace = InputTrace.load(sys.argv[1])
+    simulation = Simulation()
+    simulation.setup()
+    start = time.perf_counter()
+    trace.replay(simulation)
+    elapsed = time.perf_counter() - start
+    print(f"{len(trace)} events over {simulation.steps} steps in {elapsed:.2f} s, "
+          f"score {simulation.score}, trees saved {simulation.trees_saved}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+# coding=utf-8
+import math
+
+import numpy as np
+import arcade
+
+'''
+    Laser pulses, kept as NumPy arrays (a structure of arrays) so every pulse
+    in flight is moved, aged and culled in one vectorized step. Hits come
+    from a swept raycast along each pulse's path through the tile grid
+    (Amanatides & Woo's DDA), so a fast pulse can't skip over a thin tile
+    between two steps. Sprites are only kept in sync for the pulses still
+    alive after the step, and are recycled between shots.
+'''
+
+LASER_POOL_SIZE = 32
+LASER_TEXTURE_FILES = ["images/laser1t.png",
+                       "images/laser2t.png",
+                       "images/laser3t.png",
+                       "images/laser4t.png",
+                       "images/laser5t.png"]
+# Steps each animation frame is shown for
+LASER_FRAME_STEPS = 4
+
+# _remove_sprites() rewrites SpriteList's sprite_list, sprite_idx and vao the way
+# arcade 2.0.9 keeps them (the version requirements.txt pins). Any other version
+# takes the sprites out one at a time with kill() instead
+BATCH_REMOVE = arcade.version.VERSION == "2.0.9"
+
+# What a laser finds in a grid cell
+CELL_EMPTY = 0
+CELL_BLOCK = 1
+CELL_ICE = 2
+
+
+class Laser(arcade.Sprite):
+    """ The sprite drawn for one slot of a LaserSystem """
+
+    def __init__(self, textures, scale):
+        super().__init__(scale=scale)
+        # Shared with every other laser from the same system, never append to it
+        self.textures = textures
+        self.set_texture(0)
+
+
+class LaserSystem:
+    """ Every laser pulse in flight, stepped and raycast against the level's tile grid all at once """
+
+    def __init__(self, level, scaling, sprite_list, blocking_layers=("Walls", "Platforms"), ice_layers=("Ice", ),
+                 capacity=LASER_POOL_SIZE):
+        self.scale = scaling
+        self.sprite_list = sprite_list
+        self.textures = [arcade.load_texture(file_name, scale=scaling) for file_name in LASER_TEXTURE_FILES]
+        self.tile_size = level.tilewidth * scaling
+
+        self.blocking_layers = blocking_layers
+        self.ice_layers = ice_layers
+
+        # What each cell holds, row 0 is the bottom row of the map
+        self.cells = np.zeros((level.height, level.width), dtype=np.uint8)
+        for layer_name in blocking_layers:
+            self.add_layer(level.layers_int_data[layer_name], CELL_BLOCK)
+        for layer_name in ice_layers:
+            self.add_layer(level.layers_int_data[layer_name], CELL_ICE)
+
+        # Hits are tested at the pulse's nose, half its length ahead of the center
+        self.reach = self.textures[0].width * scaling / 2
+
+        self.x = np.zeros(0)
+        self.y = np.zeros(0)
+        self.change_x = np.zeros(0)
+        self.change_y = np.zeros(0)
+        self.angle = np.zeros(0)
+        self.age = np.zeros(0, dtype=np.int32)
+        self.frame = np.zeros(0, dtype=np.int32)
+        self.alive = np.zeros(0, dtype=bool)
+        # Sprite for each slot, kept from one shot to the next
+        self.sprites = []
+        self.free = []
+        self._grow(capacity)
+
+    def add_layer(self, int_grid, value):
+        """ Mark the non-zero cells of a layers_int_data grid (rows listed from the top) with value. """
+        self.cells[::-1][np.asarray(int_grid) != 0] = value
+
+    def patch_cells(self, level, cells, melted=(), into=None):
+        """
+        Work out again what each (col, row) cell holds, from a new compilation
+        of the level, in cells or an array like it (a snapshot's). Ice stays
+        melted in the melted cells.
+        """
+        into = self.cells if into is None else into
+        layers = level.layers_int_data
+        for col, row in cells:
+            row_from_top = level.height - row - 1
+            value = CELL_EMPTY
+            if any(layers[name][row_from_top][col] for name in self.blocking_layers if name in layers):
+                value = CELL_BLOCK
+            if (col, row) not in melted and any(layers[name][row_from_top][col]
+                                                for name in self.ice_layers if name in layers):
+                value = CELL_ICE
+            into[row, col] = value
+
+    def _grow(self, capacity):
+        old = len(self.alive)
+        for name in ("x", "y", "change_x", "change_y", "angle", "age", "frame", "alive"):
+            values = getattr(self, name)
+            grown = np.zeros(capacity, dtype=values.dtype)
+            grown[:old] = values
+            setattr(self, name, grown)
+        self.sprites.extend(Laser(self.textures, self.scale) for _ in range(capacity - old))
+        # Lowest slots handed out first
+        self.free.extend(range(capacity - 1, old - 1, -1))
+
+    def __len__(self):
+        return int(np.count_nonzero(self.alive))
+
+    def fire(self, x, y, angle, speed):
+        """
+        Launch a pulse from (x, y) at angle radians. Returns its sprite, which
+        is in sprite_list for as long as the pulse is alive.
+        """
+        if not self.free:
+            # Only grows when more lasers are alive than ever before
+            self._grow(len(self.alive) * 2)
+        slot = self.free.pop()
+        self.x[slot] = x
+        self.y[slot] = y
+        self.change_x[slot] = math.cos(angle) * speed
+        self.change_y[slot] = math.sin(angle) * speed
+        self.angle[slot] = math.degrees(angle)
+        self.age[slot] = 0
+        self.frame[slot] = 0
+        self.alive[slot] = True
+
+        laser = self.sprites[slot]
+        laser.set_texture(0)
+        laser.angle = float(self.angle[slot])
+        laser.center_x = x
+        laser.center_y = y
+        self.sprite_list.append(laser)
+        return laser
+
+    def reset(self, cells=None):
+        """ Stop every pulse, and put the cells back to a copy taken earlier (melted ice and all) if given. """
+        live = np.flatnonzero(self.alive).tolist()
+        if live:
+            self._remove_sprites(live)
+        self.alive[:] = False
+        self.age[:] = 0
+        self.frame[:] = 0
+        # Lowest slots handed out first, as when the system was new
+        self.free = list(range(len(self.alive) - 1, -1, -1))
+        if cells is not None:
+            self.cells[:] = cells
+
+    def step(self, view_left, view_bottom, view_width, view_height):
+        """
+        Move every pulse one step, stopping the ones whose path crossed a
+        blocking or ice cell, or that left the view. Ice that was hit melts,
+        its (col, row) cells are returned.
+        """
+        live = np.flatnonzero(self.alive)
+        if len(live) == 0:
+            return []
+
+        x = self.x[live]
+        y = self.y[live]
+        change_x = self.change_x[live]
+        change_y = self.change_y[live]
+        speed = np.hypot(change_x, change_y)
+        speed[speed == 0] = 1
+        nose_x = change_x / speed * self.reach
+        nose_y = change_y / speed * self.reach
+
+        # Swept from where the nose was to where it will be, a new pulse from its center
+        fresh = self.age[live] == 0
+        start_x = np.where(fresh, x, x + nose_x)
+        start_y = np.where(fresh, y, y + nose_y)
+        new_x = x + change_x
+        new_y = y + change_y
+        cell_value, hit_col, hit_row = self.raycast(start_x, start_y, new_x + nose_x, new_y + nose_y)
+
+        self.x[live] = new_x
+        self.y[live] = new_y
+        self.age[live] += 1
+        self.frame[live] = (self.age[live] // LASER_FRAME_STEPS) % len(self.textures)
+
+        # If the laser pulse flies off-screen, remove it.
+        off_screen = ((new_x < view_left) | (new_x > view_left + view_width) |
+                      (new_y < view_bottom) | (new_y > view_bottom + view_height))
+        dead = (cell_value != CELL_EMPTY) | off_screen
+        self.alive[live[dead]] = False
+
+        melted = []
+        ice_hit = cell_value == CELL_ICE
+        if ice_hit.any():
+            # Two pulses hitting the same ice in one step only melt it once
+            for col, row in set(zip(hit_col[ice_hit].tolist(), hit_row[ice_hit].tolist())):
+                self.cells[row, col] = CELL_EMPTY
+                melted.append((col, row))
+
+        dead_slots = live[dead].tolist()
+        if dead_slots:
+            self._remove_sprites(dead_slots)
+            self.free.extend(dead_slots)
+        self.sync_sprites(live[~dead])
+        return melted
+
+    def _remove_sprites(self, slots):
+        """
+        Take the sprites of slots out of sprite_list in one pass. SpriteList.remove()
+        re-indexes the whole list for every sprite, which adds up when hundreds
+        of pulses stop in the same step. Depends on arcade 2.0.9's SpriteList
+        internals, see BATCH_REMOVE.
+        """
+        sprite_list = self.sprite_list
+        dead = {self.sprites[slot] for slot in slots}
+        if len(dead) == 1 or sprite_list.use_spatial_hash or not BATCH_REMOVE:
+            for laser in dead:
+                laser.kill()
+            return
+        sprite_list.sprite_list = [laser for laser in sprite_list.sprite_list if laser not in dead]
+        sprite_list.sprite_idx = {laser: index for index, laser in enumerate(sprite_list.sprite_list)}
+        sprite_list.vao = None
+        for laser in dead:
+            laser.sprite_lists.remove(sprite_list)
+
+    def sync_sprites(self, slots):
+        """ Copy position and animation frame into the sprites of the given live slots. """
+        sprites = self.sprites
+        textures = self.textures
+        for slot, x, y, frame in zip(slots.tolist(), self.x[slots].tolist(), self.y[slots].tolist(),
+                                     self.frame[slots].tolist()):
+            laser = sprites[slot]
+            laser.center_x = x
+            laser.center_y = y
+            if laser.texture is not textures[frame]:
+                laser.texture = textures[frame]
+
+    def raycast(self, start_x, start_y, end_x, end_y):
+        """
+        First non-empty cell along each segment, walking the cells it crosses
+        in order. Returns that cell's value (CELL_EMPTY if there was none)
+        and its col and row.
+        """
+        cells = self.cells
+        height, width = cells.shape
+        return raycast(lambda segments, row, col: cells[row, col], width, height, self.tile_size,
+                       start_x, start_y, end_x, end_y)
+
+
+def raycast(cell_values, width, height, tile_size, start_x, start_y, end_x, end_y):
+    """
+    First non-empty cell along each segment through a width x height grid,
+    walking the cells it crosses in order. cell_values(segments, row, col)
+    gives what is in the cells at row, col for the segments a boolean mask
+    picks out, so the segments needn't all cross the same grid. Returns the value of the cell
+    hit (CELL_EMPTY if there was none) and its col and row.
+    """
+    count = len(start_x)
+
+    col = np.floor(start_x / tile_size).astype(np.int64)
+    row = np.floor(start_y / tile_size).astype(np.int64)
+    end_col = np.floor(end_x / tile_size).astype(np.int64)
+    end_row = np.floor(end_y / tile_size).astype(np.int64)
+
+    delta_x = end_x - start_x
+    delta_y = end_y - start_y
+    step_col = np.sign(delta_x).astype(np.int64)
+    step_row = np.sign(delta_y).astype(np.int64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Fraction of the segment to cross one whole cell, and to reach the next cell border
+        t_delta_x = np.where(delta_x != 0, tile_size / np.abs(delta_x), np.inf)
+        t_delta_y = np.where(delta_y != 0, tile_size / np.abs(delta_y), np.inf)
+        next_x = (col + (step_col > 0)) * tile_size
+        next_y = (row + (step_row > 0)) * tile_size
+        t_max_x = np.where(delta_x != 0, (next_x - start_x) / delta_x, np.inf)
+        t_max_y = np.where(delta_y != 0, (next_y - start_y) / delta_y, np.inf)
+
+    cell_value = np.zeros(count, dtype=np.uint8)
+    hit_col = np.zeros(count, dtype=np.int64)
+    hit_row = np.zeros(count, dtype=np.int64)
+    searching = np.ones(count, dtype=bool)
+
+    crossings = int((np.abs(end_col - col) + np.abs(end_row - row)).max())
+    for _ in range(crossings + 1):
+        inside = searching & (col >= 0) & (col < width) & (row >= 0) & (row < height)
+        value = np.zeros(count, dtype=np.uint8)
+        value[inside] = cell_values(inside, row[inside], col[inside])
+        found = value != CELL_EMPTY
+        cell_value[found] = value[found]
+        hit_col[found] = col[found]
+        hit_row[found] = row[found]
+        searching &= ~found
+
+        # Step into whichever neighbouring cell the segment reaches first
+        across = t_max_x < t_max_y
+        entered_at = np.where(across, t_max_x, t_max_y)
+        col = np.where(across, col + step_col, col)
+        t_max_x = np.where(across, t_max_x + t_delta_x, t_max_x)
+        row = np.where(across, row, row + step_row)
+        t_max_y = np.where(across, t_max_y, t_max_y + t_delta_y)
+        # The segment ends before it gets into that cell
+        searching &= entered_at < 1.0
+        if not searching.any():
+            break
+    return cell_value, hit_col, hit_row
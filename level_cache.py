@@ -0,0 +1,296 @@
+# coding=utf-8
+import hashlib
+import struct
+import sys
+import xml.etree.ElementTree as ElementTree
+from array import array
+
+import arcade
+
+'''
+    Compiled level cache. The first load of a TMX file parses it (straight
+    from the XML for the maps Tiled saves for this game, with
+    arcade.read_tiled_map otherwise) and writes a compact binary copy next to
+    it (NLA-testLvL5.tmx -> NLA-testLvL5.tmx.cache). Later loads read the copy
+    back as packed arrays, until the TMX file's hash no longer matches.
+
+    Cache layout, little endian:
+        header     magic, format version, sha1 of the TMX file,
+                   map width/height, tile width/height, background color
+        textures   de-duplicated table of image paths
+        layers     table of layer names
+        tiles      packed arrays, one entry per tile:
+                   tile id (gid), texture index, layer index, center x, center y
+'''
+
+LEVEL_LAYERS = ("Background", "Walls", "Platforms", "NPC", "Ice", "Coins")
+CACHE_SUFFIX = ".cache"
+
+CACHE_MAGIC = b"RNRL"
+CACHE_VERSION = 1
+_HEADER = struct.Struct("<4sH20sIIIIB3B")
+_COUNT = struct.Struct("<I")
+_NAME_LENGTH = struct.Struct("<H")
+
+
+def file_hash(file_name):
+    with open(file_name, "rb") as file:
+        return hashlib.sha1(file.read()).digest()
+
+
+class CompiledLevel:
+    """ A level reduced to packed per-tile arrays plus the texture table they index into """
+
+    def __init__(self, width, height, tilewidth, tileheight, backgroundcolor, textures, layer_names):
+        self.width = width
+        self.height = height
+        self.tilewidth = tilewidth
+        self.tileheight = tileheight
+        self.backgroundcolor = backgroundcolor
+
+        # Image path for each texture index
+        self.textures = textures
+        self.layer_names = layer_names
+
+        # One entry per tile, tiles of a layer are stored next to each other
+        self.tile_ids = array("I")
+        self.texture_ids = array("H")
+        self.layer_ids = array("B")
+        self.center_xs = array("f")
+        self.center_ys = array("f")
+
+        self._layer_ranges = None
+        self._layers_int_data = None
+
+    def __len__(self):
+        return len(self.tile_ids)
+
+    def packed_arrays(self):
+        return self.tile_ids, self.texture_ids, self.layer_ids, self.center_xs, self.center_ys
+
+    def layer_range(self, layer_name):
+        """ range() over the tile indexes that belong to a layer. Unknown layers are empty. """
+        if self._layer_ranges is None:
+            self._layer_ranges = {}
+            start = 0
+            layer_ids = self.layer_ids
+            for index in range(1, len(layer_ids) + 1):
+                if index == len(layer_ids) or layer_ids[index] != layer_ids[start]:
+                    self._layer_ranges[self.layer_names[layer_ids[start]]] = range(start, index)
+                    start = index
+        return self._layer_ranges.get(layer_name, range(0))
+
+    @property
+    def layers_int_data(self):
+        """ Tile id grid for every layer, laid out like arcade's TiledMap.layers_int_data """
+        if self._layers_int_data is None:
+            self._layers_int_data = {}
+            for layer_name in self.layer_names:
+                grid = [[0] * self.width for _ in range(self.height)]
+                for index in self.layer_range(layer_name):
+                    column, row = self.grid_location(index)
+                    grid[row][column] = self.tile_ids[index]
+                self._layers_int_data[layer_name] = grid
+        return self._layers_int_data
+
+    def grid_location(self, index):
+        """ (column, row) of a tile, rows counted from the top of the map like in the TMX file """
+        column = int(self.center_xs[index] - self.tilewidth // 2) // self.tilewidth
+        row = self.height - 1 - int(self.center_ys[index] - self.tilewidth // 2) // self.tileheight
+        return column, row
+
+    def load_textures(self, scaling, loaded=None):
+        """
+        One texture per distinct image, shared by every tile that uses it.
+        loaded -- image path -> texture already loaded for another compilation of the map, reused as is
+        """
+        loaded = loaded or {}
+        return [loaded.get(source) or arcade.load_texture(source, scale=scaling) for source in self.textures]
+
+    def make_sprite(self, index, scaling, textures):
+        """ Sprite for a single tile, textures as returned by load_textures. """
+        tile_sprite = arcade.Sprite(scale=scaling,
+                                    center_x=self.center_xs[index] * scaling,
+                                    center_y=self.center_ys[index] * scaling)
+        tile_sprite.append_texture(textures[self.texture_ids[index]])
+        tile_sprite.set_texture(0)
+        return tile_sprite
+
+    def read_sprite_list(self, layer_name, sprite_list, scaling, textures=None):
+        """ Fill sprite_list with one sprite per tile of the layer. """
+        if textures is None:
+            textures = self.load_textures(scaling)
+        for index in self.layer_range(layer_name):
+            sprite_list.append(self.make_sprite(index, scaling, textures))
+
+    @classmethod
+    def from_tiled_map(cls, my_map, layer_names=LEVEL_LAYERS):
+        """ Pack the layers of a map read by arcade.read_tiled_map. """
+        layer_names = [name for name in layer_names if name in my_map.layers]
+        level = cls(my_map.width, my_map.height, my_map.tilewidth, my_map.tileheight,
+                    my_map.backgroundcolor, [], layer_names)
+
+        texture_index = {}
+        for layer_id, layer_name in enumerate(layer_names):
+            int_grid = my_map.layers_int_data[layer_name]
+            for row_index, row in enumerate(my_map.layers[layer_name]):
+                for column_index, grid_location in enumerate(row):
+                    if grid_location.tile is None:
+                        continue
+                    source = grid_location.tile.source
+                    if source not in texture_index:
+                        texture_index[source] = len(level.textures)
+                        level.textures.append(source)
+                    level.tile_ids.append(int_grid[row_index][column_index])
+                    level.texture_ids.append(texture_index[source])
+                    level.layer_ids.append(layer_id)
+                    level.center_xs.append(grid_location.center_x)
+                    level.center_ys.append(grid_location.center_y)
+        return level
+
+    @classmethod
+    def from_tmx(cls, map_name, layer_names=LEVEL_LAYERS):
+        """
+        Pack the layers of a TMX file straight from its XML, the same as
+        from_tiled_map() would, without arcade building an object for every
+        cell of every layer on the way. Reads the maps Tiled saves for this
+        game: orthogonal, right-down, csv layers and the tileset in the map.
+        Returns None for any other, read those with arcade.read_tiled_map.
+        """
+        map_tag = ElementTree.parse(map_name).getroot()
+        tileset_tags = map_tag.findall("./tileset")
+        layer_tags = {layer_tag.attrib["name"]: layer_tag for layer_tag in map_tag.findall("./layer")}
+        if (map_tag.attrib["orientation"] != "orthogonal" or map_tag.attrib["renderorder"] != "right-down" or
+                any("source" in tileset_tag.attrib for tileset_tag in tileset_tags) or
+                any(layer_tag.find("data").attrib["encoding"] != "csv" for layer_tag in layer_tags.values())):
+            return None
+
+        width = int(map_tag.attrib["width"])
+        height = int(map_tag.attrib["height"])
+        tilewidth = int(map_tag.attrib["tilewidth"])
+        tileheight = int(map_tag.attrib["tileheight"])
+        backgroundcolor = None
+        if "backgroundcolor" in map_tag.attrib:
+            color = map_tag.attrib["backgroundcolor"]
+            backgroundcolor = (int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16))
+        # Tile id -> image path. Like arcade, ids are the tileset's own plus one, whatever its firstgid
+        sources = {}
+        for tileset_tag in tileset_tags:
+            for tile_tag in tileset_tag.findall("tile"):
+                sources[int(tile_tag.attrib["id"]) + 1] = tile_tag.find("image").attrib["source"]
+
+        layer_names = [name for name in layer_names if name in layer_tags]
+        level = cls(width, height, tilewidth, tileheight, backgroundcolor, [], layer_names)
+        texture_index = {}
+        for layer_id, layer_name in enumerate(layer_names):
+            data_text = layer_tags[layer_name].find("data").text.strip()
+            for row_index, line in enumerate(data_text.split("\n")):
+                center_y = (height - row_index - 1) * tileheight + tilewidth // 2
+                for column_index, tile_id in enumerate(int(item) for item in line.split(",") if item):
+                    if not tile_id:
+                        continue
+                    source = sources.get(tile_id)
+                    if source is None:
+                        print(f"Warning, tried to load '{tile_id}' and it is not in the tileset.")
+                        continue
+                    if source not in texture_index:
+                        texture_index[source] = len(level.textures)
+                        level.textures.append(source)
+                    level.tile_ids.append(tile_id)
+                    level.texture_ids.append(texture_index[source])
+                    level.layer_ids.append(layer_id)
+                    level.center_xs.append(column_index * tilewidth + tilewidth // 2)
+                    level.center_ys.append(center_y)
+        return level
+
+    def save(self, file_name, source_hash):
+        color = self.backgroundcolor or (0, 0, 0)
+        with open(file_name, "wb") as file:
+            file.write(_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, source_hash,
+                                    self.width, self.height, self.tilewidth, self.tileheight,
+                                    self.backgroundcolor is not None, *color[:3]))
+            for names in (self.textures, self.layer_names):
+                file.write(_COUNT.pack(len(names)))
+                for name in names:
+                    encoded = name.encode("utf-8")
+                    file.write(_NAME_LENGTH.pack(len(encoded)))
+                    file.write(encoded)
+            file.write(_COUNT.pack(len(self)))
+            for packed in self.packed_arrays():
+                if sys.byteorder == "big":
+                    packed = array(packed.typecode, packed)
+                    packed.byteswap()
+                packed.tofile(file)
+
+    @classmethod
+    def load(cls, file_name, source_hash=None):
+        """ Read a cache file. Returns None if it is unreadable or wasn't built from source_hash. """
+        try:
+            with open(file_name, "rb") as file:
+                data = file.read()
+        except OSError:
+            return None
+        if len(data) < _HEADER.size:
+            return None
+
+        (magic, version, cached_hash, width, height, tilewidth, tileheight,
+         has_color, red, green, blue) = _HEADER.unpack_from(data)
+        if magic != CACHE_MAGIC or version != CACHE_VERSION:
+            return None
+        if source_hash is not None and cached_hash != source_hash:
+            return None
+
+        offset = _HEADER.size
+        tables = []
+        for _ in range(2):
+            count, = _COUNT.unpack_from(data, offset)
+            offset += _COUNT.size
+            names = []
+            for _ in range(count):
+                length, = _NAME_LENGTH.unpack_from(data, offset)
+                offset += _NAME_LENGTH.size
+                names.append(data[offset:offset + length].decode("utf-8"))
+                offset += length
+            tables.append(names)
+
+        backgroundcolor = (red, green, blue) if has_color else None
+        level = cls(width, height, tilewidth, tileheight, backgroundcolor, tables[0], tables[1])
+
+        tile_count, = _COUNT.unpack_from(data, offset)
+        offset += _COUNT.size
+        for packed in level.packed_arrays():
+            end = offset + tile_count * packed.itemsize
+            packed.frombytes(data[offset:end])
+            if sys.byteorder == "big":
+                packed.byteswap()
+            offset = end
+        if offset != len(data):
+            return None
+        return level
+
+
+def compile_level(map_name, scaling=1):
+    """ Parse the TMX file and (re)write its cache. """
+    level = CompiledLevel.from_tmx(map_name)
+    if level is None:
+        level = CompiledLevel.from_tiled_map(arcade.read_tiled_map(map_name, scaling))
+    try:
+        level.save(map_name + CACHE_SUFFIX, file_hash(map_name))
+    except OSError as e:
+        print(f"Warning, unable to write level cache for '{map_name}'.", e)
+    return level
+
+
+def load_level(map_name, scaling=1):
+    """ Load a level from its cache when the cache matches the TMX file, compiling it otherwise. """
+    level = CompiledLevel.load(map_name + CACHE_SUFFIX, file_hash(map_name))
+    if level is None:
+        level = compile_level(map_name, scaling)
+    return level
+
+
+if __name__ == "__main__":
+    for tmx_file in sys.argv[1:] or ["NLA-testLvL5.tmx"]:
+        compiled = compile_level(tmx_file)
+        print(f"{tmx_file}: {len(compiled)} tiles, {len(compiled.textures)} textures "
+              f"-> {tmx_file + CACHE_SUFFIX}")
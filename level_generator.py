@@ -0,0 +1,245 @@
+# coding=utf-8
+import argparse
+import math
+import random
+import re
+import xml.etree.ElementTree as ElementTree
+
+from level_cache import LEVEL_LAYERS
+
+'''
+    Synthetic levels for scale testing. Writes Tiled TMX maps of any size
+    with the tileset and layer names of NLA-testLvL5.tmx: a wall down each
+    side, a floor along the bottom, and platforms, iced trees, coins and
+    background trees scattered in between about as thickly as in the
+    hand-made level, or density times as thickly. The same seed always
+    writes the same map.
+
+    The tileset is copied from the template map, image sources and all, and
+    those are relative to the repository root, so the game (or a benchmark)
+    loading a generated map must run from there, wherever the map is saved.
+
+    Run from the repository root:
+        python level_generator.py out.tmx [--width 500 --height 200 | --scale 100] [--density 1] [--seed 0]
+'''
+
+TEMPLATE_MAP = "NLA-testLvL5.tmx"
+TEMPLATE_WIDTH = 50
+TEMPLATE_HEIGHT = 20
+
+# The player starts in this column and row (from the bottom), at 64 pixels a
+# tile, and falls from there, so nothing solid is put around it
+SPAWN_COLUMN = 6
+SPAWN_ROW = 12
+SPAWN_CLEAR = 3
+MIN_WIDTH = 16
+MIN_HEIGHT = SPAWN_ROW + 4
+
+# Tiles per cell of the template map's inside (its walls and floor left
+# out) for each layer at density 1
+TEMPLATE_DENSITY = {"Platforms": .16, "Ice": .037, "Coins": .045, "Background": .065}
+
+# Tile ids of the template's tileset, as its layers use them
+WALL_LEFT = {"top": 4, "body": 7, "band": 7, "bottom": 10}
+WALL_RIGHT = {"top": 6, "body": 9, "band": 8, "bottom": 11}
+# A band across the walls every so many rows, as in the template
+WALL_BAND_EVERY = 5
+FLOOR = 11
+# Two tile thick platforms: top row, then bottom row, each as left end, middle, right end
+THICK_PLATFORM = ((13, 14, 15), (10, 11, 12))
+THIN_PLATFORM = (16, 5, 17)
+BLOCK = 3
+ICED_TREE = 24
+COIN = 39
+BACKGROUND_TREES = (22, 23, 23, 25, 32, 40, 41, 42, 43, 44)
+NPC = 45
+
+
+class LevelGrid:
+    """ The tile ids of every layer of a map being generated, rows from the top as in the TMX file """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.layers = {name: bytearray(width * height) for name in LEVEL_LAYERS}
+
+    def _offset(self, column, row):
+        # Rows are counted from the bottom everywhere but in the file
+        return (self.height - row - 1) * self.width + column
+
+    def get(self, layer_name, column, row):
+        if not (0 <= column < self.width and 0 <= row < self.height):
+            return None
+        return self.layers[layer_name][self._offset(column, row)]
+
+    def set(self, layer_name, column, row, tile_id):
+        self.layers[layer_name][self._offset(column, row)] = tile_id
+
+    def solid(self, column, row):
+        return bool(self.get("Walls", column, row) or self.get("Platforms", column, row))
+
+    def free(self, left, bottom, right, top):
+        """ True if nothing solid is in the columns and rows between left and right, bottom and top, inclusive. """
+        if left < 0 or bottom < 0 or right >= self.width or top >= self.height:
+            return False
+        return not any(self.solid(column, row)
+                       for column in range(left, right + 1) for row in range(bottom, top + 1))
+
+    def count(self, layer_name):
+        layer = self.layers[layer_name]
+        return len(layer) - layer.count(0)
+
+
+def scaled_size(scale):
+    """ Width and height in tiles of a map with about scale times the cells of the template, the same shape. """
+    side = math.sqrt(scale)
+    return max(MIN_WIDTH, round(TEMPLATE_WIDTH * side)), max(MIN_HEIGHT, round(TEMPLATE_HEIGHT * side))
+
+
+def generate(width, height, density=1.0, seed=0):
+    """ A LevelGrid filled in for a width x height map. """
+    if width < MIN_WIDTH or height < MIN_HEIGHT:
+        raise ValueError(f"A level must be at least {MIN_WIDTH}x{MIN_HEIGHT} tiles, not {width}x{height}.")
+    rng = random.Random(seed)
+    grid = LevelGrid(width, height)
+    _add_walls(grid)
+    _add_floor(grid)
+    inside = (width - 4) * (height - 2)
+    _add_platforms(grid, rng, round(inside * TEMPLATE_DENSITY["Platforms"] * density))
+
+    # Trees, iced or not, stand on top of platforms, coins float a little above them
+    standing = [(column, row) for column, row in _platform_tops(grid) if not grid.solid(column, row)]
+    rng.shuffle(standing)
+    iced = round(inside * TEMPLATE_DENSITY["Ice"] * density)
+    for column, row in standing[:iced]:
+        grid.set("Ice", column, row, ICED_TREE)
+    for column, row in standing[iced:iced + round(inside * TEMPLATE_DENSITY["Background"] * density)]:
+        grid.set("Background", column, row, rng.choice(BACKGROUND_TREES))
+
+    floating = [(column, row + rng.randint(1, 2)) for column, row in standing]
+    floating = [(column, row) for column, row in floating
+                if grid.free(column, row, column, row) and not grid.get("Ice", column, row)]
+    for column, row in rng.sample(floating, min(len(floating), round(inside * TEMPLATE_DENSITY["Coins"] * density))):
+        grid.set("Coins", column, row, COIN)
+
+    # Someone to meet on the floor, a few steps from the start
+    grid.set("NPC", min(SPAWN_COLUMN + 8, width - 3), 1, NPC)
+    return grid
+
+
+def _add_walls(grid):
+    for row in range(grid.height):
+        for column, tiles in ((0, WALL_LEFT), (1, WALL_RIGHT), (grid.width - 2, WALL_LEFT), (grid.width - 1, WALL_RIGHT)):
+            if row == 0:
+                part = "bottom"
+            elif row == grid.height - 1:
+                part = "top"
+            elif row % WALL_BAND_EVERY == 0:
+                part = "band"
+            else:
+                part = "body"
+            grid.set("Walls", column, row, tiles[part])
+
+
+def _add_floor(grid):
+    for column in range(2, grid.width - 2):
+        grid.set("Platforms", column, 0, FLOOR)
+
+
+def _add_platforms(grid, rng, tile_budget):
+    placed = 0
+    attempts = 0
+    while placed < tile_budget and attempts < tile_budget * 20:
+        attempts += 1
+        kind = rng.random()
+        if kind < .5:
+            rows = THICK_PLATFORM
+            length = rng.randint(3, 10)
+        elif kind < .85:
+            rows = (THIN_PLATFORM, )
+            length = rng.randint(2, 5)
+        else:
+            rows = ((BLOCK, BLOCK, BLOCK), )
+            length = 1
+        left = rng.randint(2, grid.width - 3 - length)
+        right = left + length - 1
+        top = rng.randint(len(rows) + 2, grid.height - 4)
+        bottom = top - len(rows) + 1
+        # Room to walk under and stand on top, and a gap to the next platform along
+        if not grid.free(left - 1, bottom - 2, right + 1, top + 2):
+            continue
+        if (left - SPAWN_CLEAR <= SPAWN_COLUMN <= right + SPAWN_CLEAR and
+                bottom - SPAWN_CLEAR <= SPAWN_ROW):
+            continue
+        for row_offset, tiles in enumerate(rows):
+            for column in range(left, right + 1):
+                if length == 1:
+                    tile_id = tiles[1]
+                elif column == left:
+                    tile_id = tiles[0]
+                elif column == right:
+                    tile_id = tiles[2]
+                else:
+                    tile_id = tiles[1]
+                grid.set("Platforms", column, top - row_offset, tile_id)
+        placed += length * len(rows)
+
+
+def _platform_tops(grid):
+    """ (column, row) of every cell right above a platform tile, outside the walls. """
+    for row in range(grid.height - 1):
+        for column in range(2, grid.width - 2):
+            if grid.get("Platforms", column, row):
+                yield column, row + 1
+
+
+def write_tmx(grid, file_name, template=TEMPLATE_MAP):
+    """ Save a LevelGrid as a TMX file using the template map's tileset, tile size and background colour. """
+    with open(template, encoding="utf-8") as file:
+        template_text = file.read()
+    template_map = ElementTree.fromstring(template_text)
+    tileset = re.search(r"<tileset\b.*?</tileset>", template_text, re.S).group(0)
+
+    attributes = {name: template_map.get(name) for name in
+                  ("version", "tiledversion", "orientation", "renderorder", "tilewidth", "tileheight",
+                   "backgroundcolor")}
+    attributes.update(width=grid.width, height=grid.height, infinite=0,
+                      nextlayerid=len(LEVEL_LAYERS) + 1, nextobjectid=1)
+    width = grid.width
+    with open(file_name, "w", encoding="utf-8", newline="\n") as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        file.write("<map " + " ".join(f'{name}="{value}"' for name, value in attributes.items()
+                                      if value is not None) + ">\n")
+        file.write(" " + tileset + "\n")
+        for layer_id, layer_name in enumerate(LEVEL_LAYERS, 1):
+            tiles = grid.layers[layer_name]
+            file.write(f' <layer id="{layer_id}" name="{layer_name}" width="{grid.width}" height="{grid.height}">\n')
+            file.write('  <data encoding="csv">\n')
+            file.write(",\n".join(",".join(map(str, tiles[start:start + width]))
+                                  for start in range(0, len(tiles), width)))
+            file.write("\n</data>\n </layer>\n")
+        file.write("</map>\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic level with the tileset of " + TEMPLATE_MAP)
+    parser.add_argument("file_name")
+    parser.add_argument("--width", type=int, default=TEMPLATE_WIDTH, help="in tiles")
+    parser.add_argument("--height", type=int, default=TEMPLATE_HEIGHT, help="in tiles")
+    parser.add_argument("--scale", type=float,
+                        help="size the map for about this many times the tiles of " + TEMPLATE_MAP)
+    parser.add_argument("--density", type=float, default=1.0,
+                        help="platforms, trees and coins, relative to " + TEMPLATE_MAP)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    width, height = scaled_size(args.scale) if args.scale else (args.width, args.height)
+    grid = generate(width, height, args.density, args.seed)
+    write_tmx(grid, args.file_name)
+    tiles = sum(grid.count(name) for name in LEVEL_LAYERS)
+    print(f"{args.file_name}: {width}x{height}, {tiles} tiles, " +
+          ", ".join(f"{grid.count(name)} {name}" for name in LEVEL_LAYERS))
+
+
+if __name__ == "__main__":
+    main()
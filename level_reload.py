@@ -0,0 +1,154 @@
+# coding=utf-8
+import os
+
+import numpy as np
+
+from level_cache import LEVEL_LAYERS
+
+'''
+    Hot reloading of a level while it is being played. LevelWatcher polls
+    the TMX file's modification time, and once it was saved diff_levels()
+    compares the new compilation of the level with the one loaded, cell by
+    cell and layer by layer. The LevelDiff it returns lists just the tiles
+    that were added, taken out or given another image, and where every tile
+    that stayed moved to in the new level's tile arrays (the arrays are packed
+    layer by layer, so an edit shifts the indexes of every tile after it).
+    Simulation.reload_level() patches those into the level in place.
+'''
+
+# Seconds between two looks at the TMX file's modification time
+WATCH_INTERVAL = .5
+
+
+class LevelWatcher:
+    """ Notices a TMX file being saved, by polling its modification time """
+
+    def __init__(self, file_name, interval=WATCH_INTERVAL):
+        self.file_name = file_name
+        self.interval = interval
+        self.mtime = self._mtime()
+        self.waited = 0.0
+
+    def _mtime(self):
+        try:
+            return os.stat(self.file_name).st_mtime_ns
+        except OSError:
+            # Eg. between an editor deleting the file and writing it again
+            return None
+
+    def poll(self, delta_time):
+        """ True if the file changed since it was last seen, looking at most every interval seconds of delta_time. """
+        self.waited += delta_time
+        if self.waited < self.interval:
+            return False
+        self.waited = 0.0
+        mtime = self._mtime()
+        if mtime is None or mtime == self.mtime:
+            return False
+        self.mtime = mtime
+        return True
+
+
+class LayerDiff:
+    """ The tiles of one layer that differ between two compilations of a level """
+
+    def __init__(self, name):
+        self.name = name
+        # Indexes into the old level of tiles whose cell is empty now
+        self.removed = []
+        # Indexes into the new level of tiles in cells that were empty
+        self.added = []
+        # (old index, new index) of tiles that stayed in their cell with another image
+        self.retextured = []
+        # (col, row) of every cell above, row 0 at the bottom of the map
+        self.cells = set()
+
+    def __len__(self):
+        return len(self.removed) + len(self.added) + len(self.retextured)
+
+
+class LevelDiff:
+    """ What changed from one compilation of a level to the next, and where the tiles that stayed went """
+
+    def __init__(self, old, new):
+        self.old = old
+        self.new = new
+        # Layer name -> LayerDiff, for the layers that changed
+        self.layers = {}
+        # Index in the new level of each tile of the old one, -1 for the tiles taken out
+        self.index_map = np.full(len(old), -1, dtype=np.intp)
+        # Images the new level uses that the old one didn't
+        old_sources = set(old.textures)
+        self.new_sources = [source for source in new.textures if source not in old_sources]
+
+    def __len__(self):
+        """ Tiles changed, over every layer. """
+        return sum(len(layer) for layer in self.layers.values())
+
+    def cells(self, layer_names):
+        """ (col, row) of the cells that changed in any of the layers, row 0 at the bottom. """
+        cells = set()
+        for layer_name in layer_names:
+            if layer_name in self.layers:
+                cells.update(self.layers[layer_name].cells)
+        return cells
+
+
+def _cell_keys(level):
+    """ One number per tile, the same for the same cell of the same layer in any compilation of a map this size. """
+    tilewidth = level.tilewidth
+    # Vectorized CompiledLevel.grid_location()
+    columns = ((np.frombuffer(level.center_xs, dtype=np.float32).astype(np.float64) - tilewidth // 2)
+               .astype(np.int64) // tilewidth)
+    rows = (level.height - 1 - (np.frombuffer(level.center_ys, dtype=np.float32).astype(np.float64) - tilewidth // 2)
+            .astype(np.int64) // level.tileheight)
+    # By position in LEVEL_LAYERS, a layer left out of one of the maps doesn't renumber the others
+    layer_order = np.array([LEVEL_LAYERS.index(name) for name in level.layer_names], dtype=np.int64)
+    layers = layer_order[np.frombuffer(level.layer_ids, dtype=np.uint8)]
+    return (layers * level.height + rows) * level.width + columns, columns, rows, layers
+
+
+def diff_levels(old, new):
+    """
+    Compare two compilations of a map, tile by tile. Returns a LevelDiff, or
+    None if the map changed size and the old level can't be patched into the new.
+    """
+    if (old.width, old.height, old.tilewidth, old.tileheight) != (new.width, new.height, new.tilewidth, new.tileheight):
+        return None
+    diff = LevelDiff(old, new)
+    old_keys, old_columns, old_rows, old_layers = _cell_keys(old)
+    new_keys, new_columns, new_rows, new_layers = _cell_keys(new)
+
+    # Tiles in the same cell of the same layer in both
+    _, old_kept, new_kept = np.intersect1d(old_keys, new_keys, assume_unique=True, return_indices=True)
+    diff.index_map[old_kept] = new_kept
+
+    # Texture ids are positions in each level's own table, compare the images they stand for
+    new_texture_id = {source: texture_id for texture_id, source in enumerate(new.textures)}
+    old_to_new_texture = np.array([new_texture_id.get(source, -1) for source in old.textures], dtype=np.int64)
+    old_textures = np.frombuffer(old.texture_ids, dtype=np.uint16).astype(np.int64)
+    new_textures = np.frombuffer(new.texture_ids, dtype=np.uint16).astype(np.int64)
+    retextured = old_to_new_texture[old_textures[old_kept]] != new_textures[new_kept]
+
+    removed = np.flatnonzero(diff.index_map < 0)
+    added = np.setdiff1d(np.arange(len(new)), new_kept, assume_unique=True)
+
+    def layer_diff(layer):
+        name = LEVEL_LAYERS[layer]
+        if name not in diff.layers:
+            diff.layers[name] = LayerDiff(name)
+        return diff.layers[name]
+
+    for index in removed.tolist():
+        layer = layer_diff(old_layers[index])
+        layer.removed.append(index)
+        layer.cells.add((int(old_columns[index]), old.height - int(old_rows[index]) - 1))
+    for index in added.tolist():
+        layer = layer_diff(new_layers[index])
+        layer.added.append(index)
+        layer.cells.add((int(new_columns[index]), new.height - int(new_rows[index]) - 1))
+    for old_index, new_index in zip(old_kept[retextured].tolist(), new_kept[retextured].tolist()):
+        layer = layer_diff(new_layers[new_index])
+        layer.retextured.append((old_index, new_index))
+        layer.cells.add((int(new_columns[new_index]), new.height - int(new_rows[new_index]) - 1))
+    return diff
@@ -0,0 +1,181 @@
+# coding=utf-8
+from array import array
+
+'''
+    Chunked level streaming. The map is cut into square chunks of tiles and
+    only the chunks around the viewport have sprites. Each streamed layer's
+    sprite list holds just the loaded chunks, so drawing
+    and updating those lists never touches the far side of the map.
+'''
+
+CHUNK_TILES = 16
+# Chunks within this many pixels of the viewport are loaded...
+LOAD_MARGIN = 256
+# ...and only unloaded once they are this far away, so walking back and forth
+# across a chunk border doesn't reload the same chunk every frame
+UNLOAD_MARGIN = 1024
+
+
+class StreamedLayer:
+    """ A level layer whose sprites live in sprite_list only while their chunk is loaded """
+
+    def __init__(self, name, sprite_list, draw_list=None):
+        self.name = name
+        self.sprite_list = sprite_list
+        # Extra list the sprites are drawn from, when several layers share one batch
+        self.draw_list = draw_list
+
+        # (chunk_x, chunk_y) -> indexes into the level's tile arrays
+        self.chunk_tiles = {}
+        # (chunk_x, chunk_y) -> sprites built for that chunk
+        self.chunk_sprites = {}
+
+
+class LevelStreamer:
+    """ Loads and unloads the chunks of a CompiledLevel as the viewport scrolls """
+
+    def __init__(self, level, scaling, textures, view_width, view_height, chunk_tiles=CHUNK_TILES):
+        self.level = level
+        self.scaling = scaling
+        self.textures = textures
+        self.view_width = view_width
+        self.view_height = view_height
+        self.chunk_pixels = chunk_tiles * level.tilewidth * scaling
+
+        self.layers = []
+        self.loaded = set()
+        self._last_view = None
+
+    def add_layer(self, name, sprite_list, draw_list=None):
+        """ Stream one layer of the level into sprite_list, which should start out empty. """
+        layer = StreamedLayer(name, sprite_list, draw_list)
+        self._index_layer(layer)
+        self.layers.append(layer)
+
+        for chunk in self.loaded:
+            self._load_layer_chunk(layer, chunk)
+        return layer
+
+    def _index_layer(self, layer):
+        layer.chunk_tiles = {}
+        for index in self.level.layer_range(layer.name):
+            chunk = self.chunk_of(index)
+            tiles = layer.chunk_tiles.get(chunk)
+            if tiles is None:
+                tiles = layer.chunk_tiles[chunk] = array("I")
+            tiles.append(index)
+
+    def chunk_of(self, index):
+        """ (chunk_x, chunk_y) of the chunk a tile of the level belongs to. """
+        level = self.level
+        scaled_chunk = self.chunk_pixels / self.scaling
+        return int(level.center_xs[index] // scaled_chunk), int(level.center_ys[index] // scaled_chunk)
+
+    def _chunk_range(self, view_left, view_bottom, margin):
+        chunk_pixels = self.chunk_pixels
+        min_x = int((view_left - margin) // chunk_pixels)
+        max_x = int((view_left + self.view_width + margin) // chunk_pixels)
+        min_y = int((view_bottom - margin) // chunk_pixels)
+        max_y = int((view_bottom + self.view_height + margin) // chunk_pixels)
+        return min_x, max_x, min_y, max_y
+
+    def update(self, view_left, view_bottom):
+        """ Load the chunks the viewport is getting close to, unload the ones far behind. """
+        view = (view_left, view_bottom)
+        if view == self._last_view:
+            return
+        self._last_view = view
+
+        min_x, max_x, min_y, max_y = self._chunk_range(view_left, view_bottom, UNLOAD_MARGIN)
+        for chunk in list(self.loaded):
+            if not (min_x <= chunk[0] <= max_x and min_y <= chunk[1] <= max_y):
+                self.unload_chunk(chunk)
+
+        min_x, max_x, min_y, max_y = self._chunk_range(view_left, view_bottom, LOAD_MARGIN)
+        for chunk_x in range(min_x, max_x + 1):
+            for chunk_y in range(min_y, max_y + 1):
+                if (chunk_x, chunk_y) not in self.loaded:
+                    self.load_chunk((chunk_x, chunk_y))
+
+    def load_chunk(self, chunk):
+        self.loaded.add(chunk)
+        for layer in self.layers:
+            self._load_layer_chunk(layer, chunk)
+
+    def _load_layer_chunk(self, layer, chunk):
+        tiles = layer.chunk_tiles.get(chunk)
+        if tiles is None:
+            return
+        layer.chunk_sprites[chunk] = [self._load_tile(layer, index) for index in tiles]
+
+    def _load_tile(self, layer, index):
+        tile_sprite = self.level.make_sprite(index, self.scaling, self.textures)
+        tile_sprite.tile_index = index
+        layer.sprite_list.append(tile_sprite)
+        if layer.draw_list is not None:
+            layer.draw_list.append(tile_sprite)
+        return tile_sprite
+
+    def unload_chunk(self, chunk):
+        self.loaded.discard(chunk)
+        for layer in self.layers:
+            sprites = layer.chunk_sprites.pop(chunk, None)
+            if sprites is None:
+                continue
+            for tile_sprite in sprites:
+                tile_sprite.kill()
+
+    def restore(self, view_left, view_bottom):
+        """
+        Load the chunks around the view as a fresh start would have them. The
+        sprites of chunks still loaded are kept as they are.
+        """
+        # Only the chunks a fresh start would have, not those kept loaded on the way out
+        min_x, max_x, min_y, max_y = self._chunk_range(view_left, view_bottom, LOAD_MARGIN)
+        for chunk in list(self.loaded):
+            if not (min_x <= chunk[0] <= max_x and min_y <= chunk[1] <= max_y):
+                self.unload_chunk(chunk)
+        self._last_view = None
+        self.update(view_left, view_bottom)
+
+    def reload(self, diff, textures):
+        """
+        Switch to a new compilation of the level (a LevelDiff from it to the
+        one loaded), changing only the sprites of the tiles that changed in
+        the loaded chunks: the ones taken out are killed, the new ones built
+        and the ones with another image re-textured. Every other sprite stays
+        as it is, with its tile_index moved to where its tile is in the new
+        level.
+        """
+        index_map = diff.index_map
+        self.level = diff.new
+        self.textures = textures
+        for layer in self.layers:
+            self._index_layer(layer)
+            for chunk, sprites in layer.chunk_sprites.items():
+                kept = []
+                for tile_sprite in sprites:
+                    index = int(index_map[tile_sprite.tile_index])
+                    if index < 0:
+                        tile_sprite.kill()
+                        continue
+                    tile_sprite.tile_index = index
+                    kept.append(tile_sprite)
+                layer.chunk_sprites[chunk] = kept
+
+            layer_diff = diff.layers.get(layer.name)
+            if layer_diff is None:
+                continue
+            if layer_diff.retextured:
+                retextured = {new_index for old_index, new_index in layer_diff.retextured}
+                for sprites in layer.chunk_sprites.values():
+                    for tile_sprite in sprites:
+                        if tile_sprite.tile_index in retextured:
+                            tile_sprite.texture = textures[diff.new.texture_ids[tile_sprite.tile_index]]
+            for index in layer_diff.added:
+                chunk = self.chunk_of(index)
+                if chunk in self.loaded:
+                    layer.chunk_sprites.setdefault(chunk, []).append(self._load_tile(layer, index))
+
+    def loaded_sprite_count(self):
+        return sum(len(layer.sprite_list) for layer in self.layers)
@@ -0,0 +1,199 @@
+# coding=utf-8
+import csv
+import json
+import time
+from array import array
+
+'''
+    Per-phase frame profiler. Each named phase keeps its last PROFILE_FRAMES
+    timings in a ring buffer, so the stats always describe the recent past and
+    memory doesn't grow over a long session. The trace can be written out as
+    JSON or CSV to compare one build with another.
+
+    Draw phases time how long it takes to submit the draw, not how long the
+    GPU spends on it.
+'''
+
+PROFILE_FRAMES = 600
+PERCENTILES = (50, 95, 99)
+# Frames between refreshes of the overlay text, so it stays readable
+OVERLAY_REFRESH = 30
+
+
+class RingBuffer:
+    """ The last capacity timings of one phase, with the frame each was taken in """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.values = array("d", [0.0]) * capacity
+        self.frames = array("I", [0]) * capacity
+        self.count = 0
+        self.next = 0
+
+    def append(self, frame, value):
+        self.values[self.next] = value
+        self.frames[self.next] = frame
+        self.next = (self.next + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def samples(self):
+        """ (frame, value) pairs, oldest first. """
+        start = (self.next - self.count) % self.capacity
+        for i in range(self.count):
+            index = (start + i) % self.capacity
+            yield self.frames[index], self.values[index]
+
+
+def percentile(sorted_values, percent):
+    """ Nearest-rank percentile of an already sorted sequence. """
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(percent / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class _Timer:
+    """ Context manager that adds the time spent inside it to a phase """
+
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.record(self.name, (time.perf_counter() - self.start) * 1000)
+
+
+class _NullTimer:
+    """ Stands in for _Timer while the profiler is disabled """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return None
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class FrameProfiler:
+    """ Times named phases of each frame, in milliseconds """
+
+    def __init__(self, capacity=PROFILE_FRAMES, enabled=True):
+        self.capacity = capacity
+        self.enabled = enabled
+        # Phase name -> RingBuffer, in the order the phases were first seen
+        self.phases = {}
+        self.frame = 0
+        self._timers = {}
+        self._last_frame_time = None
+
+    def phase(self, name):
+        """ with profiler.phase("physics"): ... """
+        if not self.enabled:
+            return _NULL_TIMER
+        timer = self._timers.get(name)
+        if timer is None:
+            timer = self._timers[name] = _Timer(self, name)
+        return timer
+
+    def record(self, name, ms):
+        buffer = self.phases.get(name)
+        if buffer is None:
+            buffer = self.phases[name] = RingBuffer(self.capacity)
+        buffer.append(self.frame, ms)
+
+    def end_frame(self):
+        """ Call once a frame. Records the whole frame, from one call to the next, as "frame". """
+        now = time.perf_counter()
+        if self.enabled and self._last_frame_time is not None:
+            self.record("frame", (now - self._last_frame_time) * 1000)
+        self._last_frame_time = now
+        self.frame += 1
+
+    def stats(self, name):
+        """ Mean, max and PERCENTILES of a phase's recorded timings. """
+        buffer = self.phases.get(name)
+        values = sorted(value for frame, value in buffer.samples()) if buffer else []
+        result = {"count": len(values),
+                  "mean": sum(values) / len(values) if values else 0.0,
+                  "max": values[-1] if values else 0.0}
+        for percent in PERCENTILES:
+            result[f"p{percent}"] = percentile(values, percent)
+        return result
+
+    def export(self, file_name):
+        """ Write the trace and stats to file_name, as CSV if it ends in .csv and as JSON otherwise. """
+        if file_name.lower().endswith(".csv"):
+            self.export_csv(file_name)
+        else:
+            self.export_json(file_name)
+
+    def export_json(self, file_name):
+        trace = {"frames": self.frame,
+                 "capacity": self.capacity,
+                 "phases": {}}
+        for name, buffer in self.phases.items():
+            samples = list(buffer.samples())
+            trace["phases"][name] = {"stats": self.stats(name),
+                                     "frames": [frame for frame, value in samples],
+                                     "ms": [round(value, 4) for frame, value in samples]}
+        with open(file_name, "w") as file:
+            json.dump(trace, file, indent=1)
+
+    def export_csv(self, file_name):
+        with open(file_name, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["frame", "phase", "ms"])
+            for name, buffer in self.phases.items():
+                for frame, value in buffer.samples():
+                    writer.writerow([frame, name, f"{value:.4f}"])
+
+
+class ProfilerOverlay:
+    """ A line of HUD text per phase with its stats, toggled on and off """
+
+    def __init__(self, hud, profiler, x, y, font_size=12, color=(0, 0, 0)):
+        self.hud = hud
+        self.profiler = profiler
+        self.x = x
+        self.y = y
+        self.font_size = font_size
+        self.color = color
+        self.visible = False
+        # Phase name -> HudText, added the first time a phase shows up
+        self.lines = {}
+
+    def toggle(self):
+        self.visible = not self.visible
+        if not self.visible:
+            for line in self.lines.values():
+                line.set("")
+
+    def update(self):
+        """ Refresh the text every OVERLAY_REFRESH frames while it is visible. """
+        if not self.visible:
+            return
+        profiler = self.profiler
+        if self.lines and profiler.frame % OVERLAY_REFRESH != 0:
+            return
+        for name in profiler.phases:
+            line = self.lines.get(name)
+            if line is None:
+                line = self.hud.add_text(self.x, self.y, self.font_size, self.color)
+                line.y -= line.font.line_height * len(self.lines)
+                self.lines[name] = line
+            stats = profiler.stats(name)
+            line.set(f"{name}: mean {stats['mean']:.2f}  p50 {stats['p50']:.2f}  p95 {stats['p95']:.2f}  "
+                     f"p99 {stats['p99']:.2f}  max {stats['max']:.2f} ms")
@@ -1,48 +1,88 @@
 # coding=utf-8
-import pyglet
 import arcade
 import os
 import time
-import math
+
+from assets import IMAGE, MUSIC, SOUND, AssetLoader, AssetManifest
+from baking import StaticLayerBaker
+from frame_pacing import RENDER_RATE, UPDATE_RATE, FramePacer, QualityGovernor
+from game_state import (GAME_OVER, GAME_OVER_MUSIC, LEVEL_MUSIC, LOADING, PAUSE_MUSIC, PAUSED, PLAYING,
+                        GameOverState, LoadingState, Music, PausedState, PlayingState, StateMachine)
+from hud import Hud
+from input_trace import KEY_PRESS, KEY_RELEASE, MOUSE_PRESS, InputTrace, apply_input
+from level_cache import load_level
+from level_reload import LevelWatcher
+from profiler import OVERLAY_REFRESH, FrameProfiler, ProfilerOverlay
+from sfx import SfxMixer
+from simulation import (EVENT_COIN, EVENT_GAME_OVER, EVENT_ICE_HIT, EVENT_JUMP, EVENT_LASER, EVENT_WALL_HIT,
+                        LEVEL_MAP, SCREEN_HEIGHT, SCREEN_WIDTH, SIMULATION_STEP, SPRITE_SCALING, Simulation,
+                        image_files)
 
 '''
     2019 © rocknroo.com
 '''
 
 SCREEN_TITLE = "ROCK & R.O.O."
-SCREEN_WIDTH = 1200
-SCREEN_HEIGHT = 720
-
-MAP_HEIGHT = 2560
-MAP_WIDTH = 6400
-
-SPRITE_SCALING = .5
-SPRITE_PIXEL_SIZE = 128
-GRID_PIXEL_SIZE = (SPRITE_PIXEL_SIZE * SPRITE_SCALING)
-
-# How many pixels to keep as a minimum margin between the character
-# and the edge of the screen.
-VIEWPORT_MARGIN_TOP = 256
-VIEWPORT_MARGIN_BOTTOM = 256
-VIEWPORT_RIGHT_MARGIN = 512
-VIEWPORT_LEFT_MARGIN = 512
 
-# Physics
-MOVEMENT_SPEED = 4
-JUMP_SPEED = 16
-GRAVITY = 1
-LASER_SPEED = 20
-
-
-def read_sprite_list(grid, sprite_list):
-    for row in grid:
-        for grid_location in row:
-            if grid_location.tile is not None:
-                tile_sprite = arcade.Sprite(grid_location.tile.source, SPRITE_SCALING)
-                tile_sprite.center_x = grid_location.center_x * SPRITE_SCALING
-                tile_sprite.center_y = grid_location.center_y * SPRITE_SCALING
-                # print(f"{grid_location.tile.source} -- ({tile_sprite.center_x:4}, {tile_sprite.center_y:4})")
-                sprite_list.append(tile_sprite)
+# Write the profiler's timing trace here when the window closes, as CSV if the
+# name ends in .csv and JSON otherwise
+PROFILE_TRACE_ENV = "ROCKNROO_PROFILE"
+# Record the game's input here when the window closes, replay it with input_trace.py
+INPUT_TRACE_ENV = "ROCKNROO_RECORD"
+# Set to 1 to draw the background, walls and platforms from textures baked once per level
+BAKE_STATIC_ENV = "ROCKNROO_BAKE"
+# TMX map to play instead of LEVEL_MAP, eg. one written by level_generator.py
+LEVEL_MAP_ENV = "ROCKNROO_LEVEL"
+# Set to 1 to reload the level in place whenever its TMX file is saved, eg. from Tiled
+WATCH_LEVEL_ENV = "ROCKNROO_WATCH"
+# Updates a second, and frames a second drawn at most (0 for every update), see frame_pacing.py
+UPDATE_RATE_ENV = "ROCKNROO_UPDATE_RATE"
+RENDER_RATE_ENV = "ROCKNROO_RENDER_RATE"
+# Set to 1 to wait for the display's refresh before showing a frame, 0 not to, unset for the platform's default
+VSYNC_ENV = "ROCKNROO_VSYNC"
+# Set to 1 to turn the player's animation and HUD refreshes down while frames go over budget
+GOVERNOR_ENV = "ROCKNROO_GOVERNOR"
+
+MENU_MASK_FILE = "images/background_mask3.png"
+PAUSED_MASK_FILE = "images/paused_mask.png"
+# Music track -> file
+MUSIC_FILES = {LEVEL_MUSIC: "sounds/music.wav",
+               PAUSE_MUSIC: "sounds/paused.wav",
+               GAME_OVER_MUSIC: "sounds/gameover1.wav"}
+# Simulation event -> sound effect file
+SOUND_FILES = {EVENT_COIN: "sounds/coin1.wav",
+               EVENT_JUMP: "sounds/jump1.wav",
+               EVENT_WALL_HIT: "sounds/hit4.wav",
+               EVENT_ICE_HIT: "sounds/hit2.wav",
+               EVENT_LASER: "sounds/laser1.wav"}
+
+
+def env_rate(name, default):
+    """ A rate a second from the environment variable name, default if it is unset or not a number. """
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        rate = float(value)
+    except ValueError:
+        rate = -1
+    if rate < 0:
+        print(f"Warning, {name}={value} is not a rate, using {default}.")
+        return default
+    return rate
+
+
+def build_manifest(map_name=LEVEL_MAP):
+    """ Everything the game loads before its first frame: the level's tileset, the characters, menus and sounds. """
+    manifest = AssetManifest()
+    manifest.add_images(image_files(load_level(map_name, SPRITE_SCALING)))
+    manifest.add(IMAGE, MENU_MASK_FILE)
+    manifest.add(IMAGE, PAUSED_MASK_FILE)
+    for file_name in MUSIC_FILES.values():
+        manifest.add(MUSIC, file_name)
+    for file_name in SOUND_FILES.values():
+        manifest.add(SOUND, file_name)
+    return manifest
 
 
 class MyGame(arcade.Window):
@@ -61,54 +101,57 @@ class MyGame(arcade.Window):
         file_path = os.path.dirname(os.path.abspath(__file__))
         os.chdir(file_path)
 
-        # Sprite lists
-        self.my_map = None
-        self.background_list = None
-        self.wall_list = None
-        self.platform_list = None
-        self.laser_list = None
+        # Level, player, NPC's and everything else the game logic moves around
+        self.simulation = None
+        # Draws the static layers from baked tiles instead of static_list, when enabled
+        self.bake_static = os.environ.get(BAKE_STATIC_ENV) == "1"
+        self.baker = None
+        self.map_name = os.environ.get(LEVEL_MAP_ENV) or LEVEL_MAP
+        # Polls the TMX file for edits, when WATCH_LEVEL_ENV is set
+        self.level_watcher = None
+        # Every input the simulation got, by step
+        self.input_trace = None
+        # Decodes the images and sounds while the loading screen shows
+        self.assets = None
+        self.loading_hud = None
+        self.loading_text = None
+        # When the window opened, to time how long until the game's first frame
+        self.started = time.perf_counter()
+        self.first_frame_drawn = False
 
         # Menu resources
         self.pause_menu = None
 
-        # Prepare player & player_team
-        self.player = None
-        self.player_facing_direction = "right"
-        self.player_team = None
-        self.player_list = None
-
-        # Prepare NPC's
-        self.npc_list = None
-        self.tiki_sprite = None
-        self.coin_list = None
-        self.ice_list = None
-
-        # Gravity & Collision
-        self.physics_engine = None
-
-        # Scoring, Status, Upgrade, Bonus, and Experience info
-        self.score = 0
-        self.trees_saved = 0
-
-        # Viewport(viewable area within window)
+        # Viewport(viewable area within window), as last drawn
         self.view_left = 0
         self.view_bottom = 0
 
-        # Game state info
-        self.game_over = False
-        self.paused_state = False
-        self.previously_paused = False
+        # Game state eg. playing, paused, game over, cut scene
+        self.states = None
 
         # Framerate & Time
         self.last_time = None
         self.frame_count = 0
         self.fps_message = None
-
-        # Background sounds (MUSIC)
-        self.music_player = None
-        self.level_music = None
-        self.pause_menu_music = None
-        self.game_over_music = None
+        self.profiler = FrameProfiler()
+        self.profiler_overlay = None
+        self.hud_pacing = None
+
+        # Fixed steps per update and which updates get drawn, at the rates asked for
+        update_rate = env_rate(UPDATE_RATE_ENV, UPDATE_RATE) or UPDATE_RATE
+        render_rate = env_rate(RENDER_RATE_ENV, RENDER_RATE)
+        self.pacer = FramePacer(SIMULATION_STEP, update_rate, render_rate, profiler=self.profiler)
+        if os.environ.get(GOVERNOR_ENV) == "1":
+            self.pacer.governor = QualityGovernor(self.pacer.budget_ms)
+        self.set_update_rate(1 / update_rate)
+        vsync = os.environ.get(VSYNC_ENV)
+        if vsync:
+            self.set_vsync(vsync == "1")
+        # The last update isn't drawn, the frame before it stays on screen
+        self.skip_frame = False
+
+        # Background sounds (MUSIC), switched by the states' enter hooks
+        self.music = None
 
         # Game sounds (SFX)
         self.collect_coin_sound = None
@@ -116,6 +159,14 @@ class MyGame(arcade.Window):
         self.wall_hit_sound = None
         self.ice_hit_sound = None
         self.gun_sound = None
+        # Plays the sound for each simulation event on a fixed pool of voices
+        self.sfx = None
+
+        # Heads-up display text
+        self.hud = None
+        self.hud_fps = None
+        self.hud_coins = None
+        self.hud_trees = None
 
         # Static Graphics menu, buttons, mini-map, etc.
         self.menu_mask = None
@@ -131,418 +182,351 @@ class MyGame(arcade.Window):
         '''
 
     def setup(self):
-        """ Set up the game and initialize the variables. """
-
-        # Sprite lists
-        # do not use is_static=True for animated sprites
-        self.player_list = arcade.SpriteList()
-        self.npc_list = arcade.SpriteList()
-        self.wall_list = arcade.SpriteList(is_static=True)
-        self.platform_list = arcade.SpriteList(is_static=True)
-        self.background_list = arcade.SpriteList(is_static=True)
-        self.coin_list = arcade.SpriteList()
-        self.ice_list = arcade.SpriteList()
-        self.laser_list = arcade.SpriteList()
-
-        # Set up the player
-        self.score = 0
-        self.player = arcade.AnimatedWalkingSprite()
-
-        character_scale = .5
-        self.player.stand_right_textures = []
-        self.player.stand_right_textures.append(arcade.load_texture("images/rock_stand_right.png",
-                                                                    scale=character_scale))
-        self.player.stand_left_textures = []
-        self.player.stand_left_textures.append(arcade.load_texture("images/rock_stand_left.png",
-                                                                   scale=character_scale))
-
-        self.player.walk_right_textures = []
-
-        self.player.walk_right_textures.append(
-            arcade.load_texture("images/rock_walk_right_001.png", scale=character_scale))
-        self.player.walk_right_textures.append(
-            arcade.load_texture("images/rock_walk_right_002.png", scale=character_scale))
-        self.player.walk_right_textures.append(
-            arcade.load_texture("images/rock_walk_right_003.png", scale=character_scale))
-        self.player.walk_right_textures.append(
-            arcade.load_texture("images/rock_walk_right_004.png", scale=character_scale))
-        self.player.walk_right_textures.append(
-            arcade.load_texture("images/rock_walk_right_005.png", scale=character_scale))
-        self.player.walk_right_textures.append(
-            arcade.load_texture("images/rock_walk_right_006.png", scale=character_scale))
-        self.player.walk_right_textures.append(
-            arcade.load_texture("images/rock_walk_right_007.png", scale=character_scale))
-        self.player.walk_right_textures.append(
-            arcade.load_texture("images/rock_walk_right_008.png", scale=character_scale))
-        self.player.walk_right_textures.append(
-            arcade.load_texture("images/rock_walk_right_009.png", scale=character_scale))
-
-        self.player.walk_left_textures = []
-
-        self.player.walk_left_textures.append(
-            arcade.load_texture("images/rock_walk_left_001.png", scale=character_scale))
-        self.player.walk_left_textures.append(
-            arcade.load_texture("images/rock_walk_left_002.png", scale=character_scale))
-        self.player.walk_left_textures.append(
-            arcade.load_texture("images/rock_walk_left_003.png", scale=character_scale))
-        self.player.walk_left_textures.append(
-            arcade.load_texture("images/rock_walk_left_004.png", scale=character_scale))
-        self.player.walk_left_textures.append(
-            arcade.load_texture("images/rock_walk_left_005.png", scale=character_scale))
-        self.player.walk_left_textures.append(
-            arcade.load_texture("images/rock_walk_left_006.png", scale=character_scale))
-        self.player.walk_left_textures.append(
-            arcade.load_texture("images/rock_walk_left_007.png", scale=character_scale))
-        self.player.walk_left_textures.append(
-            arcade.load_texture("images/rock_walk_left_008.png", scale=character_scale))
-        self.player.walk_left_textures.append(
-            arcade.load_texture("images/rock_walk_left_009.png", scale=character_scale))
-
-        self.player.texture_change_distance = 20
-
-        # Read in the tiled map
-        map_name = "NLA-testLvL5.tmx"
-        self.my_map = arcade.read_tiled_map(map_name, SPRITE_SCALING)
-
-        # Grab the layer of items we can't move through
-        map_array = self.my_map.layers_int_data["Walls"]
-
-        # Calculate the right edge of the my_map in pixels
-        self.end_of_map = len(map_array[0]) * GRID_PIXEL_SIZE
-        self.player.boundary_left = 128
-        self.player.boundary_right = self.end_of_map - 128
-
-        # Starting position of the player
-        self.player.center_x = 384
-        self.player.center_y = 768
-        self.player.scale = 0.5
-
-        self.player_list.append(self.player)
-
-        # --- Background ---
-        read_sprite_list(self.my_map.layers["Background"], self.background_list)
-        # --- Walls ---
-        read_sprite_list(self.my_map.layers["Walls"], self.wall_list)
-        # --- Platforms ---
-        read_sprite_list(self.my_map.layers["Platforms"], self.platform_list)
-        # --- Static NPC's ---
-        read_sprite_list(self.my_map.layers["NPC"], self.npc_list)
-        # --- Ice ---
-        read_sprite_list(self.my_map.layers["Ice"], self.ice_list)
-        # --- Coins ---
-        read_sprite_list(self.my_map.layers["Coins"], self.coin_list)
-        for coin in self.coin_list:
-            coin.angle = 0
-            coin.change_angle = 5
+        """ Start loading the assets in the background, the loading screen shows until finish_setup(). """
+        self.loading_hud = Hud(SCREEN_WIDTH, SCREEN_HEIGHT)
+        self.loading_text = self.loading_hud.add_text(SCREEN_WIDTH // 2 - 80, SCREEN_HEIGHT // 2 + 30, 20,
+                                                      arcade.color.WHITE, "Loading {:3.0f}%")
+        self.music = Music()
+        self.sfx = SfxMixer()
+        self.states = StateMachine([LoadingState(self), PlayingState(self), PausedState(self), GameOverState(self)])
+        self.states.change(LOADING)
+        self.assets = AssetLoader(build_manifest(self.map_name))
+        self.assets.start()
+
+    def finish_setup(self):
+        """ Set up the game and initialize the variables, once the assets are loaded. """
+
+        self.simulation = Simulation(self.map_name, profiler=self.profiler, stream_static=not self.bake_static)
+        self.simulation.setup()
+        self.pacer.reset()
+        self.input_trace = InputTrace()
+
+        # Set the view port boundaries
+        # These numbers set where we have 'scrolled' to.
+        self.view_left = self.simulation.view_left
+        self.view_bottom = self.simulation.view_bottom
+        arcade.set_viewport(self.view_left, SCREEN_WIDTH + self.view_left,
+                            self.view_bottom, SCREEN_HEIGHT + self.view_bottom)
 
         # --- Other stuff
 
         # Set the background color
-        if self.my_map.backgroundcolor:
-            arcade.set_background_color(self.my_map.backgroundcolor)
+        if self.simulation.my_map.backgroundcolor:
+            arcade.set_background_color(self.simulation.my_map.backgroundcolor)
+
+        # The textures of the level, the characters and the lasers go to the GPU now, not in the first frame
+        self.simulation.atlas.upload()
+        if self.baker is not None:
+            self.baker.close()
+            self.baker = None
+        if self.bake_static:
+            simulation = self.simulation
+            self.baker = StaticLayerBaker(simulation.my_map, SPRITE_SCALING, simulation.tile_textures,
+                                          simulation.atlas)
+            # Baked behind the loading screen when the whole level fits, as it comes into view otherwise
+            self.baker.bake_all()
+        if os.environ.get(WATCH_LEVEL_ENV) == "1":
+            self.level_watcher = LevelWatcher(self.map_name)
 
         # Set the image to be used for the texture of the menu/map overlay
-        self.menu_mask = arcade.load_texture("images/background_mask3.png")
+        self.menu_mask = arcade.load_texture(MENU_MASK_FILE)
 
         # Set the image to be used for the texture of the menu/map overlay
-        self.paused_mask = arcade.load_texture("images/paused_mask.png")
-
-        # Apply gravity/ physics to sprites
-        self.physics_engine = arcade.PhysicsEnginePlatformer(self.player,
-                                                             self.platform_list,
-                                                             gravity_constant=GRAVITY)
-
-        # Set the view port boundaries
-        # These numbers set where we have 'scrolled' to.
-        self.view_left = 0
-        self.view_bottom = 0
-
-        self.game_over = False
+        self.paused_mask = arcade.load_texture(PAUSED_MASK_FILE)
+
+        # Heads-up display text, positioned in screen pixels
+        self.hud = Hud(SCREEN_WIDTH, SCREEN_HEIGHT)
+        self.hud_fps = self.hud.add_text(10, 40, 14, arcade.color.BLACK)
+        self.hud_coins = self.hud.add_text(400, 675, 16, arcade.color.BLACK, "Coins: {}")
+        self.hud_trees = self.hud.add_text(500, 675, 16, arcade.color.BLACK, "Trees Saved: {}")
+        # Per-phase timings, F3 shows and hides them
+        self.profiler_overlay = ProfilerOverlay(self.hud, self.profiler, 10, 620, 12, arcade.color.BLACK)
+        # Frame pacing counters, shown with them
+        self.hud_pacing = self.hud.add_text(10, 640, 12, arcade.color.BLACK)
 
         # Background sounds (MUSIC)
-        self.music_player = pyglet.media.Player()
-        self.level_music = pyglet.media.load("sounds/music.wav")
-        self.pause_menu_music = pyglet.media.load("sounds/paused.wav")
-        self.game_over_music = pyglet.media.load("sounds/gameover1.wav")
+        for track, file_name in MUSIC_FILES.items():
+            self.music.add(track, self.assets.sound(file_name), loop=(track != GAME_OVER_MUSIC))
 
         # Game sounds (SFX)
-        self.collect_coin_sound = arcade.load_sound("sounds/coin1.wav")
-        self.jump_sound = arcade.load_sound("sounds/jump1.wav")
-        self.wall_hit_sound = arcade.load_sound("sounds/hit4.wav")
-        self.ice_hit_sound = arcade.load_sound("sounds/hit2.wav")
-        self.gun_sound = arcade.sound.load_sound("sounds/laser1.wav")
+        self.collect_coin_sound = self.assets.sound(SOUND_FILES[EVENT_COIN])
+        self.jump_sound = self.assets.sound(SOUND_FILES[EVENT_JUMP])
+        self.wall_hit_sound = self.assets.sound(SOUND_FILES[EVENT_WALL_HIT])
+        self.ice_hit_sound = self.assets.sound(SOUND_FILES[EVENT_ICE_HIT])
+        self.gun_sound = self.assets.sound(SOUND_FILES[EVENT_LASER])
+        # A coin cluster rings a few times, not once per coin
+        self.sfx.add(EVENT_COIN, self.collect_coin_sound, max_concurrent=3)
+        self.sfx.add(EVENT_JUMP, self.jump_sound, max_concurrent=1)
+        # Reported every step the player is pinned against the edge of the map
+        self.sfx.add(EVENT_WALL_HIT, self.wall_hit_sound, max_concurrent=1, min_interval=.5)
+        self.sfx.add(EVENT_ICE_HIT, self.ice_hit_sound)
+        self.sfx.add(EVENT_LASER, self.gun_sound, max_concurrent=3, min_interval=.08)
 
     def on_draw(self):
         """
         Render the screen.
         """
+        if self.skip_frame:
+            return
+        start = time.perf_counter()
+        self.draw_frame()
+        self.pacer.record_draw((time.perf_counter() - start) * 1000)
+
+    def flip(self):
+        """
+        Show the frame on_draw() drew, if it drew one. An update the pacer
+        leaves undrawn neither draws nor swaps, so the front buffer keeps
+        showing the last whole frame. Whatever the back buffer holds after a
+        swap (platforms needn't preserve it) is never shown: every frame that
+        is drawn starts with start_render() clearing all of it.
+        """
+        if self.skip_frame:
+            self.skip_frame = False
+            return
+        super().flip()
+
+    def draw_frame(self):
         self.frame_count += 1
+        profiler = self.profiler
+        profiler.end_frame()
+        simulation = self.simulation
 
         # This command has to happen before we start drawing
         arcade.start_render()
 
-        if not self.paused_state:
+        if self.states.name == LOADING:
+            self.draw_loading()
+            return
+
+        # The game is simulated in fixed steps, draw it the fraction of a step
+        # that has passed since the last one so motion stays smooth at any frame rate
+        alpha = self.pacer.alpha
+        self.view_left, self.view_bottom = simulation.interpolated_view(alpha)
+        arcade.set_viewport(self.view_left,
+                            SCREEN_WIDTH + self.view_left,
+                            self.view_bottom,
+                            SCREEN_HEIGHT + self.view_bottom)
+        interpolated = simulation.interpolate(alpha)
+
+        if self.states.name != PAUSED:
             # Draw all the sprites.
-            self.background_list.draw()
-            self.wall_list.draw()
-            self.platform_list.draw()
-            self.ice_list.draw()
-            self.coin_list.draw()
-            self.npc_list.draw()
-            self.player_list.draw()
-            self.laser_list.draw()
-        elif self.paused_state:
-            self.background_list.draw()
-            self.wall_list.draw()
-            self.platform_list.draw()
-            self.ice_list.draw()
-            self.coin_list.draw()
+            with profiler.phase("draw_static"):
+                self.draw_static()
+            with profiler.phase("draw_ice"):
+                simulation.ice.draw(self.view_left, self.view_bottom, SCREEN_WIDTH, SCREEN_HEIGHT)
+            with profiler.phase("draw_coins"):
+                simulation.coins.draw(self.view_left, self.view_bottom, SCREEN_WIDTH, SCREEN_HEIGHT)
+            with profiler.phase("draw_npc"):
+                simulation.npc_list.draw()
+            with profiler.phase("draw_player"):
+                simulation.player_list.draw()
+            with profiler.phase("draw_lasers"):
+                simulation.laser_list.draw()
+        else:
+            with profiler.phase("draw_static"):
+                self.draw_static()
+            with profiler.phase("draw_ice"):
+                simulation.ice.draw(self.view_left, self.view_bottom, SCREEN_WIDTH, SCREEN_HEIGHT)
+            with profiler.phase("draw_coins"):
+                simulation.coins.draw(self.view_left, self.view_bottom, SCREEN_WIDTH, SCREEN_HEIGHT)
             # Draw the paused menu texture
             arcade.draw_texture_rectangle(self.view_left + (SCREEN_WIDTH // 2), self.view_bottom + (SCREEN_HEIGHT // 2),
                                           530.0, 292.0, self.paused_mask)
 
+        simulation.restore(interpolated)
+
         # Draw the background texture
         arcade.draw_texture_rectangle(self.view_left + (SCREEN_WIDTH // 2), self.view_bottom + (SCREEN_HEIGHT // 2),
                                       SCREEN_WIDTH, SCREEN_HEIGHT, self.menu_mask)
 
-        if self.last_time and self.frame_count % 60 == 0:
-            fps = 1.0 / (time.time() - self.last_time) * 60
-            self.fps_message = f"FPS: {fps:5.0f}"
-
-        if self.fps_message:
-            arcade.draw_text(self.fps_message, self.view_left + 10, self.view_bottom + 40, arcade.color.BLACK, 14)
-
-        if self.frame_count % 60 == 0:
-            self.last_time = time.time()
-
-        # Put the text on the screen.
-        # Adjust the text position based on the view port so that we don't
-        # scroll the text too.
-        coins_collected = self.score
-        output = f"Coins: {coins_collected}"
-        arcade.draw_text(output, self.view_left + 400, self.view_bottom + 675, arcade.color.BLACK, 16)
-
-        trees_saved = self.trees_saved
-        output = f"Trees Saved: {trees_saved}"
-        arcade.draw_text(output, self.view_left + 500, self.view_bottom + 675, arcade.color.BLACK, 16)
+        with profiler.phase("draw_hud"):
+            self.draw_hud()
 
         # SHOW player (left,bottom) for debug
         """
-        x_pos_output = self.player._get_left()
+        x_pos_output = self.simulation.player._get_left()
         output = f"X: {x_pos_output}"
         arcade.draw_text(output, self.view_left + 600, self.view_bottom + 550, arcade.color.BLACK, 16)
 
-        y_pos_output = self.player._get_bottom()
+        y_pos_output = self.simulation.player._get_bottom()
         output = f"X: {y_pos_output}"
         arcade.draw_text(output, self.view_left + 600, self.view_bottom + 500, arcade.color.BLACK, 16)
         """
 
-        if self.game_over:
+        if simulation.game_over:
             arcade.draw_text("Game Over", self.view_left + 200, self.view_bottom + 200, arcade.color.BLACK, 30)
 
+        if not self.first_frame_drawn:
+            self.first_frame_drawn = True
+            profiler.record("time_to_first_frame", (time.perf_counter() - self.started) * 1000)
+
+    def draw_static(self):
+        """ The background, walls and platforms, from their baked tiles or their sprites. """
+        if self.baker is not None:
+            self.baker.draw(self.view_left, self.view_bottom, SCREEN_WIDTH, SCREEN_HEIGHT)
+        else:
+            self.simulation.static_list.draw()
+
+    def draw_loading(self):
+        """ A progress bar over the middle of the screen while the assets load. """
+        progress = self.assets.progress
+        left = SCREEN_WIDTH // 4
+        right = SCREEN_WIDTH - left
+        top = SCREEN_HEIGHT // 2 + 10
+        bottom = SCREEN_HEIGHT // 2 - 10
+        arcade.draw_lrtb_rectangle_outline(left, right, top, bottom, arcade.color.WHITE, 2)
+        if progress > 0:
+            arcade.draw_lrtb_rectangle_filled(left, left + (right - left) * progress, top, bottom, arcade.color.WHITE)
+        self.loading_text.set(progress * 100)
+        self.loading_hud.draw(0, 0)
+
+    def draw_hud(self):
+        """
+        FPS, coins and trees saved. The HUD only re-lays out a line when its value changes,
+        and the values are only looked at every hud_interval frames of the quality level.
+        """
+        if self.last_time and self.frame_count % 60 == 0:
+            fps = 1.0 / (time.time() - self.last_time) * 60
+            self.fps_message = f"FPS: {fps:5.0f}"
+
+        if self.fps_message:
+            self.hud_fps.set(self.fps_message)
+
+        if self.frame_count % 60 == 0:
+            self.last_time = time.time()
+
+        governor = self.pacer.governor
+        if governor is None or self.frame_count % governor.quality.hud_interval == 0:
+            # The HUD is drawn in screen space, so the text doesn't scroll with the view port
+            self.hud_coins.set(self.simulation.score)
+            self.hud_trees.set(self.simulation.trees_saved)
+            self.profiler_overlay.update()
+            if self.profiler_overlay.visible and self.frame_count % OVERLAY_REFRESH == 0:
+                self.hud_pacing.set(self.pacing_message())
+        self.hud.draw(self.view_left, self.view_bottom)
+
+    def pacing_message(self):
+        stats = self.pacer.stats()
+        message = (f"{stats['fps']:.0f} fps, {stats['frame_interval_p95_ms']:.1f} ms p95, "
+                   f"{stats['frames_dropped']} frames dropped, {stats['steps_lost']} steps lost")
+        if "quality_level" in stats:
+            message += f", quality {stats['quality_level']}"
+        return message
+
     def on_key_press(self, key, modifiers):
         """
 
         """
+        # The overlay is only built once the assets are loaded
+        if key == arcade.key.F3 and self.profiler_overlay is not None:
+            self.profiler_overlay.toggle()
+            if not self.profiler_overlay.visible:
+                self.hud_pacing.set("")
+        if key == arcade.key.R and self.states.name in (PLAYING, PAUSED, GAME_OVER):
+            self.restart()
+            return
         if key == arcade.key.ESCAPE:
-            if self.paused_state == True:
-                self.paused_state = False
-                self.previously_paused = False
-                self.music_player.queue(self.current_music_source)
-                self.music_player.next_source()
-                self.music_player.seek(self.current_music_time)
-                self.music_player.play()
-            elif self.paused_state == False:
-                self.paused_state = True
-        if not self.paused_state:
-            if key == arcade.key.W:
-                if self.physics_engine.can_jump():
-                    self.player.change_y = JUMP_SPEED
-                    arcade.play_sound(self.jump_sound)
-            elif key == arcade.key.A:
-                self.player.change_x = -MOVEMENT_SPEED
-                self.player_facing_direction = "left"
-            elif key == arcade.key.D:
-                self.player.change_x = MOVEMENT_SPEED
-                self.player_facing_direction = "right"
-            # Boundary checks and player position reset for boundary encounter
-            if self.player._get_left() <= self.player.boundary_left:
-                self.player.change_x = 0
-            elif self.player._get_right() >= self.player.boundary_right:
-                self.player.change_x = 0
+            if self.states.name == PAUSED:
+                self.states.change(PLAYING)
+            elif self.states.name == PLAYING:
+                self.states.change(PAUSED)
+        if self.states.name in (PLAYING, GAME_OVER):
+            self.send_input(KEY_PRESS, key)
 
     def on_key_release(self, key, modifiers):
         """
 
         """
-        if key == arcade.key.A or key == arcade.key.D:
-            self.player.change_x = 0
-        elif key == arcade.key.W:
-            self.player.change_y = 0
+        if self.simulation is not None:
+            self.send_input(KEY_RELEASE, key)
 
     def on_mouse_press(self, x, y, button, modifiers):
         """
         Called whenever the mouse moves.
         """
-        if not self.paused_state:
+        if self.states.name in (PLAYING, GAME_OVER):
             # Create a laser pulse
-            if button == arcade.MOUSE_BUTTON_LEFT:
-                arcade.play_sound(self.gun_sound)
-                laser = arcade.Sprite("images/laser1t.png", scale=SPRITE_SCALING)
-
-                laser.textures.append(arcade.load_texture("images/laser2t.png", scale=SPRITE_SCALING))
-                laser.textures.append(arcade.load_texture("images/laser3t.png", scale=SPRITE_SCALING))
-                laser.textures.append(arcade.load_texture("images/laser4t.png", scale=SPRITE_SCALING))
-                laser.textures.append(arcade.load_texture("images/laser5t.png", scale=SPRITE_SCALING))
-
-                # Position the laser pulse at the player's current location
-                # ADD feature to account for player's facing direction and the destination
-                # eg the player should only be able to fire in front of themselves and not behind
-                start_x = self.player.center_x
-                start_y = self.player.center_y
-                laser.center_x = start_x
-                laser.center_y = start_y
-
-                # Get from the mouse the destination location for the laser pulse
-                # IMPORTANT! If you have a scrolling screen, you will also need
-                # to add in self.view_bottom and self.view_left.
-                dest_x = x + self.view_left
-                dest_y = y + self.view_bottom
-
-                # Do math to calculate how to get the laser pulse to the destination.
-                # Calculation the angle in radians between the start points
-                # and end points. This is the angle the laser pulse will travel.
-                x_diff = dest_x - start_x
-                y_diff = dest_y - start_y
-                angle = math.atan2(y_diff, x_diff)
-
-                # Angle the laser pulse sprite so it doesn't look like it is flying
-                # sideways.
-                laser.angle = math.degrees(angle)
-                '''print(f"Laser angle: {laser.angle:.2f}")
-                print(f"X: {dest_x:.2f}")
-                print(f"Y: {dest_y:.2f}")'''
-
-                # Taking into account the angle, calculate our change_x
-                # and change_y. Velocity is how fast the laser pulse travels.
-                laser.change_x = math.cos(angle) * LASER_SPEED
-                laser.change_y = math.sin(angle) * LASER_SPEED
-
-                # Add the laser pulse to the appropriate lists
-                self.laser_list.append(laser)
+            # Get from the mouse the destination location for the laser pulse
+            # IMPORTANT! If you have a scrolling screen, you will also need
+            # to add in self.view_bottom and self.view_left.
+            self.send_input(MOUSE_PRESS, button, x + self.view_left, y + self.view_bottom)
+
+    def restart(self):
+        """ Start the level over in place, reusing everything finish_setup() loaded. """
+        simulation = self.simulation
+        simulation.restart()
+        self.pacer.reset()
+        # The recording starts over with the level, so it replays from a fresh Simulation
+        self.input_trace = InputTrace()
+        self.view_left = simulation.view_left
+        self.view_bottom = simulation.view_bottom
+        self.states.change(PLAYING)
+        self.music.play(LEVEL_MUSIC, from_start=True)
+
+    def reload_level(self):
+        """ Patch the edits saved to the TMX file into the level being played, keeping the player where it is. """
+        simulation = self.simulation
+        start = time.perf_counter()
+        diff = simulation.reload_level()
+        if diff is None:
+            return
+        if diff.new_sources:
+            simulation.atlas.upload()
+        if self.baker is not None:
+            self.baker.reload(diff, simulation.tile_textures)
+        reload_ms = (time.perf_counter() - start) * 1000
+        self.profiler.record("level_reload", reload_ms)
+        print(f"Reloaded {self.map_name}: {len(diff)} tiles changed, in {reload_ms:.1f} ms")
+
+    def send_input(self, kind, key, x=0.0, y=0.0):
+        """ Hand an input event to the simulation, recording it against the step it arrived before. """
+        self.input_trace.record(self.simulation.steps, kind, key, x, y)
+        apply_input(self.simulation, kind, key, x, y)
 
     def update(self, delta_time):
         """ Movement and game logic """
-
-        # Game state eg. new, save, paused, game over, cut scene
-        if self.game_over:
-            self.music_player.queue(self.game_over_music)
-            self.music_player.next_source()
-            self.music_player.play()
-        if self.paused_state:
-            if self.previously_paused:
-                if not self.music_player.playing:
-                    self.music_player.queue(self.pause_menu_music)
-                    self.music_player.play()
-            elif not self.previously_paused:
-                self.music_player.pause()
-                self.current_music_time = self.music_player.time
-                self.current_music_source = self.music_player.source
-                self.music_player.queue(self.pause_menu_music)
-                self.music_player.next_source()
-                self.music_player.play()
-                self.previously_paused = True
-        if not self.game_over and not self.paused_state:
-            # Call update to move the sprite
-            # If using a physics engine, call update on it instead of the sprite
-            # list.
-            self.physics_engine.update()
-            # Call update on all sprites
-            self.laser_list.update()
-            self.laser_list.update_animation()
-            self.ice_list.update()
-            self.player_list.update()
-            self.coin_list.update()
-            self.player_list.update_animation()
-            if not self.music_player.playing:
-                self.music_player.queue(self.level_music)
-                self.music_player.play()
-
-        # Boundary checks and player position reset for boundary encounter
-        if self.player._get_left() <= self.player.boundary_left:
-            self.player._set_left(self.player.boundary_left + 16)
-            arcade.play_sound(self.wall_hit_sound)
-        elif self.player._get_right() >= self.player.boundary_right:
-            self.player._set_right(self.player.boundary_right - 16)
-            arcade.play_sound(self.wall_hit_sound)
-
-        coins_hit = arcade.check_for_collision_with_list(self.player, self.coin_list)
-        for coin in coins_hit:
-            coin.kill()
-            arcade.play_sound(self.collect_coin_sound)
-            self.score += 1
-
-        # Loop through each laser pulse
-        for laser in self.laser_list:
-            # Check this laser pulse to see if it hit an iced tree
-            laser_ice_hit_list = arcade.check_for_collision_with_list(laser, self.ice_list)
-            # If it did, get rid of the laser pulse
-            if len(laser_ice_hit_list) > 0:
-                # For every iced tree we hit, add to the score and remove the ice
-                for ice in laser_ice_hit_list:
-                    laser.kill()
-                    ice.kill()
-                    arcade.play_sound(self.ice_hit_sound)
-                    self.trees_saved += 1
-            # Check this laser pulse to see if it hit a platform
-            laser_platform_hit_list = arcade.check_for_collision_with_list(laser, self.platform_list)
-            if len(laser_platform_hit_list) > 0:
-                laser.kill()
-            # Check this laser pulse to see if it hit a wall
-            laser_wall_hit_list = arcade.check_for_collision_with_list(laser, self.wall_list)
-            if len(laser_wall_hit_list) > 0:
-                laser.kill()
-            # If the laser pulse flies off-screen, remove it.
-            if laser.bottom > self.height + self.view_bottom or laser.bottom < self.view_bottom or laser.left > self.view_left + self.width or laser.left < self.view_left:
-                laser.kill()
-
-        # --- Manage Scrolling ---
-
-        # View port tracking
-        changed = False
-
-        # Scroll left
-        left_bndry = self.view_left + VIEWPORT_LEFT_MARGIN
-        if self.player.left < left_bndry:
-            self.view_left -= left_bndry - self.player.left
-            changed = True
-
-        # Scroll right
-        right_bndry = self.view_left + SCREEN_WIDTH - VIEWPORT_RIGHT_MARGIN
-        if self.player.right > right_bndry:
-            self.view_left += self.player.right - right_bndry
-            changed = True
-
-        # Scroll up
-        top_bndry = self.view_bottom + SCREEN_HEIGHT - VIEWPORT_MARGIN_TOP
-        if self.player.top > top_bndry:
-            self.view_bottom += self.player.top - top_bndry
-            changed = True
-
-        # Scroll down
-        bottom_bndry = self.view_bottom + VIEWPORT_MARGIN_BOTTOM
-        if self.player.bottom < bottom_bndry:
-            self.view_bottom -= bottom_bndry - self.player.bottom
-            changed = True
-
-        # Check if we need to scroll.
-        if changed:
-            self.view_left = int(self.view_left)
-            self.view_bottom = int(self.view_bottom)
-            arcade.set_viewport(self.view_left,
-                                SCREEN_WIDTH + self.view_left,
-                                self.view_bottom,
-                                SCREEN_HEIGHT + self.view_bottom)
+        start = time.perf_counter()
+        # Only the playing state steps the simulation, see game_state.py
+        self.states.update(delta_time)
+        if self.simulation is not None:
+            self.handle_events()
+        if self.level_watcher is not None and self.level_watcher.poll(delta_time):
+            self.reload_level()
+        now = time.perf_counter()
+        self.pacer.record_update((now - start) * 1000)
+        self.skip_frame = not self.pacer.should_draw(now)
+
+    def advance(self, delta_time):
+        """ Run as many fixed steps as delta_time covers, the remainder carries over to the next frame. """
+        governor = self.pacer.governor
+        if governor is not None:
+            self.simulation.animation_interval = governor.quality.animation_interval
+        for _ in range(self.pacer.steps(delta_time)):
+            self.simulation.step()
+
+    def handle_events(self):
+        """ Sounds and state changes for whatever happened in the simulation since the last update. """
+        for event in self.simulation.events:
+            if event in self.sfx:
+                self.sfx.play(event)
+            if event == EVENT_GAME_OVER:
+                self.states.change(GAME_OVER)
+        self.simulation.events.clear()
+
+    def on_close(self):
+        """ Write out the profiler trace if PROFILE_TRACE_ENV names a file. """
+        trace_file = os.environ.get(PROFILE_TRACE_ENV)
+        if trace_file:
+            self.profiler.export(trace_file)
+            print(f"Profiler trace written to {trace_file}")
+            print(f"Frame pacing: {self.pacing_message()}")
+        input_file = os.environ.get(INPUT_TRACE_ENV)
+        if input_file and self.input_trace is not None:
+            self.input_trace.save(input_file)
+            print(f"Input trace written to {input_file}")
+        if self.assets is not None:
+            self.assets.close()
+        super().on_close()
 
 
 def main():
@@ -0,0 +1,118 @@
+# coding=utf-8
+import time
+
+import arcade
+import pyglet
+from pyglet.media.drivers import get_audio_driver
+
+'''
+    Sound effects mixed through a fixed pool of pyglet Players ("voices").
+    arcade.play_sound() opens the file and makes a new Player for every
+    play after the first, so a coin cluster or a player pinned against the
+    map's edge ends up with dozens of overlapping players. Here each sound
+    is decoded into memory once, plays on one of VOICES reused players, and
+    has its own limit on how many copies play at once and how soon it may
+    start again. When every voice is busy the one that started first is
+    cut off for the new sound.
+'''
+
+VOICES = 8
+# Copies of one sound that may play at the same time
+MAX_CONCURRENT = 2
+# Seconds before the same sound may start again
+MIN_INTERVAL = .05
+
+
+class SfxSound:
+    """ A sound decoded into memory, with its concurrency and retrigger limits """
+
+    def __init__(self, source, max_concurrent, min_interval):
+        self.source = source
+        self.duration = source.duration or 0
+        self.max_concurrent = max_concurrent
+        self.min_interval = min_interval
+        # When it last started, None if it hasn't yet
+        self.last_played = None
+
+
+class Voice:
+    """ One of the mixer's players, and what it is playing """
+
+    def __init__(self, player):
+        self.player = player
+        self.sound = None
+        self.started = 0.0
+
+    def busy(self, now):
+        return self.sound is not None and now < self.started + self.sound.duration
+
+
+class SfxMixer:
+    """ Plays sounds by name on a fixed pool of voices, skipping or cutting off sounds so it never needs more """
+
+    def __init__(self, voices=VOICES, clock=time.perf_counter):
+        self.clock = clock
+        # Without a sound device the mixer keeps track of its voices but plays nothing
+        self.audible = get_audio_driver() is not None
+        self.voices = [Voice(pyglet.media.Player()) for _ in range(voices)]
+        self.sounds = {}
+
+        # What became of each play() call
+        self.played = 0
+        self.skipped = 0
+        self.stolen = 0
+
+    def add(self, name, sound, max_concurrent=MAX_CONCURRENT, min_interval=MIN_INTERVAL):
+        """
+        Make a sound playable as name. sound is a pyglet Source, eg. from an
+        AssetLoader, or an arcade Sound as loaded with arcade.load_sound().
+        A sound that failed to load (None) is left out.
+        """
+        if sound is None:
+            return
+        if isinstance(sound, arcade.Sound):
+            sound = sound.player
+        if not isinstance(sound, pyglet.media.StaticSource):
+            sound = pyglet.media.StaticSource(sound)
+        self.sounds[name] = SfxSound(sound, max_concurrent, min_interval)
+
+    def __contains__(self, name):
+        return name in self.sounds
+
+    def play(self, name):
+        """ Start the named sound, unless it started too recently or too many copies are playing. Returns True if it started. """
+        sound = self.sounds[name]
+        now = self.clock()
+        if sound.last_played is not None and now - sound.last_played < sound.min_interval:
+            self.skipped += 1
+            return False
+
+        playing = [voice for voice in self.voices if voice.busy(now)]
+        if sum(1 for voice in playing if voice.sound is sound) >= sound.max_concurrent:
+            self.skipped += 1
+            return False
+
+        if len(playing) < len(self.voices):
+            voice = next(voice for voice in self.voices if not voice.busy(now))
+        else:
+            voice = min(playing, key=lambda voice: voice.started)
+            self.stolen += 1
+
+        self._start(voice, sound)
+        voice.sound = sound
+        voice.started = now
+        sound.last_played = now
+        self.played += 1
+        return True
+
+    def _start(self, voice, sound):
+        if not self.audible:
+            return
+        player = voice.player
+        player.pause()
+        # Still holding the last sound, even if it has finished, until moved past it
+        previous = player.source
+        player.queue(sound.source)
+        if previous is not None:
+            player.next_source()
+        player.play()
@@ -0,0 +1,551 @@
+# coding=utf-8
+import copy
+import math
+
+import arcade
+
+from atlas import AtlasSpriteList, TextureAtlas
+from collectibles import CollectibleLayer
+from lasers import LASER_TEXTURE_FILES, LaserSystem
+from level_cache import compile_level, load_level
+from level_reload import diff_levels
+from level_streamer import LevelStreamer
+from profiler import FrameProfiler
+from tile_physics import TileGridPhysics
+
+'''
+    Game state and logic, without a window. Simulation.step() advances the
+    game by one fixed SIMULATION_STEP no matter how fast it is called, so the
+    same input always plays out the same way, and the game can be run headless
+    (in CI, benchmarks) much faster than real time. MyGame drives it from a
+    frame-rate independent accumulator and draws its sprite lists.
+
+    Sounds are not played here; step() and the input methods append the name
+    of what happened to events, and whoever runs the simulation decides what
+    to do with them.
+'''
+
+SCREEN_WIDTH = 1200
+SCREEN_HEIGHT = 720
+
+SPRITE_SCALING = .5
+SPRITE_PIXEL_SIZE = 128
+GRID_PIXEL_SIZE = (SPRITE_PIXEL_SIZE * SPRITE_SCALING)
+
+# How many pixels to keep as a minimum margin between the character
+# and the edge of the screen.
+VIEWPORT_MARGIN_TOP = 256
+VIEWPORT_MARGIN_BOTTOM = 256
+VIEWPORT_RIGHT_MARGIN = 512
+VIEWPORT_LEFT_MARGIN = 512
+
+# Physics, in pixels per step
+MOVEMENT_SPEED = 4
+JUMP_SPEED = 16
+GRAVITY = 1
+LASER_SPEED = 20
+# Degrees coins turn each step
+COIN_SPIN = 5
+
+# Seconds of game time in one step. The speeds above were tuned for 60 updates a second.
+SIMULATION_STEP = 1 / 60
+
+LEVEL_MAP = "NLA-testLvL5.tmx"
+CHARACTER_SCALE = .5
+PLAYER_STAND_RIGHT_FILES = ["images/rock_stand_right.png"]
+PLAYER_STAND_LEFT_FILES = ["images/rock_stand_left.png"]
+PLAYER_WALK_RIGHT_FILES = [f"images/rock_walk_right_00{frame}.png" for frame in range(1, 10)]
+PLAYER_WALK_LEFT_FILES = [f"images/rock_walk_left_00{frame}.png" for frame in range(1, 10)]
+PLAYER_SCALE = .5
+PLAYER_START = (384, 768)
+# The player is kept this far from either end of the map, and pushed back
+# this much further when it walks into one
+PLAYER_EDGE_MARGIN = 128
+PLAYER_PUSH_BACK = 16
+
+# Names of the events step() and the input methods report
+EVENT_JUMP = "jump"
+EVENT_WALL_HIT = "wall_hit"
+EVENT_COIN = "coin"
+EVENT_ICE_HIT = "ice_hit"
+EVENT_LASER = "laser"
+EVENT_GAME_OVER = "game_over"
+
+
+def image_files(level):
+    """ Every image Simulation.setup() loads for a level, eg. to decode them ahead of it. """
+    return (list(level.textures) + PLAYER_STAND_RIGHT_FILES + PLAYER_STAND_LEFT_FILES +
+            PLAYER_WALK_RIGHT_FILES + PLAYER_WALK_LEFT_FILES + LASER_TEXTURE_FILES)
+
+
+class SimulationSnapshot:
+    """ What restart() needs to put a Simulation back the way it was: small, nothing of the level is copied """
+
+    def __init__(self, simulation):
+        # Which coins and ice were left
+        self.coins = simulation.coins.snapshot()
+        self.ice = simulation.ice.snapshot()
+        self.laser_cells = simulation.lasers.cells.copy()
+        # Position, velocity, animation frame and size of the player sprite
+        self.player = {name: copy.copy(value) for name, value in vars(simulation.player).items()
+                       if name != "sprite_lists"}
+        self.player_facing_direction = simulation.player_facing_direction
+        self.score = simulation.score
+        self.trees_saved = simulation.trees_saved
+        self.view = (simulation.view_left, simulation.view_bottom)
+        self.game_over = simulation.game_over
+        self.steps = simulation.steps
+
+
+class Simulation:
+    """ The level, the player, and everything that moves, stepped at a fixed rate """
+
+    def __init__(self, map_name=LEVEL_MAP, profiler=None, stream_static=True):
+        self.map_name = map_name
+        # False when the static layers are drawn some other way (baked by a
+        # StaticLayerBaker) and static_list can stay empty
+        self.stream_static = stream_static
+        # Phases of step() are timed into this, it does nothing unless enabled
+        self.profiler = profiler if profiler is not None else FrameProfiler(enabled=False)
+
+        # Sprite lists
+        self.my_map = None
+        # The level's tile textures, by texture id
+        self.tile_textures = None
+        self.level_streamer = None
+        self.background_list = None
+        self.wall_list = None
+        self.platform_list = None
+        self.static_list = None
+        self.laser_list = None
+        self.atlas = None
+        self.lasers = None
+
+        # Prepare player
+        self.player = None
+        self.player_facing_direction = "right"
+        self.player_list = None
+        # Size of the loaded map in pixels, set by setup()
+        self.map_width = 0
+        self.map_height = 0
+        self.end_of_map = 0
+
+        # Prepare NPC's
+        self.npc_list = None
+        # Every coin and ice tile of the map as arrays rather than sprites
+        self.coins = None
+        self.ice = None
+
+        # Gravity & Collision
+        self.physics_engine = None
+        # (col, row) of each ice cell -> its tile in my_map, to melt it when a laser hits
+        self.ice_tiles = {}
+
+        # Scoring
+        self.score = 0
+        self.trees_saved = 0
+
+        # Viewport(viewable area within window)
+        self.view_left = 0
+        self.view_bottom = 0
+
+        self.game_over = False
+        self.steps = 0
+        # Steps between picking the player's animation frame, raised by the
+        # quality governor (frame_pacing.py). Only what is drawn depends on it
+        self.animation_interval = 1
+        # Names of what happened since the caller last cleared it, eg. to play sounds
+        self.events = []
+
+        # Where the player and lasers were before the last step, for interpolate()
+        self.previous_positions = {}
+        self.previous_view = (0, 0)
+
+        # The state setup() left things in, restart() goes back to it
+        self.pristine = None
+
+    def setup(self):
+        """ Load the level and put everything at its starting position. """
+
+        # Tile and character images get packed into shared atlas pages once
+        # they are loaded below, the AtlasSpriteLists draw from those
+        self.atlas = TextureAtlas()
+
+        # Sprite lists
+        # do not use is_static=True for animated sprites
+        self.player_list = AtlasSpriteList(self.atlas)
+        self.npc_list = AtlasSpriteList(self.atlas)
+        self.wall_list = arcade.SpriteList(is_static=True)
+        self.platform_list = arcade.SpriteList(is_static=True)
+        self.background_list = arcade.SpriteList(is_static=True)
+        # Background, walls and platforms drawn together in a single batch
+        self.static_list = AtlasSpriteList(self.atlas, is_static=True)
+        self.laser_list = AtlasSpriteList(self.atlas)
+
+        # Set up the player
+        self.score = 0
+        self.trees_saved = 0
+        self.player = arcade.AnimatedWalkingSprite()
+        self.player_facing_direction = "right"
+
+        self.player.stand_right_textures = [arcade.load_texture(file_name, scale=CHARACTER_SCALE)
+                                            for file_name in PLAYER_STAND_RIGHT_FILES]
+        self.player.stand_left_textures = [arcade.load_texture(file_name, scale=CHARACTER_SCALE)
+                                           for file_name in PLAYER_STAND_LEFT_FILES]
+        self.player.walk_right_textures = [arcade.load_texture(file_name, scale=CHARACTER_SCALE)
+                                           for file_name in PLAYER_WALK_RIGHT_FILES]
+        self.player.walk_left_textures = [arcade.load_texture(file_name, scale=CHARACTER_SCALE)
+                                          for file_name in PLAYER_WALK_LEFT_FILES]
+
+        self.player.texture_change_distance = 20
+
+        # Read in the tiled map, from its compiled cache when that is up to date
+        self.my_map = load_level(self.map_name, SPRITE_SCALING)
+        tile_textures = self.tile_textures = self.my_map.load_textures(SPRITE_SCALING)
+
+        # Laser pulses are moved and hit-tested as arrays against the Walls,
+        # Platforms and Ice grids, only their sprites go in laser_list
+        self.lasers = LaserSystem(self.my_map, SPRITE_SCALING, self.laser_list)
+        self.index_ice_tiles()
+
+        self.atlas.add_textures(tile_textures)
+        self.atlas.add_textures(self.lasers.textures)
+        self.atlas.add_textures(self.player.stand_right_textures + self.player.stand_left_textures +
+                                self.player.walk_right_textures + self.player.walk_left_textures)
+        self.atlas.build()
+
+        # The map's bounds come from the map itself, so levels can be any size
+        self.map_width = self.my_map.width * self.my_map.tilewidth * SPRITE_SCALING
+        self.map_height = self.my_map.height * self.my_map.tileheight * SPRITE_SCALING
+        self.end_of_map = self.map_width
+        self.player.boundary_left = PLAYER_EDGE_MARGIN
+        self.player.boundary_right = self.end_of_map - PLAYER_EDGE_MARGIN
+
+        # Starting position of the player
+        self.player.center_x, self.player.center_y = PLAYER_START
+        self.player.scale = PLAYER_SCALE
+
+        self.player_list.append(self.player)
+
+        # --- Coins and ice
+        # Loaded whole, a few bytes a tile, and spun by turning the whole layer
+        self.coins = CollectibleLayer(self.my_map, "Coins", SPRITE_SCALING, tile_textures, self.atlas,
+                                      spin=COIN_SPIN)
+        self.ice = CollectibleLayer(self.my_map, "Ice", SPRITE_SCALING, tile_textures, self.atlas)
+
+        # --- Level streaming
+        # Only the chunks around the viewport have sprites, so the layer
+        # sprite lists below never hold the whole map
+        self.level_streamer = LevelStreamer(self.my_map, SPRITE_SCALING, tile_textures,
+                                            SCREEN_WIDTH, SCREEN_HEIGHT)
+        if self.stream_static:
+            # --- Background ---
+            self.level_streamer.add_layer("Background", self.background_list, draw_list=self.static_list)
+            # --- Walls ---
+            self.level_streamer.add_layer("Walls", self.wall_list, draw_list=self.static_list)
+            # --- Platforms ---
+            self.level_streamer.add_layer("Platforms", self.platform_list, draw_list=self.static_list)
+        # --- Static NPC's ---
+        self.level_streamer.add_layer("NPC", self.npc_list)
+
+        # Apply gravity/ physics to sprites, against the platform tiles of the
+        # whole map rather than the platform sprites that happen to be streamed in
+        self.physics_engine = TileGridPhysics(self.player, self.my_map, SPRITE_SCALING,
+                                              solid_layers=("Platforms", ), gravity_constant=GRAVITY)
+
+        # Set the view port boundaries
+        # These numbers set where we have 'scrolled' to.
+        self.view_left = 0
+        self.view_bottom = 0
+        self.level_streamer.update(self.view_left, self.view_bottom)
+
+        self.game_over = False
+        self.steps = 0
+        self.events = []
+        self.previous_positions = {}
+        self.previous_view = (self.view_left, self.view_bottom)
+        self.pristine = self.snapshot()
+
+    def index_ice_tiles(self):
+        self.ice_tiles = {}
+        for index in self.my_map.layer_range("Ice"):
+            col, row_from_top = self.my_map.grid_location(index)
+            self.ice_tiles[(col, self.my_map.height - row_from_top - 1)] = index
+
+    def reload_level(self):
+        """
+        Read the TMX file again after it was edited and patch only what changed
+        into the level being played: the sprites of changed tiles in the loaded
+        chunks, coins and ice, the physics and laser grids. The player, the
+        view, the score and what was collected or melted so far are kept, and
+        restart() starts the edited level. Returns the LevelDiff that was
+        applied, or None if the map couldn't be read or changed size, and the
+        level is left as it was.
+        """
+        try:
+            level = compile_level(self.map_name, SPRITE_SCALING)
+        except Exception as e:
+            # Eg. read while the editor was still writing it
+            print(f"Warning, unable to reload '{self.map_name}'.", e)
+            return None
+        diff = diff_levels(self.my_map, level)
+        if diff is None:
+            print(f"Warning, '{self.map_name}' changed size, it can't be reloaded in place.")
+            return None
+
+        # Images the level used already are reused, new ones loaded and packed into the atlas
+        tile_textures = level.load_textures(SPRITE_SCALING, dict(zip(self.my_map.textures, self.tile_textures)))
+        if diff.new_sources:
+            self.atlas.add_textures(tile_textures)
+            self.atlas.build()
+            # Every page may have been laid out differently
+            for sprite_list in (self.player_list, self.npc_list, self.static_list, self.laser_list):
+                sprite_list.vao = None
+        self.my_map = level
+        self.tile_textures = tile_textures
+
+        pristine = self.pristine
+        self.level_streamer.reload(diff, tile_textures)
+        pristine.coins, = self.coins.reload(diff, tile_textures, [pristine.coins])
+        pristine.ice, = self.ice.reload(diff, tile_textures, [pristine.ice])
+        self.index_ice_tiles()
+
+        self.physics_engine.patch_cells(level, diff.cells(self.physics_engine.solid_layers))
+        lasers = self.lasers
+        cells = diff.cells(lasers.blocking_layers + lasers.ice_layers)
+
+        def melted(snapshot=None):
+            return {cell for cell in cells
+                    if cell in self.ice_tiles and not self.ice.tile_alive(self.ice_tiles[cell], snapshot)}
+
+        lasers.patch_cells(level, cells, melted())
+        lasers.patch_cells(level, cells, melted(pristine.ice), into=pristine.laser_cells)
+        return diff
+
+    def snapshot(self):
+        """ The state of everything that changes during play, for load_snapshot(). """
+        return SimulationSnapshot(self)
+
+    def load_snapshot(self, snapshot):
+        """
+        Put the game back to a snapshot in place: the level, textures, atlas and
+        the loaded sprites of the streamed layers are all kept, coins and ice
+        just get their alive flags back, and the chunks around the view are
+        loaded.
+        """
+        self.lasers.reset(snapshot.laser_cells)
+        self.coins.load_snapshot(snapshot.coins)
+        self.ice.load_snapshot(snapshot.ice)
+
+        player = self.player
+        player.__dict__.update({name: copy.copy(value) for name, value in snapshot.player.items()})
+        # Its position, texture and size all changed behind the list's back
+        self.player_list.vao = None
+        self.player_facing_direction = snapshot.player_facing_direction
+
+        self.score = snapshot.score
+        self.trees_saved = snapshot.trees_saved
+        self.view_left, self.view_bottom = snapshot.view
+        self.level_streamer.restore(self.view_left, self.view_bottom)
+
+        self.game_over = snapshot.game_over
+        self.steps = snapshot.steps
+        self.events = []
+        self.previous_positions = {}
+        self.previous_view = (self.view_left, self.view_bottom)
+
+    def restart(self):
+        """ Start the level over, in milliseconds rather than the time setup() takes. """
+        self.load_snapshot(self.pristine)
+
+    def end_game(self):
+        """ Stop the game, eg. once the player falls out of the map. step() does nothing from now on. """
+        if not self.game_over:
+            self.game_over = True
+            self.events.append(EVENT_GAME_OVER)
+
+    # --- Input
+
+    def jump(self):
+        """ Jump if the player is standing on something. """
+        if self.physics_engine.can_jump():
+            self.player.change_y = JUMP_SPEED
+            self.events.append(EVENT_JUMP)
+            return True
+        return False
+
+    def walk(self, direction):
+        """ Start walking left (-1) or right (1). """
+        self.player.change_x = direction * MOVEMENT_SPEED
+        self.player_facing_direction = "left" if direction < 0 else "right"
+        # Boundary checks and player position reset for boundary encounter
+        if self.player._get_left() <= self.player.boundary_left:
+            self.player.change_x = 0
+        elif self.player._get_right() >= self.player.boundary_right:
+            self.player.change_x = 0
+
+    def stop_walking(self):
+        self.player.change_x = 0
+
+    def stop_jumping(self):
+        self.player.change_y = 0
+
+    def fire(self, dest_x, dest_y):
+        """ Fire a laser pulse from the player towards (dest_x, dest_y) in map coordinates. """
+        self.events.append(EVENT_LASER)
+
+        # Position the laser pulse at the player's current location
+        # ADD feature to account for player's facing direction and the destination
+        # eg the player should only be able to fire in front of themselves and not behind
+        start_x = self.player.center_x
+        start_y = self.player.center_y
+
+        # Do math to calculate how to get the laser pulse to the destination.
+        # Calculation the angle in radians between the start points
+        # and end points. This is the angle the laser pulse will travel.
+        x_diff = dest_x - start_x
+        y_diff = dest_y - start_y
+        angle = math.atan2(y_diff, x_diff)
+
+        # Its sprite is recycled from an earlier pulse, and must not be drawn
+        # sliding over from where that one last flew
+        laser = self.lasers.fire(start_x, start_y, angle, LASER_SPEED)
+        self.previous_positions.pop(laser, None)
+        return laser
+
+    # --- Stepping
+
+    def save_positions(self):
+        """ Remember where the moving sprites are, so a frame drawn between steps can blend from there. """
+        previous = self.previous_positions
+        previous.clear()
+        for sprite in self.player_list:
+            previous[sprite] = (sprite.center_x, sprite.center_y)
+        for laser in self.laser_list:
+            previous[laser] = (laser.center_x, laser.center_y)
+        self.previous_view = (self.view_left, self.view_bottom)
+
+    def step(self):
+        """ Advance the game by one SIMULATION_STEP. """
+        if self.game_over:
+            return
+        self.save_positions()
+        self.steps += 1
+        profiler = self.profiler
+
+        # Call update to move the sprite
+        # If using a physics engine, call update on it instead of the sprite
+        # list.
+        with profiler.phase("physics"):
+            self.physics_engine.update()
+        # Call update on all sprites
+        with profiler.phase("sprite_update"):
+            self.player_list.update()
+            self.coins.step()
+        with profiler.phase("update_animation"):
+            if (self.steps - 1) % self.animation_interval == 0:
+                self.player_list.update_animation()
+
+        # Boundary checks and player position reset for boundary encounter
+        if self.player._get_left() <= self.player.boundary_left:
+            self.player._set_left(self.player.boundary_left + PLAYER_PUSH_BACK)
+            self.events.append(EVENT_WALL_HIT)
+        elif self.player._get_right() >= self.player.boundary_right:
+            self.player._set_right(self.player.boundary_right - PLAYER_PUSH_BACK)
+            self.events.append(EVENT_WALL_HIT)
+        # The top of the map is a ceiling, like a solid tile above the player...
+        if self.player._get_top() > self.map_height:
+            self.player._set_top(self.map_height)
+            self.player.change_y = 0.0
+        # ...its bottom isn't: fell through a gap in the floor and out of the map
+        elif self.player._get_top() < 0:
+            self.end_game()
+
+        with profiler.phase("coin_collisions"):
+            coins_hit = self.coins.collide(self.player)
+            if len(coins_hit):
+                self.coins.kill(coins_hit)
+                self.events.extend([EVENT_COIN] * len(coins_hit))
+                self.score += len(coins_hit)
+
+        # Move every laser pulse and stop the ones that hit something or left the screen
+        with profiler.phase("laser_collisions"):
+            melted = self.lasers.step(self.view_left, self.view_bottom, SCREEN_WIDTH, SCREEN_HEIGHT)
+            # For every iced tree we hit, add to the score and remove the ice
+            for cell in melted:
+                self.ice.remove_tile(self.ice_tiles[cell])
+                self.events.append(EVENT_ICE_HIT)
+                self.trees_saved += 1
+
+        # --- Manage Scrolling ---
+
+        with profiler.phase("scrolling"):
+            changed = self.scroll()
+
+        if changed:
+            with profiler.phase("level_streaming"):
+                self.level_streamer.update(self.view_left, self.view_bottom)
+
+    def scroll(self):
+        """ Keep the player inside the viewport margins, returns True if the view moved. """
+        # View port tracking
+        changed = False
+
+        # Scroll left
+        left_bndry = self.view_left + VIEWPORT_LEFT_MARGIN
+        if self.player.left < left_bndry:
+            self.view_left -= left_bndry - self.player.left
+            changed = True
+
+        # Scroll right
+        right_bndry = self.view_left + SCREEN_WIDTH - VIEWPORT_RIGHT_MARGIN
+        if self.player.right > right_bndry:
+            self.view_left += self.player.right - right_bndry
+            changed = True
+
+        # Scroll up
+        top_bndry = self.view_bottom + SCREEN_HEIGHT - VIEWPORT_MARGIN_TOP
+        if self.player.top > top_bndry:
+            self.view_bottom += self.player.top - top_bndry
+            changed = True
+
+        # Scroll down
+        bottom_bndry = self.view_bottom + VIEWPORT_MARGIN_BOTTOM
+        if self.player.bottom < bottom_bndry:
+            self.view_bottom -= bottom_bndry - self.player.bottom
+            changed = True
+
+        if changed:
+            self.view_left = int(self.view_left)
+            self.view_bottom = int(self.view_bottom)
+        return changed
+
+    # --- Rendering between steps
+
+    def interpolated_view(self, alpha):
+        """ The viewport alpha of the way from before the last step to now, in whole pixels. """
+        previous_left, previous_bottom = self.previous_view
+        return (int(round(previous_left + (self.view_left - previous_left) * alpha)),
+                int(round(previous_bottom + (self.view_bottom - previous_bottom) * alpha)))
+
+    def interpolate(self, alpha):
+        """
+        Move the player and lasers alpha of the way from where they were before
+        the last step to where they are now. Returns what restore() needs to
+        put them back once the frame is drawn.
+        """
+        current = []
+        for sprite, (previous_x, previous_y) in self.previous_positions.items():
+            if not sprite.sprite_lists:
+                continue
+            x = sprite.center_x
+            y = sprite.center_y
+            current.append((sprite, x, y))
+            sprite.center_x = previous_x + (x - previous_x) * alpha
+            sprite.center_y = previous_y + (y - previous_y) * alpha
+        return current
+
+    def restore(self, current):
+        for sprite, x, y in current:
+            sprite.center_x = x
+            sprite.center_y = y
@@ -0,0 +1,137 @@
+# coding=utf-8
+import math
+
+'''
+    Platformer physics against the level's tile grid. Instead of testing the
+    player against every platform sprite, the engine looks up the handful of
+    grid cells the player's box covers in the level's layers_int_data, so its
+    cost doesn't depend on how many tiles the level has, or on which chunks
+    are streamed in.
+
+    Moves and resolves the same way as arcade.PhysicsEnginePlatformer does
+    against unrotated, full-tile sprites, so swapping one for the other
+    doesn't change how the game plays.
+'''
+
+# arcade's engine nudges a landing sprite up in steps this big until it is clear
+LANDING_STEP = 0.25
+# How far below its feet can_jump() looks for a floor
+FLOOR_PROBE = 2
+
+
+class TileGridPhysics:
+    """ Gravity, jumping and collisions for one sprite against the solid layers of a CompiledLevel """
+
+    def __init__(self, player_sprite, level, scaling, solid_layers=("Platforms", ), gravity_constant=0.5):
+        self.player_sprite = player_sprite
+        self.gravity_constant = gravity_constant
+        self.width = level.width
+        self.height = level.height
+        self.tile_size = level.tilewidth * scaling
+
+        self.solid_layers = solid_layers
+
+        # One byte per cell, row 0 is the bottom row of the map
+        self.solid = bytearray(self.width * self.height)
+        for layer_name in solid_layers:
+            self.add_layer(level.layers_int_data[layer_name])
+
+    def add_layer(self, int_grid):
+        """ Make every non-zero cell of a layers_int_data grid (rows listed from the top) solid. """
+        for row_from_top, row in enumerate(int_grid):
+            offset = (self.height - row_from_top - 1) * self.width
+            for col, tile_id in enumerate(row):
+                if tile_id:
+                    self.solid[offset + col] = 1
+
+    def patch_cells(self, level, cells):
+        """ Work out again whether each (col, row) cell is solid, from a new compilation of the level. """
+        for col, row in cells:
+            row_from_top = self.height - row - 1
+            self.set_solid(col, row, any(level.layers_int_data[layer_name][row_from_top][col]
+                                         for layer_name in self.solid_layers if layer_name in level.layers_int_data))
+
+    def set_solid(self, col, row, solid=True):
+        if 0 <= col < self.width and 0 <= row < self.height:
+            self.solid[row * self.width + col] = 1 if solid else 0
+
+    def hits(self, left, bottom, right, top):
+        """
+        Solid cells overlapping the box, as (col, row) with row 0 at the
+        bottom of the map. The rows are visited from the box's top down, so
+        the highest cells come first. Touching edges don't count, and
+        outside the map is empty.
+        """
+        if right <= left or top <= bottom:
+            return []
+        tile_size = self.tile_size
+        first_col = max(int(math.floor(left / tile_size)), 0)
+        last_col = min(int(math.ceil(right / tile_size)) - 1, self.width - 1)
+        first_row = max(int(math.floor(bottom / tile_size)), 0)
+        last_row = min(int(math.ceil(top / tile_size)) - 1, self.height - 1)
+        solid = self.solid
+        width = self.width
+        result = []
+        for row in range(last_row, first_row - 1, -1):
+            offset = row * width
+            for col in range(first_col, last_col + 1):
+                if solid[offset + col]:
+                    result.append((col, row))
+        return result
+
+    def sprite_hits(self, sprite):
+        return self.hits(sprite.left, sprite.bottom, sprite.right, sprite.top)
+
+    def can_jump(self):
+        """ True if there is a floor under the player_sprite. """
+        sprite = self.player_sprite
+        return len(self.hits(sprite.left, sprite.bottom - FLOOR_PROBE, sprite.right, sprite.top - FLOOR_PROBE)) > 0
+
+    def update(self):
+        """ Move the player_sprite and resolve collisions, y first and then x. """
+        sprite = self.player_sprite
+        tile_size = self.tile_size
+
+        # --- Add gravity
+        sprite.change_y -= self.gravity_constant
+
+        # --- Move in the y direction
+        sprite.center_y += sprite.change_y
+        hit_list = self.sprite_hits(sprite)
+        if hit_list:
+            if sprite.change_y > 0:
+                # Bumped a ceiling, stop at the lowest one
+                lowest = min(row for col, row in hit_list) * tile_size
+                sprite.top = min(lowest, sprite.top)
+            elif sprite.change_y < 0:
+                # Landed, lift out of the floor the way arcade does, in LANDING_STEPs
+                floor = max(row for col, row in hit_list) * tile_size + tile_size
+                overlap = floor - sprite.bottom
+                if overlap > 0:
+                    sprite.center_y += math.ceil(overlap / LANDING_STEP) * LANDING_STEP
+            sprite.change_y = 0.0
+        sprite.center_y = round(sprite.center_y, 2)
+
+        # --- Move in the x direction
+        sprite.center_x += sprite.change_x
+        check_again = True
+        while check_again:
+            check_again = False
+            hit_list = self.sprite_hits(sprite)
+            if not hit_list:
+                break
+            change_x = sprite.change_x
+            if change_x == 0:
+                break
+            for col, row in hit_list:
+                # See if we can "run up" a step
+                sprite.center_y += abs(change_x)
+                if self.sprite_hits(sprite):
+                    # Can't, so back off to the edge of the cell
+                    sprite.center_y -= abs(change_x)
+                    if change_x > 0:
+                        sprite.right = min(col * tile_size, sprite.right)
+                    else:
+                        sprite.left = max(col * tile_size + tile_size, sprite.left)
+                    check_again = True
+                    break